@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Imported once apps are loaded: flush buffered last_activity on shutdown
+from userapp.activity import flush_at_exit  # noqa: E402
+
+flush_at_exit()
@@ -54,7 +54,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'userapp.authentication.CachedJWTAuthentication',  # JWTAuthentication with cached token validation
         'rest_framework.authentication.TokenAuthentication',  # Add this line
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
@@ -115,6 +115,63 @@ DATABASES = {
     }
 }
 
+# Cache
+# OTP codes, OAuth state, rate-limit counters, presence and sessions live in
+# the cache, so with more than one worker process it must be shared:
+# CACHE_BACKEND = 'redis' (needs REDIS_URL; docker-compose runs it). The
+# default 'locmem' is per-process and only correct for a single worker, such
+# as runserver or the test suite; a second worker would not see the first
+# one's codes. Heartbeats, activity and session saves are kept in the cache so
+# the request path does not write to the database, which 'database' (run
+# `manage.py createcachetable`) and 'file' (workers on one host) give up:
+# use them only where redis is not an option.
+# OTP codes and OAuth state go to a separate 'auth' cache, so culling under
+# the high-volume keys (presence, activity, rate limits) never drops a code.
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/0')
+CACHE_DIR = config('CACHE_DIR', default=os.path.join(BASE_DIR, '.cache'))
+_CACHE_BACKENDS = {
+    'database': lambda name: {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache' if name == 'default' else f'django_cache_{name}',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'file': lambda name: {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_DIR, name),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'redis': lambda name: {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,  # Kept apart by KEY_PREFIX; compose's redis never evicts
+    },
+    'locmem': lambda name: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': name,
+        'OPTIONS': {'MAX_ENTRIES': 100000},  # Django's default of 300 would cull live codes
+    },
+}
+CACHES = {
+    'default': {**_CACHE_BACKENDS[CACHE_BACKEND]('default'), 'KEY_PREFIX': 'basta'},
+    'auth': {**_CACHE_BACKENDS[CACHE_BACKEND]('auth'), 'KEY_PREFIX': 'basta_auth'},
+}
+
+# Password hashing: PASSWORD_HASHER ('pbkdf2_sha256' or 'argon2') hashes new
+# passwords; the rest stay listed so existing hashes still verify and are
+# upgraded on the next login
+_PASSWORD_HASHERS = {
+    'pbkdf2_sha256': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',  # Needs argon2-cffi
+    'pbkdf2_sha1': 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'bcrypt_sha256': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+}
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='pbkdf2_sha256')
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+]
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', default=0, cast=int)  # Hashing processes for async auth views; 0 = one per core
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -177,7 +234,7 @@ TEMPLATES = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Session settings
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+SESSION_ENGINE = 'userapp.sessions'  # cached_db with throttled writes, see SESSION_WRITE_INTERVAL
 SESSION_COOKIE_AGE = 86400  # 24 hours in seconds
 SESSION_COOKIE_NAME = 'sessionid'
 
@@ -185,6 +242,7 @@ SESSION_COOKIE_SECURE = False
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
 SESSION_SAVE_EVERY_REQUEST = True
+SESSION_WRITE_INTERVAL = 5  # Minutes between writes of an unchanged session (expiry refresh)
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
@@ -274,6 +332,14 @@ FORTYTWO_CLIENT_ID = config('FORTYTWO_CLIENT_ID', default='u-s4t2ud-c027f46e7ffb
 FORTYTWO_CLIENT_SECRET = config('FORTYTWO_CLIENT_SECRET', default='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')
 FORTYTWO_REDIRECT_URI = config('FORTYTWO_REDIRECT_URI', default='https://localhost:443/home')
 
+# 42 API client (userapp/fortytwo.py)
+FORTYTWO_API_BASE_URL = config('FORTYTWO_API_BASE_URL', default='https://api.intra.42.fr')
+FORTYTWO_API_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+FORTYTWO_API_RETRIES = 2  # Bounded retries; POSTs are only retried on connection errors
+FORTYTWO_API_POOL_SIZE = 10  # Keep-alive connections kept per process
+FORTYTWO_CIRCUIT_FAILURES = 5  # Consecutive failures before failing fast
+FORTYTWO_CIRCUIT_RESET = 30  # Seconds before a trial request is let through again
+
 # Add this at the bottom of settings.py to ensure media files are served in development
 if DEBUG:
     STATICFILES_DIRS = [
@@ -293,3 +359,52 @@ if DEBUG:
 INACTIVE_USER_DELETE_MONTHS = 6  # Delete after 6 months of inactivity
 INACTIVE_USER_WARNING_MONTHS = 5  # Warn after 5 months of inactivity
 LAST_ACTIVITY_UPDATE_WINDOW = 15  # Only update last_activity after 15 minutes (in minutes)
+ACTIVITY_FLUSH_INTERVAL = 60  # Seconds between bulk writes of buffered last_activity timestamps
+ACTIVITY_BACKGROUND_FLUSH = True  # Flush from a thread in each web process (needed with a per-process cache)
+
+# GDPR data export
+EXPORT_CHUNK_SIZE = 2000  # Match rows fetched per database round trip while streaming an export
+EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')  # Background export archives; keep out of MEDIA_ROOT
+EXPORT_WORKERS = 2  # Export jobs built concurrently by run_export_jobs
+EXPORT_JOB_RETENTION_HOURS = 48  # Finished archives are deleted after this long
+
+# Friend suggestions
+FRIEND_SUGGESTIONS_CACHE_TTL = 600  # Seconds; also bounds staleness when a friend's own list changes
+
+# Presence
+PRESENCE_HEARTBEAT_INTERVAL = 20  # Seconds between client heartbeats
+PRESENCE_TTL = 60  # A user is shown offline this many seconds after their last heartbeat
+
+# Email outbox (drained by the send_queued_email worker)
+EMAIL_OUTBOX_BATCH_SIZE = 100  # Emails claimed and sent per batch over one SMTP connection
+EMAIL_OUTBOX_POLL_INTERVAL = 1.0  # Seconds the worker sleeps when the outbox is empty; bounds OTP delay
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5  # An email is marked FAILED after this many failed sends
+EMAIL_OUTBOX_KEEP_SENT = 24 * 60 * 60  # Seconds a sent email is kept before the worker deletes it
+
+# JWT verification cache
+JWT_CLAIMS_CACHE_SIZE = 4096  # Verified tokens remembered per process until they expire (0 disables)
+
+# Authentication rate limits (sliding window, checked before any password hashing)
+AUTH_RATE_LIMITS = {  # scope -> {'ip' | 'account': (max requests, window in seconds)}
+    'login': {'ip': (20, 60), 'account': (5, 60)},
+    'verify_otp': {'ip': (20, 60), 'account': (5, 300)},
+    'register': {'ip': (5, 3600)},
+}
+# Trust X-Forwarded-For only behind a proxy that sets it; defaults to on behind
+# the bundled nginx (SENDFILE_BACKEND=nginx), where REMOTE_ADDR is always nginx's
+AUTH_RATE_LIMIT_TRUST_X_FORWARDED_FOR = config(
+    'AUTH_RATE_LIMIT_TRUST_X_FORWARDED_FOR', default=config('SENDFILE_BACKEND', default='') == 'nginx', cast=bool
+)
+AUTH_RATE_LIMIT_TRUSTED_PROXIES = 1  # Proxies appending to X-Forwarded-For; the client is that many entries from the right
+
+# Avatars
+AVATAR_SIZES = (32, 64, 128, 256)  # Square thumbnails generated per upload, in WebP and JPEG
+AVATAR_MAX_UPLOAD_SIZE = 5 * 1024 * 1024  # Bytes; multipart uploads are cut off as soon as they exceed it
+AVATAR_MAX_PIXELS = 4096 * 4096  # Width x height; larger images are refused before they are decoded
+INTRA_AVATAR_REFRESH_INTERVAL = 24 * 60 * 60  # Seconds between checks of a 42 user's intra picture (on login)
+INTRA_AVATAR_WORKERS = 2  # Threads per process downloading 42 pictures after login
+INTRA_AVATAR_BACKGROUND = True  # Download off the request; False imports inline (tests)
+
+# File offload: Django authorizes and sets headers, the front proxy sends the bytes
+SENDFILE_BACKEND = config('SENDFILE_BACKEND', default='')  # '' (stream from Python), 'nginx' (X-Accel-Redirect) or 'xsendfile'
+SENDFILE_URL_PREFIX = '/protected-media/'  # nginx internal location aliased to MEDIA_ROOT
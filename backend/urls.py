@@ -4,11 +4,14 @@ from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from gameapp.views import index
+from userapp.sendfile import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('userapp.urls')),
     path('tournaments/', include('tournaments.urls')),
+    # Media in development, or offloaded to the proxy with SENDFILE_BACKEND
+    re_path(r'^media/(?P<path>.*)$', serve_media),
     # Keep your catch-all route at the end
     re_path(r'^.*$', index, name='index'),
 ]
@@ -16,4 +19,3 @@ urlpatterns = [
 # This is crucial for serving media files in development
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
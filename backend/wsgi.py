@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Imported once apps are loaded: flush buffered last_activity on shutdown
+from userapp.activity import flush_at_exit  # noqa: E402
+
+flush_at_exit()
@@ -11,6 +11,7 @@ echo "PostgreSQL started"
 # Run migrations
 python manage.py makemigrations
 python manage.py migrate
+python manage.py createcachetable  # Only does anything with CACHE_BACKEND=database
 
 # Start server with SSL certificates
 python manage.py runserver_plus --cert-file localhost.pem --key-file localhost-key.pem 0.0.0.0:443
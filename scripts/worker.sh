@@ -0,0 +1,17 @@
+#!/bin/bash
+# Background worker container: runs one long-lived management command,
+# e.g. `worker.sh send_queued_email`
+
+# Wait for database
+while ! nc -z db 5432; do
+    echo "Waiting for PostgreSQL..."
+    sleep 1
+done
+
+# The web container applies the migrations; don't start on an old schema
+until python manage.py migrate --check > /dev/null 2>&1; do
+    echo "Waiting for migrations..."
+    sleep 2
+done
+
+exec python manage.py "$@"
@@ -636,73 +636,69 @@ document.addEventListener('DOMContentLoaded', () => {
             const file = event.target.files[0];
             if (file) {
                 try {
-                    // First show preview
-                    const reader = new FileReader();
-                    reader.onload = async (e) => {
-                        // Set preview image
-                        const imagePreview = document.querySelector('.current-avatar');
-                        imagePreview.src = e.target.result;
+                    // First show preview (no need to read the file into a data URL)
+                    const imagePreview = document.querySelector('.current-avatar');
+                    imagePreview.src = URL.createObjectURL(file);
+                    
+                    // Now send to server
+                    const authToken = localStorage.getItem('authToken');
+                    if (!authToken) {
+                        throw new Error('Not authenticated');
+                    }
+                    
+                    // Send the file itself as multipart; the browser sets the boundary header
+                    const formData = new FormData();
+                    formData.append('avatar', file);
+                    const response = await fetch('/api/auth/profile/avatar/', {
+                        method: 'PUT',
+                        headers: {
+                            'Authorization': `Bearer ${authToken}`,
+                            'X-CSRFToken': getCookie('csrftoken')
+                        },
+                        body: formData
+                    });
+                    
+                    if (!response.ok) {
+                        const errorData = await response.json();
+                        throw new Error(errorData.message || 'Failed to update avatar');
+                    }
+                    
+                    const data = await response.json();
+                    
+                    // Update the avatar in all places - check for both field names
+                    const avatarPath = data.profile_picture || data.avatar;
+                    
+                    if (avatarPath) {
+                        // Update localStorage first: the avatar URL is keyed on avatar_version
+                        const userData = JSON.parse(localStorage.getItem('userData') || '{}');
+                        userData.profile_picture = avatarPath;
+                        userData.avatar_version = data.avatar_version;
+                        localStorage.setItem('userData', JSON.stringify(userData));
+
+                        const fixedUrl = fixImageUrl(avatarPath);
                         
-                        // Now send to server
-                        const authToken = localStorage.getItem('authToken');
-                        if (!authToken) {
-                            throw new Error('Not authenticated');
+                        // Update nav avatar if it exists
+                        const navAvatar = document.querySelector('.nav-avatar');
+                        if (navAvatar) {
+                            navAvatar.src = fixedUrl;
                         }
                         
-                        const response = await fetch('/api/auth/profile/', {
-                            method: 'PUT',
-                            headers: {
-                                'Authorization': `Bearer ${authToken}`,
-                                'Content-Type': 'application/json',
-                                'X-CSRFToken': getCookie('csrftoken')
-                            },
-                            body: JSON.stringify({
-                                profile_picture: e.target.result
-                            })
-                        });
-                        
-                        if (!response.ok) {
-                            const errorData = await response.json();
-                            throw new Error(errorData.message || 'Failed to update avatar');
+                        // Update profile avatar if on that page
+                        const profileAvatar = document.getElementById('profile-avatar');
+                        if (profileAvatar) {
+                            profileAvatar.src = fixedUrl;
                         }
                         
-                        const data = await response.json();
-                        
-                        // Update the avatar in all places - check for both field names
-                        const avatarPath = data.profile_picture || data.avatar;
-                        
-                        if (avatarPath) {
-                            const fixedUrl = fixImageUrl(avatarPath);
-                            
-                            // Update nav avatar if it exists
-                            const navAvatar = document.querySelector('.nav-avatar');
-                            if (navAvatar) {
-                                navAvatar.src = fixedUrl + '?t=' + new Date().getTime(); // Force reload
-                            }
-                            
-                            // Update profile avatar if on that page
-                            const profileAvatar = document.getElementById('profile-avatar');
-                            if (profileAvatar) {
-                                profileAvatar.src = fixedUrl + '?t=' + new Date().getTime(); // Force reload
-                            }
-                            
-                            // Update settings avatar if on that page
-                            const settingsAvatar = document.querySelector('.current-avatar');
-                            if (settingsAvatar) {
-                                settingsAvatar.src = fixedUrl + '?t=' + new Date().getTime(); // Force reload
-                            }
-                            
-                            // Update localStorage data with new avatar path
-                            const userData = JSON.parse(localStorage.getItem('userData') || '{}');
-                            userData.profile_picture = avatarPath;
-                            localStorage.setItem('userData', JSON.stringify(userData));
-                            
-                            alert('Avatar updated successfully!');
-                        } else {
-                            console.warn('No avatar path in response:', data);
+                        // Update settings avatar if on that page
+                        const settingsAvatar = document.querySelector('.current-avatar');
+                        if (settingsAvatar) {
+                            settingsAvatar.src = fixedUrl;
                         }
-                    };
-                    reader.readAsDataURL(file);
+                        
+                        alert('Avatar updated successfully!');
+                    } else {
+                        console.warn('No avatar path in response:', data);
+                    }
                 } catch (error) {
                     console.error('Error updating avatar:', error);
                     alert('Failed to update avatar: ' + error.message);
@@ -885,6 +881,7 @@ async function checkOAuthLogin() {
     // Get the authorization code from URL if present
     const urlParams = new URLSearchParams(window.location.search);
     const code = urlParams.get('code');
+    const state = urlParams.get('state');
 
     if (!code) {
         console.log("No OAuth code found in URL");
@@ -904,7 +901,7 @@ async function checkOAuthLogin() {
                 'X-CSRFToken': getCookie('csrftoken')
             },
             credentials: 'include',
-            body: JSON.stringify({ code: code }),
+            body: JSON.stringify({ code: code, state: state }),
         });
 
         if (!response.ok) {
@@ -1080,6 +1077,7 @@ async function loadProfileData() {
             const userData = JSON.parse(localStorage.getItem('userData') || '{}');
             if (data.avatar || data.profile_picture) {
                 userData.profile_picture = data.profile_picture || data.avatar;
+                userData.avatar_version = data.avatar_version;
                 localStorage.setItem('userData', JSON.stringify(userData));
                 
                 // Update all avatar instances
@@ -1373,8 +1371,12 @@ function fixImageUrl(url) {
         try {
             const userData = JSON.parse(localStorage.getItem('userData') || '{}');
             if (userData.id) {
-                // Use direct avatar endpoint with single timestamp
-                return `/api/auth/avatar/${userData.id}/?t=${new Date().getTime()}`;
+                // Use direct avatar endpoint (256px thumbnail); the version changes
+                // with every upload, so the browser may cache each URL for good
+                const version = userData.avatar_version
+                    ? `v=${userData.avatar_version}`
+                    : `t=${new Date().getTime()}`;
+                return `/api/auth/avatar/${userData.id}/?size=256&${version}`;
             }
         } catch (e) {
             console.error('Error parsing user data:', e);
@@ -1549,9 +1551,13 @@ function setupFriendsTabs() {
         });
     }
     
-    if (usersSearchInput) {
+    if (usersSearchInput && !usersSearchInput.dataset.bound) {
+        // Searched on the server, which only sends one page at a time
+        usersSearchInput.dataset.bound = 'true';
+        let searchTimer = null;
         usersSearchInput.addEventListener('input', (e) => {
-            filterUsersList(e.target.value.toLowerCase());
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => loadAllUsers(e.target.value.trim()), 300);
         });
     }
 }
@@ -1571,21 +1577,6 @@ function filterFriendsList(query) {
     });
 }
 
-function filterUsersList(query) {
-    const userItems = document.querySelectorAll('#users-list .friend-item');
-    
-    userItems.forEach(item => {
-        const name = item.querySelector('.friend-name').textContent.toLowerCase();
-        const username = item.querySelector('.friend-username').textContent.toLowerCase();
-        
-        if (name.includes(query) || username.includes(query)) {
-            item.style.display = 'flex';
-        } else {
-            item.style.display = 'none';
-        }
-    });
-}
-
 async function loadFriendsList() {
     try {
         const authToken = localStorage.getItem('authToken');
@@ -1622,6 +1613,7 @@ async function loadFriendsList() {
                 const friendItem = createFriendItem(friend, true);
                 friendsList.appendChild(friendItem);
             });
+            loadProfileCards(friendsList);
         } else {
             friendsList.innerHTML = '<div class="empty-state">Failed to load friends.</div>';
         }
@@ -1634,61 +1626,159 @@ async function loadFriendsList() {
     }
 }
 
-async function loadAllUsers() {
+// The users directory arrives 50 at a time; next_cursor fetches the next page
+const usersDirectory = { query: '', cursor: null, request: 0, observer: null };
+
+async function loadAllUsers(query) {
+    const authToken = localStorage.getItem('authToken');
+    if (!authToken) return;
+
+    const usersList = document.getElementById('users-list');
+    if (!usersList) return;
+
+    if (query !== undefined) usersDirectory.query = query;
+    usersDirectory.cursor = null;
+    usersDirectory.observer?.disconnect();
+
+    // Show loading indicator
+    usersList.innerHTML = '<div class="loading-indicator">Loading users...</div>';
+    await loadUsersPage(usersList);
+}
+
+async function loadUsersPage(usersList) {
+    const authToken = localStorage.getItem('authToken');
+    const first = !usersDirectory.cursor;
+    // A new search replaces the list; a page it overtook is dropped
+    const request = ++usersDirectory.request;
+
+    const params = new URLSearchParams();
+    if (usersDirectory.query) params.set('q', usersDirectory.query);
+    if (usersDirectory.cursor) params.set('cursor', usersDirectory.cursor);
+
     try {
-        const authToken = localStorage.getItem('authToken');
-        if (!authToken) return;
-        
-        const usersList = document.getElementById('users-list');
-        if (!usersList) return;
-        
-        // Show loading indicator
-        usersList.innerHTML = '<div class="loading-indicator">Loading users...</div>';
-        
-        const response = await fetch('/api/auth/users/', {
+        const response = await fetch(`/api/auth/users/?${params}`, {
             method: 'GET',
             headers: {
                 'Authorization': `Bearer ${authToken}`,
                 'Content-Type': 'application/json'
             }
         });
-        
-        if (response.ok) {
-            const data = await response.json();
-            const users = data.users;
-            
+        if (request !== usersDirectory.request) return;
+
+        if (!response.ok) {
+            usersPageFailed(usersList, first);
+            return;
+        }
+
+        const data = await response.json();
+        const users = data.users;
+
+        if (first) {
+            // Clear users list
+            usersList.innerHTML = '';
             if (users.length === 0) {
-                usersList.innerHTML = '<div class="empty-state">No users found.</div>';
+                usersList.innerHTML = usersDirectory.query
+                    ? '<div class="empty-state">No users match your search.</div>'
+                    : '<div class="empty-state">No users found.</div>';
                 return;
             }
-            
-            // Clear users list
-            usersList.innerHTML = '';
-            
-            // Add each user to the list
-            users.forEach(user => {
-                const userItem = createFriendItem(user, user.is_friend);
-                usersList.appendChild(userItem);
-            });
-        } else {
-            usersList.innerHTML = '<div class="empty-state">Failed to load users.</div>';
+        }
+
+        // Add each user to the list
+        usersList.querySelector('.load-more')?.remove();
+        const items = users.map(user => createFriendItem(user, user.is_friend));
+        items.forEach(item => usersList.appendChild(item));
+        loadProfileCards(usersList, items);
+
+        usersDirectory.cursor = data.next_cursor;
+        if (usersDirectory.cursor) {
+            appendLoadMore(usersList);
         }
     } catch (error) {
         console.error('Error loading users list:', error);
-        const usersList = document.getElementById('users-list');
-        if (usersList) {
-            usersList.innerHTML = '<div class="empty-state">Failed to load users.</div>';
+        if (request === usersDirectory.request) usersPageFailed(usersList, first);
+    }
+}
+
+function usersPageFailed(usersList, first) {
+    if (first) {
+        usersList.innerHTML = '<div class="empty-state">Failed to load users.</div>';
+        return;
+    }
+    // Let the user retry the page
+    const button = usersList.querySelector('.load-more');
+    if (button) {
+        button.disabled = false;
+        button.textContent = 'Load more';
+    }
+}
+
+// "Load more" at the end of the list; also clicked for the user when it scrolls into view
+function appendLoadMore(usersList) {
+    const button = document.createElement('button');
+    button.className = 'friend-action load-more';
+    button.textContent = 'Load more';
+    button.onclick = () => {
+        button.disabled = true;
+        button.textContent = 'Loading...';
+        loadUsersPage(usersList);
+    };
+    usersList.appendChild(button);
+
+    if ('IntersectionObserver' in window) {
+        usersDirectory.observer?.disconnect();
+        usersDirectory.observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting) && !button.disabled) {
+                usersDirectory.observer.disconnect();
+                button.click();
+            }
+        }, { root: usersList });
+        usersDirectory.observer.observe(button);
+    }
+}
+
+// Add avatars to a rendered friends/users list: one batch request for the cards,
+// then versioned thumbnail URLs the browser caches and loads in parallel
+async function loadProfileCards(list, items = Array.from(list.querySelectorAll('.friend-item'))) {
+    const authToken = localStorage.getItem('authToken');
+    if (!authToken || items.length === 0) return;
+
+    const BATCH = 100; // Server-side limit on ids per request
+    for (let i = 0; i < items.length; i += BATCH) {
+        const batch = items.slice(i, i + BATCH);
+        const ids = batch.map(item => item.dataset.userId).join(',');
+        try {
+            const response = await fetch(`/api/auth/profile-cards/?size=64&ids=${ids}`, {
+                headers: { 'Authorization': `Bearer ${authToken}` }
+            });
+            if (!response.ok) continue;
+            const data = await response.json();
+            const cards = new Map(data.cards.map(card => [String(card.id), card]));
+
+            batch.forEach(item => {
+                const card = cards.get(item.dataset.userId);
+                if (!card || item.querySelector('.friend-avatar')) return;
+                const avatar = document.createElement('img');
+                avatar.className = 'friend-avatar';
+                avatar.src = card.avatar;
+                avatar.alt = '';
+                avatar.loading = 'lazy';
+                avatar.width = avatar.height = 40;
+                item.classList.toggle('online', card.online);
+                item.prepend(avatar);
+            });
+        } catch (error) {
+            console.error('Error loading profile cards:', error);
         }
     }
 }
 
-// Update the createFriendItem function to remove the avatar
 function createFriendItem(user, isFriend) {
     const item = document.createElement('div');
     item.className = 'friend-item';
     item.dataset.userId = user.id;
     
-    // Remove avatar creation and insertion code
+    // The avatar is added afterwards by loadProfileCards()
     
     const info = document.createElement('div');
     info.className = 'friend-info';
@@ -1703,13 +1793,21 @@ function createFriendItem(user, isFriend) {
     
     info.appendChild(name);
     info.appendChild(username);
+
+    // Friends carry a presence status from the heartbeat service
+    if (user.status) {
+        const presence = document.createElement('div');
+        presence.className = `friend-status ${user.status}`;
+        presence.textContent = user.status === 'in_game' ? 'In game' : (user.status === 'online' ? 'Online' : 'Offline');
+        info.appendChild(presence);
+    }
     
     const button = document.createElement('button');
     button.className = isFriend ? 'friend-action remove' : 'friend-action';
     button.textContent = isFriend ? 'Remove' : 'Add';
     button.onclick = () => isFriend ? removeFriend(user.id) : addFriend(user.id);
     
-    // Only append info and button (no avatar)
+    // Append info and button (avatar comes from loadProfileCards)
     item.appendChild(info);
     item.appendChild(button);
     
@@ -1914,5 +2012,23 @@ function createWinratePieChart(wins, total) {
     container.appendChild(svg);
 }
 
+// Presence heartbeat so friends can see who is online or in a game
+const PRESENCE_HEARTBEAT_MS = 20000;
 
+function sendPresenceHeartbeat() {
+    const authToken = localStorage.getItem('authToken');
+    if (!authToken || localStorage.getItem('isLoggedIn') !== 'true') return;
+
+    const inGame = ['game', 'tictactoe'].includes(currentPage);
+    fetch('/api/auth/presence/heartbeat/', {
+        method: 'POST',
+        headers: {
+            'Authorization': `Bearer ${authToken}`,
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ status: inGame ? 'in_game' : 'online' })
+    }).catch(error => console.error('Presence heartbeat failed:', error));
+}
 
+window.addEventListener('load', sendPresenceHeartbeat);
+setInterval(sendPresenceHeartbeat, PRESENCE_HEARTBEAT_MS);
@@ -0,0 +1,205 @@
+# userapp/activity.py
+"""Write-behind buffer for User.last_activity.
+
+The request path only touches the cache: the first request a user makes in
+each LAST_ACTIVITY_UPDATE_WINDOW appends (user_id, timestamp) to a log of
+numbered cache entries. flush_activity() later folds the log into a single
+bulk UPDATE. It is called by a per-process background thread, by the
+flush_user_activity command and by delete_inactive_users before it reads
+last_activity.
+
+Each process appends to a log slot of its own, claimed with cache.add()
+(atomic on every backend but the file one) and held while the process keeps
+writing, so entries are numbered without a shared counter: cache.incr() is a
+read-modify-write on the db and file backends. Only the owner of a slot
+advances its head, and only the flusher (under FLUSH_LOCK_KEY) its flushed
+mark. Slots are claimed lowest first, so the flusher finds them all by
+counting up from 0.
+
+The WSGI and ASGI entry points call flush_at_exit(), so a web process also
+flushes its buffer when it shuts down.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+FLUSH_LOCK_KEY = 'activity_flush_lock'
+ENTRY_TTL = 24 * 60 * 60
+SLOT_LEASE = 60 * 60  # An idle process gives up its slot after this long
+
+
+def _owner_key(slot):
+    return f"activity_slot_{slot}"
+
+
+def _head_key(slot):
+    return f"activity_head_{slot}"
+
+
+def _flushed_key(slot):
+    return f"activity_flushed_{slot}"
+
+
+def _entry_key(slot, seq):
+    return f"activity_entry_{slot}_{seq}"
+
+
+def _seen_key(user_id):
+    return f"activity_seen_{user_id}"
+
+
+_slot_lock = threading.Lock()
+_slot = None  # {'pid', 'slot', 'token', 'head'} of this process's log
+
+
+def _claim_slot():
+    token = uuid.uuid4().hex
+    slot = 0
+    while not cache.add(_owner_key(slot), token, timeout=SLOT_LEASE):
+        slot += 1
+    # A slot that was used before continues its numbering
+    cache.add(_head_key(slot), 0, timeout=None)
+    return {'pid': os.getpid(), 'slot': slot, 'token': token, 'head': cache.get(_head_key(slot), 0)}
+
+
+def _append(entry):
+    global _slot
+    with _slot_lock:
+        if _slot is None or _slot['pid'] != os.getpid() or cache.get(_owner_key(_slot['slot'])) != _slot['token']:
+            # First write, a forked child, or the lease ran out while idle
+            _slot = _claim_slot()
+        else:
+            cache.touch(_owner_key(_slot['slot']), SLOT_LEASE)
+        seq = _slot['head'] + 1
+        cache.set(_entry_key(_slot['slot'], seq), entry, timeout=ENTRY_TTL)
+        # Advanced only once the entry is there, so the flusher never skips one
+        cache.set(_head_key(_slot['slot']), seq, timeout=None)
+        _slot['head'] = seq
+
+
+def record_activity(user_id, when=None):
+    """Buffer a user's activity; at most one entry per user per update window"""
+    window = getattr(settings, 'LAST_ACTIVITY_UPDATE_WINDOW', 15) * 60
+    if not cache.add(_seen_key(user_id), 1, timeout=window):
+        return False
+
+    when = when or timezone.now()
+    _append((user_id, when.timestamp()))
+    _ensure_flusher()
+    return True
+
+
+def _slots():
+    slot = 0
+    while cache.get_many([_owner_key(slot), _head_key(slot)]):
+        yield slot
+        slot += 1
+
+
+def flush_activity(batch_size=1000):
+    """Write buffered timestamps to the database; returns the number of users updated"""
+    if not cache.add(FLUSH_LOCK_KEY, os.getpid(), timeout=300):
+        return 0
+    try:
+        updated = 0
+        for slot in _slots():
+            start = cache.get(_flushed_key(slot), 0)
+            end = cache.get(_head_key(slot), 0)
+            for chunk_start in range(start + 1, end + 1, batch_size):
+                seqs = range(chunk_start, min(chunk_start + batch_size, end + 1))
+                entries = cache.get_many([_entry_key(slot, seq) for seq in seqs])
+
+                latest = {}
+                for user_id, ts in entries.values():
+                    latest[user_id] = max(ts, latest.get(user_id, ts))
+                if latest:
+                    updated += _bulk_update(latest)
+
+                cache.set(_flushed_key(slot), seqs[-1], timeout=None)
+                cache.delete_many(list(entries))
+        return updated
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def _bulk_update(latest):
+    """One UPDATE for many users, never moving last_activity backwards"""
+    rows = [
+        (user_id, datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+        for user_id, ts in latest.items()
+    ]
+    if connection.vendor == 'postgresql':
+        table = connection.ops.quote_name(User._meta.db_table)
+        values = ', '.join(['(%s::bigint, %s::timestamptz)'] * len(rows))
+        params = [value for row in rows for value in row]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} AS u SET last_activity = v.ts "
+                f"FROM (VALUES {values}) AS v(id, ts) "
+                f"WHERE u.id = v.id AND u.last_activity < v.ts",
+                params
+            )
+            return cursor.rowcount
+
+    return User.objects.filter(id__in=latest).update(
+        last_activity=Greatest(
+            F('last_activity'),
+            Case(*[When(id=user_id, then=Value(when)) for user_id, when in rows])
+        )
+    )
+
+
+_flusher_lock = threading.Lock()
+_flusher_pid = None
+_flush_at_exit = False
+
+
+def flush_at_exit():
+    """Also flush when the process exits; for serving processes only"""
+    global _flush_at_exit
+    _flush_at_exit = True
+
+
+def _ensure_flusher():
+    """Start this process's background flush thread (once per pid, so forks get their own)"""
+    global _flusher_pid
+    if not getattr(settings, 'ACTIVITY_BACKGROUND_FLUSH', True) or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name='activity-flusher', daemon=True).start()
+        if _flush_at_exit:
+            atexit.register(_flush_quietly)
+
+
+def _flush_loop():
+    interval = getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 60)
+    while True:
+        time.sleep(interval)
+        _flush_quietly()
+
+
+def _flush_quietly():
+    try:
+        flush_activity()
+    except Exception as e:
+        logger.error(f"Failed to flush user activity: {str(e)}")
+    finally:
+        connection.close()
@@ -0,0 +1,56 @@
+# userapp/auth_state.py
+"""Short-lived login secrets kept in the shared cache: 2FA codes and OAuth state.
+
+Every helper goes through the 'auth' cache, which must be shared by all
+workers (see CACHES in settings), so a code issued by one worker can be
+checked by any other. It is kept apart from the default cache, where the
+presence and rate-limit keys could push a live code out. Verification
+consumes the secret with cache.delete(), whose return value tells exactly
+one of several concurrent requests that it removed the entry, so a code or
+state value can never be used twice.
+"""
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+from django.utils.crypto import constant_time_compare
+
+OTP_TTL = 300
+
+cache = ConnectionProxy(caches, 'auth')
+
+
+def _otp_key(user_id):
+    return f"otp_{user_id}"
+
+
+def _state_key(state):
+    return f"oauth_state_{state}"
+
+
+def issue_otp(user_id):
+    """Create (or replace) the user's 6-digit login code"""
+    otp = f"{secrets.randbelow(10 ** 6):06d}"
+    cache.set(_otp_key(user_id), otp, timeout=OTP_TTL)
+    return otp
+
+
+def consume_otp(user_id, otp):
+    """True, once, if `otp` is the user's current code"""
+    expected = cache.get(_otp_key(user_id))
+    if not expected or not constant_time_compare(str(expected), str(otp)):
+        return False
+    return bool(cache.delete(_otp_key(user_id)))
+
+
+def issue_oauth_state():
+    """Random value to round-trip through the 42 authorize redirect"""
+    state = secrets.token_urlsafe(32)
+    cache.set(_state_key(state), 1, timeout=settings.JWT_SETTINGS.get('STATE_TTL', 600))
+    return state
+
+
+def consume_oauth_state(state):
+    """True, once, for a state issued by issue_oauth_state() that has not expired"""
+    return bool(state) and bool(cache.delete(_state_key(state)))
@@ -0,0 +1,61 @@
+# userapp/authentication.py
+"""DRF authentication classes that skip repeated JWT verification.
+
+A validated access token is remembered (see utils.VerifiedTokenCache) until
+it expires, so a client polling with the same bearer token pays for the
+signature check and claim decoding once. CachedJWTAuthentication still loads
+the User row for views that need the model; ClaimsJWTAuthentication returns a
+ClaimsUser built from the token alone, for hot endpoints that only need the
+caller's id and username and should not touch the database at all.
+"""
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .utils import VerifiedTokenCache
+
+validated_token_cache = VerifiedTokenCache(getattr(settings, 'JWT_CLAIMS_CACHE_SIZE', 4096))
+
+
+def tokens_for_user(user):
+    """RefreshToken for `user`; the username claim is copied into its access tokens"""
+    refresh = RefreshToken.for_user(user)
+    refresh['username'] = user.username
+    return refresh
+
+
+class ClaimsUser(TokenUser):
+    """request.user for claims-only views: id and username, no database row"""
+
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @property
+    def user_id(self):
+        return self.id
+
+
+class CachedValidationMixin:
+    def get_validated_token(self, raw_token):
+        token = validated_token_cache.get(raw_token)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            validated_token_cache.set(raw_token, token, token['exp'])
+        return token
+
+
+class CachedJWTAuthentication(CachedValidationMixin, JWTAuthentication):
+    """JWTAuthentication with cached token validation; still loads the User"""
+
+
+class ClaimsJWTAuthentication(CachedValidationMixin, JWTStatelessUserAuthentication):
+    """Cached validation and a ClaimsUser instead of a User query"""
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
@@ -0,0 +1,361 @@
+# userapp/avatars.py
+"""Avatar thumbnails.
+
+When an avatar is uploaded, generate_thumbnails() renders square crops at
+each of AVATAR_SIZES in WebP and JPEG (and AVIF when Pillow can encode it)
+next to the original. get_avatar_image then serves the smallest rendition
+that covers the requested ?size=, in the best format the client Accepts,
+instead of the full-size upload.
+Avatars that predate this are thumbnailed on first request.
+
+Responses are cacheable: every upload is fingerprinted with SHA-256
+(User.avatar_hash), and avatar_meta() keeps the fingerprint and file name
+in the shared cache so conditional requests can be answered with a 304
+without touching the database or the file. The bundled default avatar and
+its renditions are held in memory.
+
+Storage is content-addressed: store_avatar() files an upload under its
+SHA-256 (profile_pictures/sha256/ab/<hash>.<ext>) and thumbnails under
+the same hash, so identical images are stored once and a stored file never
+changes. The extension comes from the bytes' own signature, and nothing is
+stored before Pillow has accepted them as an image. Replaced files are left in place for the delete_orphaned_media
+command, since another user may point at the same file. Deleting a user
+removes theirs at once (see userapp.signals) unless someone else shares it.
+"""
+import hashlib
+import io
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+from rest_framework.renderers import BaseRenderer
+
+from .models import User
+from .uploads import SNIFF_BYTES, sniff_image
+
+AVATAR_ROOT = 'profile_pictures/sha256'
+THUMBNAIL_ROOT = 'profile_pictures/thumbs'
+
+# format -> (Pillow format, content type, save options); preference order
+AVATAR_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+if features.check('avif'):
+    # Pillow >= 11.3 built with libavif; smaller still than WebP
+    AVATAR_FORMATS = {'avif': ('AVIF', 'image/avif', {'quality': 60}), **AVATAR_FORMATS}
+DEFAULT_FORMAT = 'jpeg'
+
+DEFAULT_AVATAR_PATH = os.path.join(settings.BASE_DIR, 'static', 'frontend', 'assets', 'man.png')
+
+META_TTL = 24 * 60 * 60
+VERSION_LENGTH = 16
+
+_default_renditions = {}
+_default_digest = None
+_default_lock = threading.Lock()
+
+
+class InvalidImage(ValueError):
+    """Raised by store_avatar() for content that is not a PNG/JPEG/GIF/WebP image"""
+
+
+class ImageRenderer(BaseRenderer):
+    """Lets DRF accept image Accept headers; the view returns the bytes itself"""
+    media_type = 'image/*'
+    format = 'image'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''
+
+
+def avatar_sizes():
+    return tuple(sorted(getattr(settings, 'AVATAR_SIZES', (32, 64, 128, 256))))
+
+
+def pick_size(requested):
+    """Smallest generated size that covers `requested` (the largest if none does)"""
+    sizes = avatar_sizes()
+    for size in sizes:
+        if size >= requested:
+            return size
+    return sizes[-1]
+
+
+def negotiate_format(accept):
+    """Best AVATAR_FORMATS entry the Accept header allows (JPEG works everywhere)"""
+    accepted = {}
+    for part in (accept or '').split(','):
+        media_type, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[media_type.strip().lower()] = quality
+
+    for name, (_, content_type, _) in AVATAR_FORMATS.items():
+        # Only explicit support counts: "*/*" from an old browser is no promise of WebP
+        if accepted.get(content_type, 0) > 0:
+            return name
+    return DEFAULT_FORMAT
+
+
+def avatar_name(digest, extension):
+    """Content-addressed storage name of an upload"""
+    return f"{AVATAR_ROOT}/{digest[:2]}/{digest}.{extension}"
+
+
+def thumbnail_name(digest, size, fmt):
+    """Storage name of one rendition of the image with this SHA-256"""
+    return f"{THUMBNAIL_ROOT}/{digest[:2]}/{digest}/{size}.{fmt}"
+
+
+def _touch(name):
+    # A reused file counts as new for the orphan GC's grace period
+    try:
+        os.utime(default_storage.path(name))
+    except (NotImplementedError, OSError):
+        pass
+
+
+def _save_once(name, content):
+    """Store `content` under exactly `name`, unless the same content is already there"""
+    if default_storage.exists(name):
+        _touch(name)
+        return
+    saved = default_storage.save(name, content)
+    if saved != name:
+        # An identical upload won the race; storage renamed ours
+        default_storage.delete(saved)
+
+
+def _render(image, size, fmt):
+    pil_format, _, options = AVATAR_FORMATS[fmt]
+    thumb = ImageOps.fit(image, (size, size), method=Image.Resampling.LANCZOS)
+    if pil_format == 'JPEG' and thumb.mode != 'RGB':
+        background = Image.new('RGB', thumb.size, (255, 255, 255))
+        background.paste(thumb, mask=thumb.getchannel('A') if 'A' in thumb.getbands() else None)
+        thumb = background
+    buffer = io.BytesIO()
+    thumb.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def max_pixels():
+    return getattr(settings, 'AVATAR_MAX_PIXELS', 4096 * 4096)
+
+
+def open_image(source):
+    """Image.open(), refusing images too large to decode for a thumbnail.
+
+    Only the header has been read at this point; the byte cap on uploads
+    says nothing about the size of a well-compressed PNG once decoded.
+    """
+    image = Image.open(source)
+    width, height = image.size
+    if width * height > max_pixels():
+        image.close()
+        raise InvalidImage(f"Image is larger than {max_pixels()} pixels")
+    return image
+
+
+def _prepare(image):
+    image = ImageOps.exif_transpose(image)
+    return image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+
+
+def generate_thumbnails(digest, picture_name):
+    """Build whichever renditions of an upload are missing"""
+    missing = [
+        (size, fmt) for size in avatar_sizes() for fmt in AVATAR_FORMATS
+        if not default_storage.exists(thumbnail_name(digest, size, fmt))
+    ]
+    if not missing:
+        return
+    with default_storage.open(picture_name, 'rb') as source, open_image(source) as image:
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale, as long as the largest rendition is covered
+        largest = avatar_sizes()[-1]
+        image.draft(None, (largest, largest))
+        image = _prepare(image)
+        for size, fmt in missing:
+            _save_once(thumbnail_name(digest, size, fmt), ContentFile(_render(image, size, fmt)))
+
+
+def get_thumbnail(digest, picture_name, size, fmt):
+    """Storage name of the rendition to serve, generating renditions if missing"""
+    name = thumbnail_name(digest, size, fmt)
+    if not default_storage.exists(name):
+        generate_thumbnails(digest, picture_name)
+    return name
+
+
+def default_avatar(size=None, fmt=None):
+    """(bytes, content type) of the bundled avatar, or of one of its renditions.
+
+    Rendered once per process and kept in memory; raises FileNotFoundError
+    if the image is missing from the checkout.
+    """
+    key = (size, fmt)
+    if key not in _default_renditions:
+        with _default_lock:
+            if key not in _default_renditions:
+                if size is None:
+                    with open(DEFAULT_AVATAR_PATH, 'rb') as source:
+                        _default_renditions[key] = (source.read(), 'image/png')
+                else:
+                    original, _ = default_avatar()
+                    with Image.open(io.BytesIO(original)) as image:
+                        data = _render(_prepare(image), size, fmt)
+                    _default_renditions[key] = (data, AVATAR_FORMATS[fmt][1])
+    return _default_renditions[key]
+
+
+def file_digest(source):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(64 * 1024), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _meta_key(user_id):
+    return f"avatar_meta_{user_id}"
+
+
+def default_avatar_digest():
+    global _default_digest
+    if _default_digest is None:
+        data, _ = default_avatar()
+        _default_digest = hashlib.sha256(data).hexdigest()
+    return _default_digest
+
+
+def _default_meta():
+    return {
+        'name': None,
+        'hash': default_avatar_digest(),
+        'modified': int(os.path.getmtime(DEFAULT_AVATAR_PATH)),
+    }
+
+
+def _build_meta(user_id, name, digest, updated_at):
+    if not name or not default_storage.exists(name):
+        return _default_meta()
+    if not digest or updated_at is None:
+        # Uploaded before fingerprinting: hash it once and remember it
+        with default_storage.open(name, 'rb') as source:
+            digest = file_digest(source)
+        updated_at = default_storage.get_modified_time(name)
+        User.objects.filter(pk=user_id).update(avatar_hash=digest, avatar_updated_at=updated_at)
+    return {'name': name, 'hash': digest, 'modified': int(updated_at.timestamp())}
+
+
+def avatar_meta(user_id):
+    """What get_avatar_image needs to answer for a user, or None if there is no such user.
+
+    {'name': storage name of the upload (None means the default avatar),
+     'hash': SHA-256 of the image, 'modified': Unix time of the upload}
+    """
+    meta = cache.get(_meta_key(user_id))
+    if meta is None:
+        row = (
+            User.objects.filter(pk=user_id)
+            .values_list('profile_picture', 'avatar_hash', 'avatar_updated_at')
+            .first()
+        )
+        if row is None:
+            return None
+        meta = _build_meta(user_id, *row)
+        cache.set(_meta_key(user_id), meta, timeout=META_TTL)
+    return meta
+
+
+def forget_avatar_meta(user_id):
+    cache.delete(_meta_key(user_id))
+
+
+def delete_unreferenced_avatar(name, digest):
+    """Delete an upload and its renditions, unless another user still points at them"""
+    if name and not User.objects.filter(profile_picture=name).exists():
+        default_storage.delete(name)
+    if digest and not User.objects.filter(avatar_hash=digest).exists():
+        for size in avatar_sizes():
+            for fmt in AVATAR_FORMATS:
+                default_storage.delete(thumbnail_name(digest, size, fmt))
+
+
+def avatar_version(user_id):
+    """Short fingerprint for ?v= in avatar URLs; changes whenever the image does"""
+    meta = avatar_meta(user_id)
+    return meta['hash'][:VERSION_LENGTH] if meta else None
+
+
+def avatar_url(user_id, size, picture_name, digest):
+    """Thumbnail URL for a users row, without another query.
+
+    Versioned (so served as immutable) whenever the image's hash is known:
+    always for the default avatar, and for uploads fingerprinted since
+    avatar_hash was added.
+    """
+    url = f"{reverse('get-avatar', args=[user_id])}?size={size}"
+    if not picture_name:
+        digest = default_avatar_digest()
+    if digest:
+        url += f"&v={digest[:VERSION_LENGTH]}"
+    return url
+
+
+def check_image(content):
+    """File extension for `content` (a File) from its signature; raises InvalidImage.
+
+    The client's file name or data URL type is never trusted: it would decide
+    the extension, and so the content type /media/ serves the file with.
+    """
+    content.seek(0)
+    extension = sniff_image(content.read(SNIFF_BYTES))
+    if extension is None:
+        raise InvalidImage('Unsupported image format')
+    content.seek(0)
+    try:
+        with open_image(content) as image:
+            image.verify()
+    except InvalidImage:
+        raise
+    except Exception as e:
+        raise InvalidImage('Invalid image') from e
+    content.seek(0)
+    return extension
+
+
+def store_avatar(user, content):
+    """Make `content` (a File) the user's avatar, storing it only if it is new.
+
+    Raises InvalidImage, leaving the user untouched, unless `content` is an
+    image the thumbnails can be rendered from.
+    """
+    extension = check_image(content)
+    digest = file_digest(content)
+    content.seek(0)
+    name = avatar_name(digest, extension)
+    _save_once(name, content)
+    try:
+        generate_thumbnails(digest, name)
+    except Exception as e:
+        # Left for delete_orphaned_media: nothing points at it
+        raise InvalidImage('Invalid image') from e
+
+    user.profile_picture.name = name
+    user.avatar_hash = digest
+    user.avatar_updated_at = timezone.now()
+    user.save(update_fields=['profile_picture', 'avatar_hash', 'avatar_updated_at'])
+    forget_avatar_meta(user.id)
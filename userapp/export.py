@@ -0,0 +1,215 @@
+# userapp/export.py
+"""Streaming serializers for the GDPR data export.
+
+Match history is read with QuerySet.iterator() and written out one row at a
+time, so memory use does not grow with the number of matches a user has.
+The same generators feed both the synchronous export_user_data view and the
+.tar.gz archives built by the run_export_jobs worker.
+"""
+import csv
+import datetime
+import json
+import os
+import tarfile
+import tempfile
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+from .models import MatchHistory, ExportJob
+
+EXPORT_MATCH_FIELDS = (
+    'id', 'game_type', 'opponent', 'score', 'user_score', 'opponent_score',
+    'margin', 'result', 'date_played',
+)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Lets DRF accept ?format=ndjson; the view streams the body itself"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
+
+
+class CSVRenderer(BaseRenderer):
+    """Lets DRF accept ?format=csv; the view streams the body itself"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
+
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+    def write(self, value):
+        return value
+
+
+def iter_matches(user):
+    """Yield the user's matches as plain dicts, newest first, in DB-sized chunks"""
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    rows = (
+        MatchHistory.objects.filter(user=user)
+        .order_by('-date_played', '-id')  # Same order as match_user_date_id_desc_idx
+        .values(*EXPORT_MATCH_FIELDS)
+    )
+    for row in rows.iterator(chunk_size=chunk_size):
+        row['date_played'] = row['date_played'].isoformat()
+        yield row
+
+
+def build_user_header(user):
+    """Everything in the export except the match list"""
+    matches = MatchHistory.objects.filter(user=user)
+    counts = matches.aggregate(
+        total=Count('id'),
+        wins=Count('id', filter=Q(result='WIN')),
+        losses=Count('id', filter=Q(result='LOSS')),
+        draws=Count('id', filter=Q(result='DRAW')),
+    )
+    total_matches = counts['total']
+    win_rate = int((counts['wins'] / total_matches) * 100) if total_matches > 0 else 0
+    best_win = matches.best_win()
+    average_margin = matches.average_margin()
+
+    return {
+        'user_information': {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'display_name': user.display_name if hasattr(user, 'display_name') else user.username,
+            'date_joined': user.date_joined.isoformat(),
+            'last_login': user.last_login.isoformat() if user.last_login else None,
+            'is_42_user': user.is_42_user if hasattr(user, 'is_42_user') else False,
+        },
+        'profile': {
+            'avatar_url': user.profile_picture.url if user.profile_picture else None,
+        },
+        'statistics': {
+            'games_played': total_matches,
+            'wins': counts['wins'],
+            'losses': counts['losses'],
+            'draws': counts['draws'],
+            'win_rate': f"{win_rate}%",
+            'best_win': best_win.score if best_win else None,
+            'average_margin': round(average_margin, 2) if average_margin is not None else None,
+            'score_histogram': list(matches.score_histogram()),
+        },
+    }
+
+
+def iter_json_export(user):
+    """Encode the export document incrementally.
+
+    The header is emitted first, then the match_history array one element at
+    a time, producing the same document the non-streaming view used to build.
+    """
+    header = build_user_header(user)
+    yield json.dumps(header)[:-1] + ', "match_history": ['
+    for index, row in enumerate(iter_matches(user)):
+        yield (', ' if index else '') + json.dumps(row)
+    yield '], "export_date": ' + json.dumps(datetime.datetime.now().isoformat()) + '}'
+
+
+def iter_ndjson_export(user):
+    """One JSON object per line, one line per match"""
+    for row in iter_matches(user):
+        yield json.dumps(row) + '\n'
+
+
+def iter_csv_export(user):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_MATCH_FIELDS)
+    for row in iter_matches(user):
+        yield writer.writerow([row[field] for field in EXPORT_MATCH_FIELDS])
+
+
+EXPORT_FORMATS = {
+    'json': (iter_json_export, 'application/json'),
+    'ndjson': (iter_ndjson_export, 'application/x-ndjson'),
+    'csv': (iter_csv_export, 'text/csv'),
+}
+
+
+def _add_stream_to_tar(tar, arcname, chunks):
+    """Spool an iterator of str chunks to a temp file, then copy it into the tar"""
+    with tempfile.TemporaryFile() as spool:
+        for chunk in chunks:
+            spool.write(chunk.encode())
+        info = tarfile.TarInfo(arcname)
+        info.size = spool.tell()
+        info.mtime = int(timezone.now().timestamp())
+        spool.seek(0)
+        tar.addfile(info, spool)
+
+
+def build_export_archive(user, path):
+    """Write a .tar.gz with the JSON export, the match history CSV and the avatar"""
+    with tarfile.open(path, 'w:gz') as tar:
+        _add_stream_to_tar(tar, 'user_data.json', iter_json_export(user))
+        _add_stream_to_tar(tar, 'match_history.csv', iter_csv_export(user))
+        if user.profile_picture:
+            try:
+                avatar_path = user.profile_picture.path
+            except (NotImplementedError, ValueError):
+                avatar_path = None
+            if avatar_path and os.path.exists(avatar_path):
+                tar.add(avatar_path, arcname=f"avatar/{os.path.basename(avatar_path)}")
+
+
+def _owned(job):
+    """The job's row, locked, if `job` is still its latest claim (call in a transaction)"""
+    return (
+        ExportJob.objects.select_for_update()
+        .filter(pk=job.pk, status=ExportJob.RUNNING, attempts=job.attempts)
+        .first()
+    )
+
+
+def run_export_job(job):
+    """Build the archive for a claimed (RUNNING) job and record the outcome.
+
+    Returns False, leaving the job alone, if it was reclaimed while this
+    attempt ran: the new claim owns the archive name and the outcome.
+    """
+    export_root = settings.EXPORT_ROOT
+    os.makedirs(export_root, exist_ok=True)
+    archive_name = f"{job.id}.tar.gz"
+    final_path = os.path.join(export_root, archive_name)
+    # Per attempt, so a reclaimed job's two workers never write the same file
+    partial_path = f"{final_path}.{job.attempts}.part"
+
+    try:
+        build_export_archive(job.user, partial_path)
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        ExportJob.objects.filter(pk=job.pk, status=ExportJob.RUNNING, attempts=job.attempts).update(
+            status=ExportJob.FAILED, error=str(e), finished_at=timezone.now()
+        )
+        raise
+
+    retention = getattr(settings, 'EXPORT_JOB_RETENTION_HOURS', 48)
+    with transaction.atomic():
+        if _owned(job) is None:
+            os.remove(partial_path)
+            return False
+        # Under the row lock, so a newer claim cannot finish in between
+        os.replace(partial_path, final_path)
+        now = timezone.now()
+        ExportJob.objects.filter(pk=job.pk).update(
+            status=ExportJob.DONE,
+            archive_name=archive_name,
+            archive_size=os.path.getsize(final_path),
+            finished_at=now,
+            expires_at=now + datetime.timedelta(hours=retention),
+        )
+    return True
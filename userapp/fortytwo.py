@@ -0,0 +1,240 @@
+# userapp/fortytwo.py
+"""Shared client for the 42 intra API used by the OAuth login views.
+
+One requests.Session per process keeps TLS connections to the intra alive
+between logins. Every call has connect/read timeouts, idempotent calls are
+retried a bounded number of times, and a circuit breaker fails fast while
+the intra is down instead of tying up workers on doomed requests.
+
+AsyncFortyTwoClient offers the same calls over httpx for the async login
+views, so a burst of logins waits on the event loop rather than on threads.
+"""
+import asyncio
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class FortyTwoError(Exception):
+    """Base class for 42 API failures"""
+
+
+class FortyTwoUnavailable(FortyTwoError):
+    """The intra could not be reached, timed out, or the circuit is open"""
+
+
+class FortyTwoAPIError(FortyTwoError):
+    """The intra answered with a non-200 status"""
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        super().__init__(f"42 API request failed with status {status_code}: {text}")
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures.
+
+    While open every call is rejected; after `reset_timeout` seconds one
+    trial call is let through (half-open) and its outcome closes or reopens
+    the circuit.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: let this caller probe, keep rejecting the rest
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+class FortyTwoClient:
+    def __init__(self, base_url=None, timeout=None, retries=None, pool_size=None, breaker=None):
+        self.base_url = (base_url or getattr(settings, 'FORTYTWO_API_BASE_URL', 'https://api.intra.42.fr')).rstrip('/')
+        self.timeout = timeout or getattr(settings, 'FORTYTWO_API_TIMEOUT', (3.05, 10))
+        retries = getattr(settings, 'FORTYTWO_API_RETRIES', 2) if retries is None else retries
+        pool_size = pool_size or getattr(settings, 'FORTYTWO_API_POOL_SIZE', 10)
+        self.breaker = breaker or _shared_breaker()
+
+        # Connection errors are retried for every method (nothing reached the
+        # server); status/read retries only for GET, since a code exchange
+        # POST must not be replayed
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.2,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise FortyTwoUnavailable("42 API circuit is open")
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            raise FortyTwoUnavailable(f"42 API request failed: {e}") from e
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if response.status_code != 200:
+            raise FortyTwoAPIError(response.status_code, response.text)
+        return response
+
+    def exchange_code(self, code, redirect_uri):
+        """Trade an authorization code for an access token payload"""
+        return self._request('POST', '/oauth/token', data={
+            'grant_type': 'authorization_code',
+            'client_id': settings.FORTYTWO_CLIENT_ID,
+            'client_secret': settings.FORTYTWO_CLIENT_SECRET,
+            'code': code,
+            'redirect_uri': redirect_uri,
+        }).json()
+
+    def get_me(self, access_token):
+        """The /v2/me profile of the token's owner"""
+        return self._request('GET', '/v2/me', headers={'Authorization': f'Bearer {access_token}'}).json()
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncFortyTwoClient:
+    """httpx.AsyncClient counterpart of FortyTwoClient, bound to one event loop"""
+    def __init__(self, base_url=None, timeout=None, retries=None, pool_size=None, breaker=None):
+        self.base_url = (base_url or getattr(settings, 'FORTYTWO_API_BASE_URL', 'https://api.intra.42.fr')).rstrip('/')
+        connect_timeout, read_timeout = timeout or getattr(settings, 'FORTYTWO_API_TIMEOUT', (3.05, 10))
+        retries = getattr(settings, 'FORTYTWO_API_RETRIES', 2) if retries is None else retries
+        pool_size = pool_size or getattr(settings, 'FORTYTWO_API_POOL_SIZE', 10)
+        self.breaker = breaker or _shared_breaker()
+        # httpx transport retries cover connection failures only, which is
+        # also the only retry that is safe for the code exchange POST
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+        )
+
+    async def _request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise FortyTwoUnavailable("42 API circuit is open")
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            raise FortyTwoUnavailable(f"42 API request failed: {e}") from e
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if response.status_code != 200:
+            raise FortyTwoAPIError(response.status_code, response.text)
+        return response
+
+    async def exchange_code(self, code, redirect_uri):
+        response = await self._request('POST', '/oauth/token', data={
+            'grant_type': 'authorization_code',
+            'client_id': settings.FORTYTWO_CLIENT_ID,
+            'client_secret': settings.FORTYTWO_CLIENT_SECRET,
+            'code': code,
+            'redirect_uri': redirect_uri,
+        })
+        return response.json()
+
+    async def get_me(self, access_token):
+        response = await self._request('GET', '/v2/me', headers={'Authorization': f'Bearer {access_token}'})
+        return response.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_client = None
+_client_lock = threading.Lock()
+_breaker = None
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _shared_breaker():
+    """One breaker per process, shared by the sync and async clients"""
+    global _breaker
+    with _client_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(
+                failure_threshold=getattr(settings, 'FORTYTWO_CIRCUIT_FAILURES', 5),
+                reset_timeout=getattr(settings, 'FORTYTWO_CIRCUIT_RESET', 30),
+            )
+        return _breaker
+
+
+def get_client():
+    """Process-wide client, so the connection pool is shared by all requests"""
+    global _client
+    if _client is None:
+        client = FortyTwoClient()
+        with _client_lock:
+            if _client is None:
+                _client = client
+    return _client
+
+
+def get_async_client():
+    """Client for the running event loop (httpx clients can't cross loops)"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncFortyTwoClient()
+    return client
+
+
+def reset_client():
+    """Drop the shared clients and breaker (used when settings change, e.g. in tests)"""
+    global _client, _breaker
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _breaker = None
+    _async_clients.clear()
@@ -0,0 +1,106 @@
+# userapp/hashing.py
+"""Password hashing off the request thread, for the async auth views.
+
+PBKDF2 and Argon2 are CPU-bound. Run inline, every hash blocks the event
+loop (or, in a sync worker, holds the GIL for the whole computation), so a
+handful of logins stall every other request in the process. The helpers
+here send hashing and verification to a bounded ProcessPoolExecutor, so
+the work runs in parallel on as many cores as PASSWORD_HASH_WORKERS allows
+while the loop keeps serving requests.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(settings_module, hashers):
+    # Spawned workers start from a fresh interpreter: set Django up, with the
+    # hashers the parent had when it created the pool
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+    settings.PASSWORD_HASHERS = hashers
+
+
+def get_pool():
+    """Process-wide hashing pool, recreated after a fork"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            workers = getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                # Not fork: this process runs threads (the event loop's executor,
+                # runserver's request threads), and a forked child can inherit a
+                # lock one of them held and block on it forever
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings'), list(settings.PASSWORD_HASHERS)),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _verify(password, encoded):
+    """(valid, needs_rehash) for a stored hash; runs in a pool process"""
+    if not check_password(password, encoded):
+        return False, False
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return True, False
+    preferred = get_hasher()
+    return True, hasher.algorithm != preferred.algorithm or hasher.must_update(encoded)
+
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_pool(), func, *args)
+
+
+async def amake_password(password):
+    return await _run(make_password, password)
+
+
+async def acheck_password(password, encoded):
+    """Like check_password(); returns (valid, needs_rehash)"""
+    if not encoded:
+        return False, False
+    return await _run(_verify, password, encoded)
+
+
+async def aauthenticate(email, password):
+    """ModelBackend-equivalent login check with the hashing done in the pool"""
+    from .models import User
+
+    try:
+        user = await User.objects.aget(email=email)
+    except User.DoesNotExist:
+        # Hash anyway so a missing account takes as long as a wrong password
+        await amake_password(password)
+        return None
+
+    valid, needs_rehash = await acheck_password(password, user.password)
+    if not valid or not user.is_active:
+        return None
+    if needs_rehash:
+        # Move the stored hash to the preferred hasher / current work factor
+        user.password = await amake_password(password)
+        await user.asave(update_fields=['password'])
+    return user
@@ -0,0 +1,160 @@
+# userapp/intra_avatars.py
+"""Local copies of 42 intra profile pictures.
+
+After an OAuth login, schedule_intra_avatar() hands the /v2/me image URL to
+a small background thread pool, so the login response never waits on the
+intra CDN. The picture is stored through store_avatar() like an upload
+(content-addressed, with thumbnails) and always served from here; the intra
+URL never reaches the browser. Later logins re-check it at most once per
+INTRA_AVATAR_REFRESH_INTERVAL with If-None-Match, so an unchanged picture
+costs one 304; a check that failed is retried on the next login. An avatar
+the user uploaded themselves is never replaced.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .avatars import avatar_meta, store_avatar
+from .models import User
+from .uploads import max_upload_size
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_session = None
+_lock = threading.Lock()
+
+
+def intra_image_url(profile):
+    """Best image URL in a /v2/me payload (current and legacy layouts), or None"""
+    image = profile.get('image')
+    if isinstance(image, dict):
+        versions = image.get('versions') or {}
+        return versions.get('large') or image.get('link')
+    return profile.get('image_url')
+
+
+def _checked_key(user_id):
+    return f"intra_avatar_checked_{user_id}"
+
+
+def get_executor():
+    """Process-wide download pool, recreated after a fork"""
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'INTRA_AVATAR_WORKERS', 2),
+                thread_name_prefix='intra-avatar',
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _get_session():
+    # Separate from the 42 API client: another host, and its failures
+    # must not open the API circuit breaker
+    global _session
+    with _lock:
+        if _session is None:
+            retry = Retry(total=2, backoff_factor=0.2, status_forcelist=(429, 502, 503, 504), allowed_methods=['GET'])
+            _session = requests.Session()
+            _session.mount('https://', HTTPAdapter(max_retries=retry))
+            _session.mount('http://', HTTPAdapter(max_retries=retry))
+        return _session
+
+
+def schedule_intra_avatar(user_id, profile):
+    """Queue an import of the login's 42 picture; never blocks, never raises"""
+    try:
+        url = intra_image_url(profile)
+        interval = getattr(settings, 'INTRA_AVATAR_REFRESH_INTERVAL', 24 * 60 * 60)
+        # cache.add() is atomic: one check per user per interval, across workers
+        if not url or not cache.add(_checked_key(user_id), 1, timeout=interval):
+            return
+        if getattr(settings, 'INTRA_AVATAR_BACKGROUND', True):
+            get_executor().submit(_run_import, user_id, url)
+        else:
+            _import(user_id, url)
+    except Exception as e:
+        logger.warning(f"Could not schedule 42 avatar import for user {user_id}: {e}")
+
+
+def _import(user_id, url):
+    try:
+        import_intra_avatar(user_id, url)
+    except Exception as e:
+        # Only a completed check (or a 304) counts; retry on the next login
+        cache.delete(_checked_key(user_id))
+        logger.warning(f"42 avatar import failed for user {user_id}: {e}")
+
+
+def _run_import(user_id, url):
+    try:
+        _import(user_id, url)
+    finally:
+        connection.close()  # Pool threads outlive requests; don't leak their connections
+
+
+def _uses_intra_avatar(user_id):
+    row = User.objects.filter(pk=user_id).values('profile_picture', 'avatar_hash', 'intra_image_hash').first()
+    if row is None:
+        return False
+    if not row['profile_picture']:
+        return True
+    if not row['intra_image_hash']:
+        return False  # Never imported, so whatever is there is their own
+    digest = row['avatar_hash']
+    if not digest:
+        # Uploaded before fingerprinting; avatar_meta() hashes it once
+        meta = avatar_meta(user_id)
+        digest = meta['hash'] if meta and meta['name'] else ''
+    return digest == row['intra_image_hash']
+
+
+def _download(url, etag):
+    """(body, etag) of a changed image, or None when it is unchanged (304)"""
+    headers = {'If-None-Match': etag} if etag else {}
+    timeout = getattr(settings, 'FORTYTWO_API_TIMEOUT', (3.05, 10))
+    with _get_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        body = io.BytesIO()
+        for chunk in response.iter_content(64 * 1024):
+            body.write(chunk)
+            if body.tell() > max_upload_size():
+                raise ValueError(f"image at {url} is larger than AVATAR_MAX_UPLOAD_SIZE")
+        return body.getvalue(), response.headers.get('ETag', '')
+
+
+def import_intra_avatar(user_id, url):
+    """Make the 42 picture at `url` the user's avatar; True if it changed"""
+    if not _uses_intra_avatar(user_id):
+        return False  # Their own upload wins
+    user = User.objects.get(pk=user_id)
+    result = _download(url, user.intra_image_etag if user.profile_picture else '')
+    if result is None:
+        return False
+    data, etag = result
+
+    # Re-check: the user may have uploaded an avatar while this was downloading
+    if not _uses_intra_avatar(user_id):
+        return False
+    user.refresh_from_db()
+    store_avatar(user, ContentFile(data))  # Raises InvalidImage for anything but an image
+    user.intra_image_etag = etag
+    user.intra_image_hash = user.avatar_hash
+    user.save(update_fields=['intra_image_etag', 'intra_image_hash'])
+    return True
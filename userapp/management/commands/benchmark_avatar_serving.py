@@ -0,0 +1,97 @@
+import io
+import ssl
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from PIL import Image
+from userapp.avatars import forget_avatar_meta, store_avatar
+from userapp.models import User
+from userapp.views import get_avatar_image
+
+class Command(BaseCommand):
+    help = (
+        'Compare avatar serving with files streamed by the Django worker and with the '
+        'X-Accel-Redirect offload (SENDFILE_BACKEND). By default both modes run in-process '
+        'and the worker time per request is reported; with --url, a running deployment is '
+        'loaded over HTTP instead (run once per SENDFILE_BACKEND setting, e.g. through '
+        'nginx on https://localhost:8443).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per mode')
+        parser.add_argument('--pixels', type=int, default=800, help='Width/height of the benchmark avatar')
+        parser.add_argument('--url', help='Avatar URL of a running server to load instead')
+        parser.add_argument('--concurrency', type=int, default=16, help='Parallel clients with --url')
+
+    def handle(self, *args, **options):
+        if options['url']:
+            self._load_url(options)
+            return
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            # Not in a rolled-back transaction: closing a response ends the "request",
+            # which closes the database connection like a real worker would
+            user = User.objects.create_user(username='bench_avatar', email='bench_avatar@bench.invalid')
+            try:
+                buffer = io.BytesIO()
+                Image.effect_noise((options['pixels'], options['pixels']), 64).convert('RGB').save(buffer, 'PNG')
+                store_avatar(user, ContentFile(buffer.getvalue()))
+                self.stdout.write(f"Avatar: {len(buffer.getvalue()) / 1e6:.1f} MB original")
+
+                for label, backend in (('FileResponse', ''), ('X-Accel-Redirect', 'nginx')):
+                    with override_settings(SENDFILE_BACKEND=backend):
+                        for query in ('', '?size=256'):
+                            self._report(f"{label} {query or 'original'}", self._serve(user.id, query, options))
+            finally:
+                forget_avatar_meta(user.id)
+                user.delete()
+
+    def _serve(self, user_id, query, options):
+        factory = RequestFactory()
+        url = f'/api/auth/avatar/{user_id}/{query}'
+        get_avatar_image(factory.get(url, HTTP_ACCEPT='image/webp'), user_id)  # Warm the metadata cache
+        sent = 0
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        for _ in range(options['requests']):
+            response = get_avatar_image(factory.get(url, HTTP_ACCEPT='image/webp'), user_id)
+            # What the WSGI server would write from the worker
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            sent += len(body)
+            response.close()
+        return options['requests'], sent, time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    def _report(self, label, result):
+        requests, sent, cpu, wall = result
+        self.stdout.write(
+            f"{label}: {requests / wall:.0f} req/s per worker, {cpu / requests * 1000:.2f} ms CPU/request, "
+            f"{sent / requests / 1e3:.1f} kB written by Python per request"
+        )
+
+    def _load_url(self, options):
+        context = ssl._create_unverified_context()  # Local self-signed certificate
+        lock = threading.Lock()
+        totals = {'bytes': 0, 'errors': 0}
+
+        def fetch(_):
+            try:
+                with urllib.request.urlopen(options['url'], context=context, timeout=30) as response:
+                    size = len(response.read())
+                with lock:
+                    totals['bytes'] += size
+            except Exception:
+                with lock:
+                    totals['errors'] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(fetch, range(options['requests'])))
+        wall = time.perf_counter() - start
+        self.stdout.write(
+            f"{options['requests']} requests, {options['concurrency']} clients: {options['requests'] / wall:.0f} req/s, "
+            f"{totals['bytes'] / wall / 1e6:.1f} MB/s, {totals['errors']} errors"
+        )
@@ -0,0 +1,76 @@
+import random
+import statistics
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from userapp.models import User, friend_suggestions_cache_key
+from userapp.suggestions import compute_friend_suggestions, get_friend_suggestions
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark friend suggestions on a synthetic friend graph. '
+        'Everything runs in a transaction that is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help='Synthetic users to create')
+        parser.add_argument('--friends', type=int, default=20, help='Friends per synthetic user')
+        parser.add_argument('--samples', type=int, default=200, help='Users to query suggestions for')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            ids = self._build_graph(options['users'], options['friends'], rng)
+            sample = rng.sample(ids, min(options['samples'], len(ids)))
+
+            cold = self._time(lambda user_id: compute_friend_suggestions(user_id), sample)
+            cache.delete_many([friend_suggestions_cache_key(user_id) for user_id in sample])
+            for user_id in sample:
+                get_friend_suggestions(user_id)
+            warm = self._time(lambda user_id: get_friend_suggestions(user_id), sample)
+            cache.delete_many([friend_suggestions_cache_key(user_id) for user_id in sample])
+
+            self._report('SQL aggregation (uncached)', cold)
+            self._report('Cached', warm)
+            transaction.set_rollback(True)
+
+    def _build_graph(self, user_count, friends_per_user, rng):
+        start = time.perf_counter()
+        users = [
+            User(username=f'bench_{i}', email=f'bench_{i}@bench.invalid', password='!')
+            for i in range(user_count)
+        ]
+        User.objects.bulk_create(users, batch_size=5000)
+        ids = list(User.objects.filter(username__startswith='bench_').values_list('id', flat=True))
+
+        Through = User.friends.through
+        batch = []
+        for user_id in ids:
+            for friend_id in set(rng.sample(ids, friends_per_user)) - {user_id}:
+                batch.append(Through(from_user_id=user_id, to_user_id=friend_id))
+            if len(batch) >= 20000:
+                Through.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Through.objects.bulk_create(batch, ignore_conflicts=True)
+
+        self.stdout.write(
+            f"Built graph of {len(ids)} users x {friends_per_user} friends in {time.perf_counter() - start:.1f}s"
+        )
+        return ids
+
+    def _time(self, func, user_ids):
+        timings = []
+        for user_id in user_ids:
+            start = time.perf_counter()
+            func(user_id)
+            timings.append((time.perf_counter() - start) * 1000)
+        return sorted(timings)
+
+    def _report(self, label, timings):
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+        self.stdout.write(
+            f"{label}: median {statistics.median(timings):.2f} ms, "
+            f"p95 {p95:.2f} ms, max {timings[-1]:.2f} ms over {len(timings)} users"
+        )
@@ -0,0 +1,49 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from userapp.authentication import CachedJWTAuthentication, ClaimsJWTAuthentication, tokens_for_user, validated_token_cache
+from userapp.models import User
+
+class Command(BaseCommand):
+    help = (
+        'Micro-benchmark bearer token authentication: plain JWTAuthentication vs '
+        'cached validation vs claims-only. The test user is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5000, help='Authentications per variant')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        with transaction.atomic():
+            user = User.objects.create_user(username='bench_jwt', email='bench_jwt@bench.invalid', password='!')
+            token = str(tokens_for_user(user).access_token)
+            request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+            validated_token_cache.clear()
+            for label, backend in (
+                ('JWTAuthentication (verify + user SELECT)', JWTAuthentication()),
+                ('CachedJWTAuthentication (user SELECT)', CachedJWTAuthentication()),
+                ('ClaimsJWTAuthentication (no SELECT)', ClaimsJWTAuthentication()),
+            ):
+                self._report(label, self._time(backend, request, iterations))
+            validated_token_cache.clear()
+            transaction.set_rollback(True)
+
+    def _time(self, backend, request, iterations):
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            backend.authenticate(request)
+            timings.append((time.perf_counter() - start) * 1_000_000)
+        return sorted(timings)
+
+    def _report(self, label, timings):
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+        self.stdout.write(
+            f"{label}: median {statistics.median(timings):.1f} us, "
+            f"p95 {p95:.1f} us over {len(timings)} requests"
+        )
@@ -0,0 +1,57 @@
+import json
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+from userapp.models import User
+from userapp.views import login_view
+
+class Command(BaseCommand):
+    help = (
+        'Simulate a credential-stuffing burst against login_view and report how much '
+        'CPU goes to password hashing with and without the rate limiter. '
+        'The target accounts are rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Login attempts in the burst')
+        parser.add_argument('--ips', type=int, default=3, help='Distinct source addresses')
+        parser.add_argument('--accounts', type=int, default=10, help='Distinct targeted accounts')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for i in range(options['accounts']):
+                User.objects.create_user(
+                    username=f'bench_login_{i}', email=f'bench_login_{i}@bench.invalid', password='correct horse'
+                )
+
+            with override_settings(AUTH_RATE_LIMITS={}):
+                self._report('No rate limit', self._attack(options))
+            self._report('Rate limited', self._attack(options))
+            transaction.set_rollback(True)
+
+    def _attack(self, options):
+        cache.clear()
+        factory = RequestFactory()
+        statuses = {}
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        for i in range(options['requests']):
+            request = factory.post(
+                '/api/auth/login/',
+                json.dumps({'email': f'bench_login_{i % options["accounts"]}@bench.invalid', 'password': f'guess{i}'}),
+                content_type='application/json',
+                REMOTE_ADDR=f'198.51.100.{i % options["ips"]}',
+            )
+            code = login_view(request).status_code
+            statuses[code] = statuses.get(code, 0) + 1
+        cache.clear()
+        return statuses, time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    def _report(self, label, result):
+        statuses, cpu, wall = result
+        hashed = sum(count for code, count in statuses.items() if code != 429)
+        self.stdout.write(
+            f"{label}: {sum(statuses.values())} attempts, {hashed} reached the password hasher, "
+            f"{statuses.get(429, 0)} rejected; {cpu:.2f}s CPU, {wall:.2f}s wall"
+        )
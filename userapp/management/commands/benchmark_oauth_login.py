@@ -0,0 +1,163 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import override_settings
+from userapp import fortytwo
+from userapp.auth_state import issue_oauth_state
+from userapp.models import User
+
+BENCH_EMAIL = 'bench@bench.invalid'
+
+
+class SlowIntraHandler(BaseHTTPRequestHandler):
+    """Answers the two calls of a 42 login after a fixed delay"""
+    latency = 0.2
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply({'access_token': 'bench-token'})
+
+    def do_GET(self):
+        self._reply({'id': 1, 'login': 'bench', 'email': BENCH_EMAIL})
+
+    def _reply(self, payload):
+        time.sleep(self.latency)
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubIntraServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections when many logins start at once
+    request_queue_size = 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare 42 login throughput of the sync get-token view and its async variant, '
+        'both served through Django\'s ASGI handler (with the full middleware chain) '
+        'against a local stub intra with simulated latency. Reports logins/s, the most '
+        'threads alive at once and how many of them sat waiting on the 42 API. Writes to the '
+        'configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help='Logins to simulate per view')
+        parser.add_argument('--concurrency', type=int, default=30, help='Logins in flight at once')
+        parser.add_argument('--latency', type=float, default=0.2, help='Seconds the stub waits per call')
+
+    def handle(self, *args, **options):
+        handler = type('Handler', (SlowIntraHandler,), {'latency': options['latency']})
+        server = StubIntraServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        results = []
+        try:
+            # Fresh clients (and circuit breaker) for each view, pointed at the stub
+            with override_settings(FORTYTWO_API_BASE_URL=base_url, FORTYTWO_API_RETRIES=0):
+                for label, path in (('Sync view', '/api/auth/get-token/'), ('Async view', '/api/auth/async/get-token/')):
+                    fortytwo.reset_client()
+                    results.append((label, *asyncio.run(self._run(path, options))))
+        finally:
+            fortytwo.reset_client()
+            server.shutdown()
+            server.server_close()
+            User.objects.filter(email=BENCH_EMAIL).delete()
+            connections.close_all()
+
+        for label, elapsed, failed, threads, waiting in results:
+            self.stdout.write(
+                f"{label}, {options['concurrency']} in flight: {options['logins']} logins in {elapsed:.2f}s "
+                f"({options['logins'] / elapsed:.1f} logins/s), {failed} failed; up to {threads} threads, "
+                f"{waiting} of them blocked on the 42 API"
+            )
+
+    async def _run(self, path, options):
+        application = ASGIHandler()
+        in_flight = asyncio.Semaphore(options['concurrency'])
+        states = [await sync_to_async(issue_oauth_state)() for _ in range(options['logins'])]
+        statuses = []
+
+        async def login(i):
+            async with in_flight:
+                body = json.dumps({'code': f'code-{i}', 'state': states[i]}).encode()
+                statuses.append(await self._post(application, path, body))
+
+        peak = {'threads': threading.active_count(), 'waiting': 0}
+        done = asyncio.Event()
+
+        async def sample_threads():
+            while not done.is_set():
+                peak['threads'] = max(peak['threads'], threading.active_count())
+                peak['waiting'] = max(peak['waiting'], self._threads_in_fortytwo())
+                await asyncio.sleep(0.01)
+
+        sampler = asyncio.create_task(sample_threads())
+        start = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(options['logins'])))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await sampler
+        return elapsed, sum(status != 200 for status in statuses), peak['threads'], peak['waiting']
+
+    def _threads_in_fortytwo(self):
+        """Threads currently blocked in a sync 42 API call"""
+        count = 0
+        for frame in sys._current_frames().values():
+            while frame is not None:
+                if frame.f_code.co_filename == fortytwo.__file__:
+                    count += 1
+                    break
+                frame = frame.f_back
+        return count
+
+    async def _post(self, application, path, body):
+        """One request through the ASGI application; returns the response status"""
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'POST',
+            'scheme': 'https',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 443),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        status = None
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Future()  # The client never disconnects
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await application(scope, receive, send)
+        return status
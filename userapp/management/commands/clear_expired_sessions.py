@@ -0,0 +1,46 @@
+import time
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired sessions in small batches, so no single DELETE holds '
+        'locks on django_session for long (unlike clearsessions)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Sessions deleted per statement',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        now = timezone.now()
+        deleted = 0
+        while True:
+            # Walks the expire_date index; each batch is its own short transaction
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .order_by('expire_date')
+                .values_list('session_key', flat=True)[:batch_size]
+            )
+            if not keys:
+                break
+            count, _ = Session.objects.filter(session_key__in=keys, expire_date__lt=now).delete()
+            deleted += count
+            self.stdout.write(f"Deleted {deleted} expired sessions")
+            if len(keys) < batch_size:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired sessions."))
@@ -4,8 +4,9 @@ from datetime import timedelta
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.conf import settings
-from django.core.mail import send_mail
 from userapp.models import User
+from userapp.activity import flush_activity
+from userapp.outbox import queue_email
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +28,9 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         notify_only = options['notify_only']
+
+        # last_activity is written behind; make sure buffered activity is in the DB
+        flush_activity()
         
         # Get settings with defaults
         inactive_months = getattr(settings, 'INACTIVE_USER_DELETE_MONTHS', 6)
@@ -100,10 +104,9 @@ class Command(BaseCommand):
             f"Thank you,\n"
             f"The FAST_PONG Team"
         )
-        from_email = settings.DEFAULT_FROM_EMAIL
         recipient_list = [user.email]
         
-        send_mail(subject, message, from_email, recipient_list, fail_silently=False)
+        queue_email(subject, message, recipient_list)
     
     def _send_deletion_email(self, user):
         """Send final notification that account has been deleted"""
@@ -116,7 +119,6 @@ class Command(BaseCommand):
             f"Thank you,\n"
             f"The FAST_PONG Team"
         )
-        from_email = settings.DEFAULT_FROM_EMAIL
         recipient_list = [user.email]
         
-        send_mail(subject, message, from_email, recipient_list, fail_silently=False)
+        queue_email(subject, message, recipient_list)
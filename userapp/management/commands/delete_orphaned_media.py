@@ -0,0 +1,120 @@
+import os
+import time
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from userapp.avatars import THUMBNAIL_ROOT
+from userapp.models import User
+
+MEDIA_DIR = 'profile_pictures'
+CURSOR_KEY = 'delete_orphaned_media_cursor'
+
+class Command(BaseCommand):
+    help = (
+        'Delete avatar files and thumbnails that no user points to. The media tree is '
+        'walked in sorted order, one batch at a time; the position is saved after each '
+        'batch, so an interrupted run resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Files checked per database lookup')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches')
+        parser.add_argument(
+            '--grace-minutes',
+            type=int,
+            default=60,
+            help='Files modified more recently than this are kept (uploads still in progress)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report orphans without deleting them')
+        parser.add_argument('--restart', action='store_true', help='Ignore a saved position and start over')
+
+    def handle(self, *args, **options):
+        if not default_storage.exists(MEDIA_DIR):
+            self.stdout.write(self.style.SUCCESS('No media to clean.'))
+            return
+
+        cursor = None if options['restart'] else cache.get(CURSOR_KEY)
+        if cursor:
+            self.stdout.write(f"Resuming after {cursor}")
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        scanned = deleted = 0
+        batch = []
+        for name in self._walk(MEDIA_DIR, tuple(cursor.split('/')) if cursor else None):
+            batch.append(name)
+            if len(batch) < options['batch_size']:
+                continue
+            deleted += self._sweep(batch, cutoff, options['dry_run'])
+            scanned += len(batch)
+            if not options['dry_run']:
+                cache.set(CURSOR_KEY, batch[-1], timeout=None)
+            self.stdout.write(f"Checked {scanned} files, {deleted} orphans")
+            batch = []
+            time.sleep(options['sleep'])
+
+        deleted += self._sweep(batch, cutoff, options['dry_run'])
+        scanned += len(batch)
+        if not options['dry_run']:
+            cache.delete(CURSOR_KEY)  # Pass complete; the next run starts from the top
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} orphaned files out of {scanned} checked."))
+
+    def _walk(self, path, after):
+        """Storage names under `path` in sorted order, skipping everything up to `after`"""
+        try:
+            dirs, files = default_storage.listdir(path)
+        except FileNotFoundError:
+            return
+        for entry, is_dir in sorted([(d, True) for d in dirs] + [(f, False) for f in files]):
+            name = f"{path}/{entry}"
+            parts = tuple(name.split('/'))
+            if after and parts < after[:len(parts)]:
+                continue  # Entirely before the saved position
+            if is_dir:
+                yield from self._walk(name, after)
+            elif not after or parts > after:
+                yield name
+
+    def _thumbnail_digest(self, name):
+        # profile_pictures/thumbs/ab/<sha256>/<size>.<fmt>; anything else is a leftover
+        parts = name[len(THUMBNAIL_ROOT) + 1:].split('/')
+        return parts[1] if len(parts) == 3 and len(parts[1]) == 64 else None
+
+    def _sweep(self, names, cutoff, dry_run):
+        thumbnails = [name for name in names if name.startswith(THUMBNAIL_ROOT + '/')]
+        uploads = [name for name in names if not name.startswith(THUMBNAIL_ROOT + '/')]
+
+        referenced = set(
+            User.objects.filter(profile_picture__in=uploads).values_list('profile_picture', flat=True)
+        )
+        digests = {self._thumbnail_digest(name) for name in thumbnails} - {None}
+        live = set(User.objects.filter(avatar_hash__in=digests).values_list('avatar_hash', flat=True))
+
+        orphans = [name for name in uploads if name not in referenced]
+        orphans += [name for name in thumbnails if self._thumbnail_digest(name) not in live]
+        deleted = 0
+        for name in orphans:
+            try:
+                if default_storage.get_modified_time(name) > cutoff:
+                    continue
+                if not dry_run:
+                    default_storage.delete(name)
+                    self._remove_empty_parents(name)
+            except FileNotFoundError:
+                continue
+            deleted += 1
+        return deleted
+
+    def _remove_empty_parents(self, name):
+        try:
+            root = default_storage.path(MEDIA_DIR)
+            directory = os.path.dirname(default_storage.path(name))
+        except NotImplementedError:
+            return  # Object storage has no directories to clean up
+        while directory != root:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return  # Not empty
+            directory = os.path.dirname(directory)
@@ -0,0 +1,34 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from userapp.activity import flush_activity
+
+class Command(BaseCommand):
+    help = 'Write buffered last_activity timestamps to the database in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep flushing every --interval seconds instead of exiting',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 60),
+            help='Seconds between flushes in --loop mode',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Buffered entries folded into each UPDATE',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            updated = flush_activity(batch_size=options['batch_size'])
+            self.stdout.write(f"Updated last_activity for {updated} users")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from userapp.models import User, MatchHistory, UserStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the UserStats table from MatchHistory (backfill or repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Only rebuild stats for this user id (can be repeated)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of users rebuilt per transaction',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        batch_size = options['batch_size']
+
+        if user_ids is None:
+            user_ids = list(
+                User.objects.filter(matches__isnull=False).distinct().order_by('id').values_list('id', flat=True)
+            )
+
+        rebuilt = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            with transaction.atomic():
+                rows = self._build_rows(batch)
+                UserStats.objects.filter(user_id__in=batch).delete()
+                UserStats.objects.bulk_create(rows, batch_size=batch_size)
+            rebuilt += len(batch)
+            self.stdout.write(f"Rebuilt stats for {rebuilt}/{len(user_ids)} users")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {rebuilt} users."))
+
+    def _build_rows(self, user_ids):
+        """Aggregate counters in SQL, then walk the margin-indexed wins for best scores"""
+        rows = {}
+        counts = (
+            MatchHistory.objects.filter(user_id__in=user_ids)
+            .values('user_id', 'game_type')
+            .annotate(
+                games_played=Count('id'),
+                wins=Count('id', filter=Q(result='WIN')),
+                losses=Count('id', filter=Q(result='LOSS')),
+                draws=Count('id', filter=Q(result='DRAW')),
+            )
+        )
+        for entry in counts:
+            for game_type in (entry['game_type'], UserStats.ALL_GAMES):
+                key = (entry['user_id'], game_type)
+                stats = rows.setdefault(key, UserStats(user_id=entry['user_id'], game_type=game_type))
+                stats.games_played += entry['games_played']
+                stats.wins += entry['wins']
+                stats.losses += entry['losses']
+                stats.draws += entry['draws']
+
+        wins = (
+            MatchHistory.objects.filter(user_id__in=user_ids, result='WIN', margin__isnull=False)
+            .order_by('date_played', 'id')
+            .values_list('user_id', 'game_type', 'score', 'margin')
+        )
+        for user_id, game_type, score, margin in wins.iterator(chunk_size=2000):
+            for key in ((user_id, game_type), (user_id, UserStats.ALL_GAMES)):
+                stats = rows[key]
+                if stats.best_margin is None or margin > stats.best_margin:
+                    stats.best_margin = margin
+                    stats.best_score = score
+
+        return list(rows.values())
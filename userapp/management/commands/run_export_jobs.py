@@ -0,0 +1,102 @@
+import datetime
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from userapp.export import run_export_job
+from userapp.models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+# A RUNNING job older than this is assumed to belong to a worker that died;
+# if it is still alive, its attempt loses ownership and its archive is discarded
+CLAIM_TIMEOUT = datetime.timedelta(minutes=30)
+
+class Command(BaseCommand):
+    help = 'Build pending data export archives on a bounded thread pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'EXPORT_WORKERS', 2),
+            help='Maximum number of exports built at the same time',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the jobs that are pending now, then exit',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to sleep when the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                self._purge_expired()
+                jobs = self._claim_jobs(workers)
+                if jobs:
+                    # Wait for the batch so we never hold more than `workers` jobs
+                    for job, future in [(job, pool.submit(self._run, job)) for job in jobs]:
+                        if future.result():
+                            self.stdout.write(f"Export {job.id} for {job.user.username} done")
+                        else:
+                            self.stderr.write(f"Export {job.id} for {job.user.username} failed")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+
+    def _claim_jobs(self, limit):
+        """Atomically move up to `limit` pending (or abandoned) jobs to RUNNING"""
+        now = timezone.now()
+        with transaction.atomic():
+            jobs = list(
+                # of=('self',): don't lock the joined user rows as well
+                ExportJob.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('user')
+                .filter(
+                    Q(status=ExportJob.PENDING)
+                    | Q(status=ExportJob.RUNNING, started_at__lt=now - CLAIM_TIMEOUT)
+                )
+                .order_by('created_at')[:limit]
+            )
+            ExportJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=ExportJob.RUNNING, started_at=now, attempts=F('attempts') + 1
+            )
+        for job in jobs:
+            # The row is ours until the next claim bumps this again
+            job.attempts += 1
+        return jobs
+
+    def _run(self, job):
+        try:
+            if run_export_job(job):
+                return True
+            logger.warning(f"Export job {job.id} was reclaimed; discarded attempt {job.attempts}")
+            return False
+        except Exception as e:
+            logger.error(f"Export job {job.id} failed: {str(e)}")
+            return False
+        finally:
+            # Each worker thread opens its own connection; don't leak it
+            connection.close()
+
+    def _purge_expired(self):
+        expired = ExportJob.objects.filter(status=ExportJob.DONE, expires_at__lt=timezone.now())
+        for job in expired:
+            path = os.path.join(settings.EXPORT_ROOT, job.archive_name)
+            if job.archive_name and os.path.exists(path):
+                os.remove(path)
+            job.delete()
+        close_old_connections()
@@ -0,0 +1,50 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from userapp.outbox import deliver_outbox, prune_outbox
+
+PRUNE_INTERVAL = 60 * 60  # Seconds between deletions of old sent emails
+
+class Command(BaseCommand):
+    help = (
+        'Send queued emails from the outbox, reusing one SMTP connection per drain, '
+        'and delete sent emails older than EMAIL_OUTBOX_KEEP_SENT. '
+        'For local testing point EMAIL_HOST/EMAIL_PORT at a sink, e.g. '
+        '"python -m aiosmtpd -n -l localhost:1025".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 100),
+            help='Emails claimed per database round trip',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Send the emails that are due now, then exit',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=getattr(settings, 'EMAIL_OUTBOX_POLL_INTERVAL', 1.0),
+            help='Seconds to sleep when the outbox is empty',
+        )
+
+    def handle(self, *args, **options):
+        last_prune = None
+        while True:
+            sent = deliver_outbox(options['batch_size'])
+            if sent:
+                self.stdout.write(f"Sent {sent} queued emails")
+            if last_prune is None or time.monotonic() - last_prune >= PRUNE_INTERVAL:
+                pruned = prune_outbox()
+                if pruned:
+                    self.stdout.write(f"Deleted {pruned} sent emails")
+                last_prune = time.monotonic()
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(options['poll_interval'])
@@ -1,29 +1,36 @@
-
-import datetime
-from django.utils import timezone
-from django.conf import settings
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.auth import get_user_model
+from .activity import record_activity
+from .authentication import ClaimsUser
 
 class UserActivityMiddleware:
+    # Async-capable, so under ASGI the async views run on the event loop
+    # instead of Django adapting the whole chain into a thread per request
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         response = self.get_response(request)
-        
-        # Only update last_activity for authenticated users
-        if request.user.is_authenticated:
-            # Don't update on every request to avoid excessive database writes
-            # Only update if significant time has passed
-            update_window = getattr(settings, 'LAST_ACTIVITY_UPDATE_WINDOW', 15)
-            
-            should_update = False
-            
-            if not hasattr(request.user, 'last_activity') or request.user.last_activity is None:
-                should_update = True
-            elif request.user.last_activity < (timezone.now() - datetime.timedelta(minutes=update_window)):
-                should_update = True
-            
-            if should_update:
-                request.user.update_last_activity()
-        
+        self.record(request)
         return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        # request.user may still be a lazy session lookup, and the cache API is
+        # sync: one short hop after the view, not a thread held for all of it
+        await sync_to_async(self.record)(request)
+        return response
+
+    def record(self, request):
+        # Only track real users: a row, or the ClaimsUser of claims-only JWT views
+        if request.user.is_authenticated and isinstance(request.user, (get_user_model(), ClaimsUser)):
+            # Buffered in the cache at most once per LAST_ACTIVITY_UPDATE_WINDOW
+            # and written to the database in bulk by userapp.activity
+            record_activity(request.user.pk)
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userapp", "0007_user_last_activity_user_last_warned_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "game_type",
+                    models.CharField(
+                        choices=[
+                            ("PONG", "Pong"),
+                            ("TICTACTOE", "TicTacToe"),
+                            ("ALL", "All games"),
+                        ],
+                        default="ALL",
+                        max_length=10,
+                    ),
+                ),
+                ("games_played", models.PositiveIntegerField(default=0)),
+                ("wins", models.PositiveIntegerField(default=0)),
+                ("losses", models.PositiveIntegerField(default=0)),
+                ("draws", models.PositiveIntegerField(default=0)),
+                ("best_margin", models.IntegerField(blank=True, null=True)),
+                ("best_score", models.CharField(default="0-0", max_length=10)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stats",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "User Stats",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="userstats",
+            constraint=models.UniqueConstraint(
+                fields=("user", "game_type"), name="userstats_user_game_type_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+def backfill_scores(apps, schema_editor):
+    MatchHistory = apps.get_model("userapp", "MatchHistory")
+    batch = []
+    rows = MatchHistory.objects.only("id", "score").order_by("id")
+    for match in rows.iterator(chunk_size=2000):
+        parts = (match.score or "").split("-")
+        if len(parts) != 2:
+            continue
+        try:
+            match.user_score, match.opponent_score = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        match.margin = match.user_score - match.opponent_score
+        batch.append(match)
+        if len(batch) >= 2000:
+            MatchHistory.objects.bulk_update(batch, ["user_score", "opponent_score", "margin"])
+            batch = []
+    if batch:
+        MatchHistory.objects.bulk_update(batch, ["user_score", "opponent_score", "margin"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userapp", "0008_userstats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="matchhistory",
+            name="margin",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="matchhistory",
+            name="opponent_score",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="matchhistory",
+            name="user_score",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="matchhistory",
+            index=models.Index(
+                fields=["user", "result", "-margin"],
+                name="match_user_result_margin_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="matchhistory",
+            index=models.Index(
+                fields=["user", "game_type", "user_score", "opponent_score"],
+                name="match_user_game_scores_idx",
+            ),
+        ),
+    ]
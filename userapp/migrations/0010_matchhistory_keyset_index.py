@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userapp", "0009_matchhistory_numeric_scores"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="matchhistory",
+            index=models.Index(
+                fields=["user", "-date_played", "id"], name="match_user_date_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:20
+
+from django.db import migrations
+
+# The user directory filters with username__istartswith / display_name__istartswith,
+# which PostgreSQL compiles to UPPER(col) LIKE UPPER('q%'). Only an expression
+# index using varchar_pattern_ops can serve that, and it has no portable model
+# Meta equivalent, so it is created here for PostgreSQL only.
+PREFIX_INDEXES = [
+    ("user_username_prefix_idx", "username"),
+    ("user_display_name_prefix_idx", "display_name"),
+]
+
+
+def create_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, column in PREFIX_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON userapp_user (UPPER({column}) varchar_pattern_ops)"
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _ in PREFIX_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userapp", "0011_exportjob"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userapp", "0013_outboxemail"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="avatar_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="avatar_updated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userapp", "0014_user_avatar_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="intra_image_etag",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="intra_image_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
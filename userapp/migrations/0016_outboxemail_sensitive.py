@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userapp", "0015_user_intra_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outboxemail",
+            name="sensitive",
+            field=models.BooleanField(default=False),
+        ),
+    ]
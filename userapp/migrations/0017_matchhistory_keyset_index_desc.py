@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userapp", "0016_outboxemail_sensitive"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="matchhistory",
+            name="match_user_date_id_idx",
+        ),
+        migrations.AddIndex(
+            model_name="matchhistory",
+            index=models.Index(
+                fields=["user", "-date_played", "-id"],
+                name="match_user_date_id_desc_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userapp", "0017_matchhistory_keyset_index_desc"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exportjob",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
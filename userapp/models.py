@@ -1,14 +1,24 @@
 # userapp/models.py
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Avg, Count, F
 from django.utils import timezone
+import uuid
+
+def friend_suggestions_cache_key(user_id):
+    return f"friend_suggestions_{user_id}"
 
 class User(AbstractUser):
     display_name = models.CharField(max_length=150, blank=True, null=True)
     email = models.EmailField(unique=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', null=True, blank=True)
+    avatar_hash = models.CharField(max_length=64, blank=True, default='')  # SHA-256 of the upload
+    avatar_updated_at = models.DateTimeField(null=True, blank=True)
     is_42_user = models.BooleanField(default=False)
     intra_id = models.CharField(max_length=50, null=True, blank=True)
+    intra_image_etag = models.CharField(max_length=255, blank=True, default='')  # ETag of the imported 42 picture
+    intra_image_hash = models.CharField(max_length=64, blank=True, default='')  # avatar_hash it produced
     two_factor_enabled = models.BooleanField(default=False)
     
     # Add GDPR compliance fields
@@ -44,25 +54,91 @@ class User(AbstractUser):
         """Return display_name if set, otherwise return username"""
         return self.display_name if self.display_name else self.username
 
+    def invalidate_friend_suggestions(self):
+        """Drop the cached "people you may know" list after the friend list changes"""
+        # After the commit: a read between the delete and the commit would
+        # otherwise cache the old suggestions again
+        key = friend_suggestions_cache_key(self.pk)
+        transaction.on_commit(lambda: cache.delete(key))
+
+    def is_friend(self, friend):
+        """EXISTS check against the friends through table"""
+        return self.friends.filter(pk=friend.pk).exists()
+
     def add_friend(self, friend):
         """Add a user as friend"""
-        if friend != self and friend not in self.friends.all():
+        if friend != self and not self.is_friend(friend):
             self.friends.add(friend)
+            self.invalidate_friend_suggestions()
             return True
         return False
     
     def remove_friend(self, friend):
         """Remove a user from friends"""
-        if friend in self.friends.all():
-            self.friends.remove(friend)
-            return True
-        return False
+        deleted, _ = User.friends.through.objects.filter(from_user_id=self.pk, to_user_id=friend.pk).delete()
+        if deleted:
+            self.invalidate_friend_suggestions()
+        return deleted > 0
+
+    def add_friends(self, user_ids):
+        """Add many friends at once; returns the ids that were newly added.
+
+        Unknown ids and the user's own id are ignored.
+        """
+        candidates = set(User.objects.filter(id__in=user_ids).exclude(id=self.pk).values_list('id', flat=True))
+        existing = set(self.friends.filter(id__in=candidates).values_list('id', flat=True))
+        added = sorted(candidates - existing)
+        Through = User.friends.through
+        # ignore_conflicts covers a concurrent add of the same pair
+        Through.objects.bulk_create(
+            [Through(from_user_id=self.pk, to_user_id=friend_id) for friend_id in added],
+            ignore_conflicts=True
+        )
+        if added:
+            self.invalidate_friend_suggestions()
+        return added
+
+    def remove_friends(self, user_ids):
+        """Remove many friends with a single DELETE; returns the ids removed"""
+        links = User.friends.through.objects.filter(from_user_id=self.pk, to_user_id__in=user_ids)
+        removed = sorted(links.values_list('to_user_id', flat=True))
+        if removed:
+            links.delete()
+            self.invalidate_friend_suggestions()
+        return removed
 
     def update_last_activity(self):
         """Update the last_activity timestamp"""
         self.last_activity = timezone.now()
         self.save(update_fields=['last_activity'])
 
+def parse_score(score):
+    """Split a "user_score-opponent_score" string into two ints, or None"""
+    parts = (score or '').split('-')
+    if len(parts) != 2:
+        return None
+    try:
+        return int(parts[0]), int(parts[1])
+    except ValueError:
+        return None
+
+class MatchHistoryQuerySet(models.QuerySet):
+    def best_win(self):
+        """The win with the largest margin (served by the user/result/margin index)"""
+        return self.filter(result='WIN', margin__isnull=False).order_by('-margin', 'date_played').first()
+
+    def average_margin(self):
+        return self.filter(margin__isnull=False).aggregate(avg=Avg('margin'))['avg']
+
+    def score_histogram(self):
+        """Number of matches per (user_score, opponent_score) pair"""
+        return (
+            self.filter(user_score__isnull=False)
+            .values('user_score', 'opponent_score')
+            .annotate(count=Count('id'))
+            .order_by('user_score', 'opponent_score')
+        )
+
 class MatchHistory(models.Model):
     GAME_CHOICES = (
         ('PONG', 'Pong'),
@@ -80,11 +156,156 @@ class MatchHistory(models.Model):
     opponent = models.CharField(max_length=150)
     result = models.CharField(max_length=4, choices=RESULT_CHOICES)
     score = models.CharField(max_length=10)  # Format: "user_score-opponent_score"
+    # Numeric copies of score, null when the score string can't be parsed
+    user_score = models.IntegerField(null=True, blank=True)
+    opponent_score = models.IntegerField(null=True, blank=True)
+    margin = models.IntegerField(null=True, blank=True)
     date_played = models.DateTimeField(auto_now_add=True)
+
+    objects = MatchHistoryQuerySet.as_manager()
     
     class Meta:
         ordering = ['-date_played']
         verbose_name_plural = 'Match Histories'
+        indexes = [
+            # Keyset pagination walks this in (-date_played, -id) order
+            models.Index(fields=['user', '-date_played', '-id'], name='match_user_date_id_desc_idx'),
+            models.Index(fields=['user', 'result', '-margin'], name='match_user_result_margin_idx'),
+            models.Index(fields=['user', 'game_type', 'user_score', 'opponent_score'], name='match_user_game_scores_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} vs {self.opponent} - {self.result}"
+
+    def save(self, *args, **kwargs):
+        if self.user_score is None and self.opponent_score is None:
+            self.user_score, self.opponent_score = parse_score(self.score) or (None, None)
+        if self.user_score is not None and self.opponent_score is not None:
+            self.margin = self.user_score - self.opponent_score
+        super().save(*args, **kwargs)
+
+class UserStats(models.Model):
+    """Running per-user totals, maintained on every saved match.
+
+    One row per (user, game_type) plus an ALL row holding the totals across
+    every game, so reading a profile never has to scan MatchHistory.
+    """
+    ALL_GAMES = 'ALL'
+    GAME_CHOICES = MatchHistory.GAME_CHOICES + ((ALL_GAMES, 'All games'),)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stats')
+    game_type = models.CharField(max_length=10, choices=GAME_CHOICES, default=ALL_GAMES)
+    games_played = models.PositiveIntegerField(default=0)
+    wins = models.PositiveIntegerField(default=0)
+    losses = models.PositiveIntegerField(default=0)
+    draws = models.PositiveIntegerField(default=0)
+    best_margin = models.IntegerField(null=True, blank=True)
+    best_score = models.CharField(max_length=10, default='0-0')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    RESULT_COUNTERS = {'WIN': 'wins', 'LOSS': 'losses', 'DRAW': 'draws'}
+
+    class Meta:
+        verbose_name_plural = 'User Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'game_type'], name='userstats_user_game_type_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.game_type}: {self.wins}/{self.games_played}"
+
+    @property
+    def win_rate(self):
+        return int((self.wins / self.games_played) * 100) if self.games_played > 0 else 0
+
+    @classmethod
+    def record_match(cls, match):
+        """Fold a newly saved match into the user's stats rows.
+
+        Must run inside the transaction that created the match; the rows are
+        locked so concurrent saves for the same user cannot lose updates.
+        """
+        counter = cls.RESULT_COUNTERS.get(match.result)
+        margin = match.margin if match.result == 'WIN' else None
+
+        for game_type in (match.game_type, cls.ALL_GAMES):
+            stats, _ = cls.objects.select_for_update().get_or_create(
+                user_id=match.user_id, game_type=game_type
+            )
+            updates = {'games_played': F('games_played') + 1, 'updated_at': timezone.now()}
+            if counter:
+                updates[counter] = F(counter) + 1
+            if margin is not None:
+                if stats.best_margin is None or margin > stats.best_margin:
+                    updates['best_margin'] = margin
+                    updates['best_score'] = match.score
+            cls.objects.filter(pk=stats.pk).update(**updates)
+
+class ExportJob(models.Model):
+    """A GDPR export built in the background by the run_export_jobs worker"""
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    archive_name = models.CharField(max_length=255, blank=True)  # Relative to EXPORT_ROOT
+    archive_size = models.BigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)  # Bumped by every claim; the latest claim owns the job
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='exportjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Export {self.id} for {self.user.username} - {self.status}"
+
+class OutboxEmail(models.Model):
+    """An email waiting for the send_queued_email worker"""
+    PENDING = 'PENDING'
+    SENDING = 'SENDING'
+    SENT = 'SENT'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    sensitive = models.BooleanField(default=False)  # body is encrypted; see userapp.outbox
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField()
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    send_after = models.DateTimeField(default=timezone.now)  # Pushed back after a failed attempt
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'send_after'], name='outbox_status_send_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} - {self.status}"
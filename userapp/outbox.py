@@ -0,0 +1,151 @@
+# userapp/outbox.py
+"""Queued email delivery.
+
+Views call queue_email(), which only inserts an OutboxEmail row, so a request
+never waits on the mail server. The send_queued_email worker claims pending
+rows in batches and sends each batch over a single SMTP connection from
+get_connection(), instead of the connect/EHLO/STARTTLS/AUTH round trips that
+every send_mail() call pays. Failed messages are retried with a backoff until
+EMAIL_OUTBOX_MAX_ATTEMPTS is reached.
+
+Bodies queued with sensitive=True (2FA codes) are stored encrypted with a
+key derived from SECRET_KEY and only decrypted by the worker. Sent emails
+are deleted by prune_outbox() after EMAIL_OUTBOX_KEEP_SENT seconds.
+"""
+import base64
+import datetime
+import logging
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+# A SENDING row older than this is assumed to belong to a worker that died
+CLAIM_TIMEOUT = datetime.timedelta(minutes=10)
+
+
+def _cipher():
+    key = salted_hmac('userapp.outbox', 'body', algorithm='sha256').digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def queue_email(subject, body, recipients, from_email=None, sensitive=False):
+    """Store an email for the worker; returns the OutboxEmail row.
+
+    Pass sensitive=True for bodies that must not sit in the database in
+    plaintext, such as login codes.
+    """
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=_cipher().encrypt(body.encode()).decode() if sensitive else body,
+        sensitive=sensitive,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def email_body(email):
+    """Plaintext body of an OutboxEmail"""
+    return _cipher().decrypt(email.body.encode()).decode() if email.sensitive else email.body
+
+
+def claim_batch(limit):
+    """Atomically move up to `limit` due emails to SENDING"""
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=OutboxEmail.PENDING, send_after__lte=now)
+                | Q(status=OutboxEmail.SENDING, claimed_at__lt=now - CLAIM_TIMEOUT)
+            )
+            .order_by('send_after', 'id')[:limit]
+        )
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            status=OutboxEmail.SENDING, claimed_at=now
+        )
+    return emails
+
+
+def send_batch(emails, connection):
+    """Send claimed emails over an open connection; returns the number sent"""
+    sent_ids = []
+    try:
+        for index, email in enumerate(emails):
+            try:
+                message = EmailMessage(
+                    email.subject, email_body(email), email.from_email, email.recipients, connection=connection
+                )
+                # One message per call so a bad address only fails its own row
+                connection.send_messages([message])
+            except Exception as e:
+                logger.warning(f"Failed to send email {email.id}: {str(e)}")
+                _record_failure(email, e)
+                # The server may have dropped us; continue on a fresh connection
+                connection.close()
+                try:
+                    connection.open()
+                except Exception as e:
+                    for unsent in emails[index + 1:]:
+                        _record_failure(unsent, e)
+                    raise
+            else:
+                sent_ids.append(email.id)
+    finally:
+        OutboxEmail.objects.filter(pk__in=sent_ids).update(status=OutboxEmail.SENT, sent_at=timezone.now())
+    return len(sent_ids)
+
+
+def _record_failure(email, error):
+    attempts = email.attempts + 1
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    if attempts >= max_attempts:
+        status, send_after = OutboxEmail.FAILED, email.send_after
+    else:
+        # 30s, 60s, 120s, ... between attempts
+        status = OutboxEmail.PENDING
+        send_after = timezone.now() + datetime.timedelta(seconds=30 * 2 ** (attempts - 1))
+    OutboxEmail.objects.filter(pk=email.pk).update(
+        status=status, attempts=attempts, last_error=str(error), send_after=send_after
+    )
+
+
+def deliver_outbox(batch_size=None):
+    """Send everything that is due over one connection; returns the number sent"""
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 100)
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0
+
+    sent = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+        while emails:
+            batch, emails = emails, []
+            sent += send_batch(batch, connection)
+            emails = claim_batch(batch_size)
+    except Exception as e:
+        # Could not (re)connect: hand the unsent rows back for a later attempt
+        logger.error(f"Email outbox delivery failed: {str(e)}")
+        for email in emails:
+            _record_failure(email, e)
+    finally:
+        connection.close()
+    return sent
+
+
+def prune_outbox():
+    """Delete emails sent more than EMAIL_OUTBOX_KEEP_SENT seconds ago; returns the number deleted"""
+    keep = getattr(settings, 'EMAIL_OUTBOX_KEEP_SENT', 24 * 60 * 60)
+    cutoff = timezone.now() - datetime.timedelta(seconds=keep)
+    deleted, _ = OutboxEmail.objects.filter(status=OutboxEmail.SENT, sent_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,49 @@
+# userapp/presence.py
+"""Online presence kept entirely in the cache.
+
+Clients send a heartbeat every PRESENCE_HEARTBEAT_INTERVAL seconds; each one
+refreshes a key that expires after PRESENCE_TTL, so a user who stops sending
+heartbeats drops to offline on their own. Nothing here touches the database.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+ONLINE = 'online'
+IN_GAME = 'in_game'
+OFFLINE = 'offline'
+PRESENCE_STATUSES = (ONLINE, IN_GAME)
+
+
+def presence_key(user_id):
+    return f"presence_{user_id}"
+
+
+def record_heartbeat(user_id, presence_status=ONLINE):
+    if presence_status not in PRESENCE_STATUSES:
+        raise ValueError(f"Unknown presence status: {presence_status}")
+    cache.set(
+        presence_key(user_id),
+        {'status': presence_status, 'last_seen': int(time.time())},
+        timeout=getattr(settings, 'PRESENCE_TTL', 60)
+    )
+
+
+def clear_presence(user_id):
+    cache.delete(presence_key(user_id))
+
+
+def get_presence_many(user_ids):
+    """Presence for many users with a single cache multi-get.
+
+    Returns {user_id: {'status': ..., 'last_seen': epoch seconds or None}};
+    users without a live heartbeat are reported offline.
+    """
+    user_ids = list(user_ids)
+    found = cache.get_many([presence_key(user_id) for user_id in user_ids])
+    presence = {}
+    for user_id in user_ids:
+        entry = found.get(presence_key(user_id))
+        presence[user_id] = entry or {'status': OFFLINE, 'last_seen': None}
+    return presence
@@ -0,0 +1,136 @@
+# userapp/ratelimit.py
+"""Cache-backed sliding-window rate limiting for the authentication views.
+
+Each (scope, key) pair keeps one counter per fixed window in the cache. The
+sliding-window estimate weights the previous window's count by how much of
+it still overlaps the last `window` seconds, which smooths out the burst a
+plain fixed window allows at its boundary while costing only two cache reads
+and one increment per request.
+
+rate_limited() checks the limits before the view runs, so a rejected request
+never reaches authenticate() and its password hashing.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+# scope -> {'ip' | 'account': (max requests, window in seconds)}
+DEFAULT_RATE_LIMITS = {
+    'login': {'ip': (20, 60), 'account': (5, 60)},
+    'verify_otp': {'ip': (20, 60), 'account': (5, 300)},
+    'register': {'ip': (5, 3600)},
+}
+
+
+def _counter_key(scope, kind, ident, index):
+    # Hash the identifier: emails can hold characters some cache backends reject
+    digest = hashlib.sha1(ident.encode()).hexdigest()
+    return f"ratelimit:{scope}:{kind}:{digest}:{index}"
+
+
+def check_rate(scope, kind, ident, limit, window, now=None):
+    """Count one request; returns 0 if allowed, else seconds until it would be"""
+    now = time.time() if now is None else now
+    index = int(now // window)
+    elapsed = now - index * window
+    current_key = _counter_key(scope, kind, ident, index)
+    previous_key = _counter_key(scope, kind, ident, index - 1)
+    counts = cache.get_many([current_key, previous_key])
+    current = counts.get(current_key, 0)
+    previous = counts.get(previous_key, 0)
+
+    if previous * (window - elapsed) / window + current < limit:
+        # Two windows of lifetime, so the next window can still weight this one
+        cache.add(current_key, 0, timeout=2 * window)
+        try:
+            cache.incr(current_key)
+            # db/file backends re-set the key with the default timeout on incr()
+            cache.touch(current_key, 2 * window)
+        except ValueError:
+            cache.set(current_key, 1, timeout=2 * window)
+        return 0
+
+    if current < limit:
+        # The previous window's share decays below the limit within this window
+        return max(1, math.floor(window * (previous - limit + current) / previous - elapsed) + 1)
+    # Otherwise wait for this window to end and its own share to decay
+    return max(1, math.floor(window - elapsed + window * (current - limit) / current) + 1)
+
+
+def client_ip(request):
+    """Address the per-IP limits count against.
+
+    Behind AUTH_RATE_LIMIT_TRUSTED_PROXIES proxies, each appends the address
+    it received the request from to X-Forwarded-For, so the client is the
+    entry that many hops from the right. Anything further left came from the
+    client itself and could be rotated to dodge the limits.
+    """
+    if getattr(settings, 'AUTH_RATE_LIMIT_TRUST_X_FORWARDED_FOR', False):
+        proxies = getattr(settings, 'AUTH_RATE_LIMIT_TRUSTED_PROXIES', 1)
+        forwarded = [entry.strip() for entry in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        if proxies > 0 and len(forwarded) >= proxies and forwarded[-proxies]:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _account(request):
+    """The email/username the request is trying to use, if any"""
+    try:
+        data = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    account = data.get('email') or data.get('username')
+    return str(account).strip().lower() if account else None
+
+
+def _rejection(request, scope):
+    """A 429 response if any of the scope's limits is exhausted, else None"""
+    limits = getattr(settings, 'AUTH_RATE_LIMITS', DEFAULT_RATE_LIMITS).get(scope, {})
+    idents = {'ip': client_ip, 'account': _account}
+    for kind, (limit, window) in limits.items():
+        ident = idents[kind](request)
+        if not ident:
+            continue
+        retry_after = check_rate(scope, kind, ident, limit, window)
+        if retry_after:
+            response = JsonResponse({
+                'status': 'error',
+                'message': 'Too many attempts. Please try again later.'
+            }, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+    return None
+
+
+def rate_limited(scope):
+    """Reject POSTs over the AUTH_RATE_LIMITS budget for `scope` with a 429"""
+    def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method == 'POST':
+                    response = await sync_to_async(_rejection)(request, scope)
+                    if response is not None:
+                        return response
+                return await view_func(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method == 'POST':
+                response = _rejection(request, scope)
+                if response is not None:
+                    return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
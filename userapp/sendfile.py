@@ -0,0 +1,85 @@
+# userapp/sendfile.py
+"""Hand file bodies to the front proxy instead of streaming them from Python.
+
+With SENDFILE_BACKEND = 'nginx', send_file() answers with an empty response
+carrying X-Accel-Redirect; nginx then serves the bytes from an internal
+location aliased to MEDIA_ROOT (see nginx/basta.conf). 'xsendfile' does the
+same with the X-Sendfile header understood by Apache (mod_xsendfile) and
+lighttpd. Django still authorizes the request, resolves the file and sets
+the caching headers; the worker is free as soon as the headers are out.
+Left empty (the default, e.g. under runserver), files are streamed with
+FileResponse as before.
+
+/media/ only ever serves images: MEDIA_ROOT holds nothing else, and a
+stray HTML or SVG file served from this origin could run script.
+"""
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.views import static
+
+from .avatars import AVATAR_ROOT, THUMBNAIL_ROOT
+
+# Extension -> content type of everything /media/ may serve
+MEDIA_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+}
+
+
+def _offload_header(name, storage):
+    backend = getattr(settings, 'SENDFILE_BACKEND', '')
+    if not backend:
+        return None
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        # Remote storage: nothing on disk for the proxy to serve
+        return None
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    if backend == 'nginx':
+        prefix = getattr(settings, 'SENDFILE_URL_PREFIX', '/protected-media/')
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        return 'X-Accel-Redirect', prefix + quote(relative)
+    if backend == 'xsendfile':
+        return 'X-Sendfile', path
+    raise ValueError(f"Unknown SENDFILE_BACKEND {backend!r}")
+
+
+def send_file(name, content_type, storage=default_storage):
+    """Response for a stored file; raises FileNotFoundError if it is missing"""
+    header = _offload_header(name, storage)
+    if header is None:
+        return FileResponse(storage.open(name, 'rb'), content_type=content_type)
+    response = HttpResponse(content_type=content_type)
+    response[header[0]] = header[1]
+    return response
+
+
+def serve_media(request, path):
+    """/media/ in development, or behind a proxy that offloads to this app"""
+    content_type = MEDIA_TYPES.get(os.path.splitext(path)[1].lower())
+    if content_type is None:
+        raise Http404('File not found')
+    if not getattr(settings, 'SENDFILE_BACKEND', ''):
+        if not settings.DEBUG:
+            raise Http404('Media is served by the web server')
+        response = static.serve(request, path, document_root=settings.MEDIA_ROOT)
+        response['Content-Type'] = content_type
+    else:
+        try:
+            response = send_file(path, content_type)
+        except FileNotFoundError:
+            raise Http404('File not found')
+    if path.startswith((AVATAR_ROOT + '/', THUMBNAIL_ROOT + '/')):
+        # Named by content hash: the bytes behind this URL never change
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -0,0 +1,31 @@
+# userapp/sessions.py
+"""Session engine: cached_db reads with throttled writes.
+
+With SESSION_SAVE_EVERY_REQUEST the stock engines write the session on every
+request just to slide its expiry forward. This store skips that write unless
+the session data changed or SESSION_WRITE_INTERVAL minutes have passed since
+it was last persisted, so an active session costs one write per interval
+instead of one per request. The stored expiry can therefore lag the cookie by
+at most the interval, which is small next to SESSION_COOKIE_AGE.
+
+Enable with SESSION_ENGINE = 'userapp.sessions'.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+SAVED_AT_KEY = '_session_saved_at'
+
+
+class SessionStore(CachedDBStore):
+    def save(self, must_create=False):
+        if not must_create and not self.modified and not self._write_due():
+            return
+        self._get_session()[SAVED_AT_KEY] = int(time.time())
+        super().save(must_create)
+
+    def _write_due(self):
+        saved_at = self._get_session().get(SAVED_AT_KEY)
+        interval = getattr(settings, 'SESSION_WRITE_INTERVAL', 5) * 60
+        return saved_at is None or time.time() - saved_at >= interval
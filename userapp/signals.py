@@ -0,0 +1,25 @@
+# userapp/signals.py
+"""Cleanup after a user is deleted.
+
+Receivers run for every path that deletes users (delete_account,
+delete_inactive_users, the admin), so none of them can forget a step.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .avatars import delete_unreferenced_avatar, forget_avatar_meta
+from .models import User
+
+
+@receiver(post_delete, sender=User)
+def erase_avatar(sender, instance, **kwargs):
+    """Stop serving a deleted user's avatar and delete the files no one else uses"""
+    user_id, name, digest = instance.pk, instance.profile_picture.name, instance.avatar_hash
+
+    def erase():
+        # After the commit: until then avatar_meta() could cache the row again
+        forget_avatar_meta(user_id)
+        delete_unreferenced_avatar(name, digest)
+
+    transaction.on_commit(erase)
@@ -0,0 +1,49 @@
+# userapp/suggestions.py
+"""'People you may know': friends of friends ranked by mutual-friend count"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import User, friend_suggestions_cache_key
+
+SUGGESTIONS_MAX = 50
+
+
+def compute_friend_suggestions(user_id, limit=SUGGESTIONS_MAX):
+    """One aggregate over the friends through table.
+
+    Every row (my_friend -> candidate) where my_friend is in my friend list
+    counts as one mutual friend for the candidate. Existing friends, the
+    user themselves and superusers are excluded.
+    """
+    Through = User.friends.through
+    my_friends = Through.objects.filter(from_user_id=user_id).values('to_user_id')
+
+    ranked = (
+        Through.objects.filter(from_user_id__in=my_friends)
+        .exclude(to_user_id=user_id)
+        .exclude(to_user_id__in=my_friends)
+        .filter(to_user__is_superuser=False, to_user__is_active=True)
+        .values('to_user_id', 'to_user__username', 'to_user__display_name')
+        .annotate(mutual_friends=Count('from_user_id'))
+        .order_by('-mutual_friends', 'to_user_id')[:limit]
+    )
+    return [
+        {
+            'id': row['to_user_id'],
+            'username': row['to_user__username'],
+            'display_name': row['to_user__display_name'] or row['to_user__username'],
+            'mutual_friends': row['mutual_friends'],
+        }
+        for row in ranked
+    ]
+
+
+def get_friend_suggestions(user_id, limit=SUGGESTIONS_MAX):
+    """Cached wrapper; the cache entry is dropped whenever the user's friend list changes"""
+    key = friend_suggestions_cache_key(user_id)
+    suggestions = cache.get(key)
+    if suggestions is None:
+        suggestions = compute_friend_suggestions(user_id)
+        cache.set(key, suggestions, timeout=getattr(settings, 'FRIEND_SUGGESTIONS_CACHE_TTL', 600))
+    return suggestions[:limit]
@@ -1,3 +1,1531 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+import socketserver
+import tarfile
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.handlers.base import BaseHandler
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+from userapp import activity, fortytwo
+from userapp.activity import record_activity, flush_activity
+from userapp.auth_state import cache as auth_cache, consume_oauth_state, consume_otp, issue_oauth_state, issue_otp
+from userapp.authentication import tokens_for_user, validated_token_cache
+from userapp.avatars import AVATAR_FORMATS, avatar_name, avatar_sizes, negotiate_format, store_avatar, thumbnail_name
+from userapp.export import run_export_job
+from userapp.hashing import get_pool, shutdown_pool
+from userapp.intra_avatars import import_intra_avatar
+from userapp.management.commands.delete_orphaned_media import CURSOR_KEY as ORPHAN_CURSOR_KEY
+from userapp.management.commands.delete_orphaned_media import Command as DeleteOrphanedMedia
+from userapp.models import User, MatchHistory, UserStats, ExportJob, OutboxEmail, friend_suggestions_cache_key
+from userapp.outbox import deliver_outbox, email_body, prune_outbox, queue_email
+from userapp.presence import record_heartbeat
+from userapp.ratelimit import check_rate, client_ip
+from userapp.sessions import SAVED_AT_KEY, SessionStore
+from userapp.uploads import AvatarUploadHandler
+from userapp.utils import VerifiedTokenCache, encode_cursor
 
-# Create your tests here.
+
+# The suite runs on the default (locmem) cache; this is for tests of code that must
+# also work with the database cache, e.g. sync cache calls from async views
+DATABASE_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'django_cache'},
+    'auth': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'django_cache_auth'},
+}
+
+
+class UserStatsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='player', email='player@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def save_match(self, game_type, result, score):
+        response = self.client.post('/api/auth/save-match/', {
+            'game_type': game_type,
+            'opponent': 'AI',
+            'result': result,
+            'score': score,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_save_match_updates_stats(self):
+        self.save_match('PONG', 'WIN', '5-1')
+        self.save_match('PONG', 'WIN', '5-4')
+        self.save_match('PONG', 'LOSS', '2-5')
+        self.save_match('TICTACTOE', 'DRAW', '0-0')
+
+        totals = UserStats.objects.get(user=self.user, game_type=UserStats.ALL_GAMES)
+        self.assertEqual((totals.games_played, totals.wins, totals.losses, totals.draws), (4, 2, 1, 1))
+        self.assertEqual(totals.best_score, '5-1')
+
+        pong = UserStats.objects.get(user=self.user, game_type='PONG')
+        self.assertEqual(pong.games_played, 3)
+        self.assertEqual(pong.best_margin, 4)
+
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.data['stats'], {'games_played': 4, 'win_rate': '50%', 'best_score': '5-1'})
+        self.assertEqual(response.data['stats_by_game']['TICTACTOE']['draws'], 1)
+
+    def test_rebuild_matches_incremental_stats(self):
+        self.save_match('PONG', 'WIN', '3-0')
+        self.save_match('TICTACTOE', 'WIN', '1-0')
+        self.save_match('PONG', 'LOSS', '1-3')
+        expected = {s.game_type: (s.games_played, s.wins, s.losses, s.draws, s.best_score)
+                    for s in UserStats.objects.filter(user=self.user)}
+
+        UserStats.objects.all().delete()
+        call_command('rebuild_user_stats', stdout=StringIO())
+
+        rebuilt = {s.game_type: (s.games_played, s.wins, s.losses, s.draws, s.best_score)
+                   for s in UserStats.objects.filter(user=self.user)}
+        self.assertEqual(rebuilt, expected)
+        self.assertEqual(MatchHistory.objects.filter(user=self.user).count(), 3)
+
+
+class MatchScoreColumnsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='scorer', email='scorer@example.com', password='pass12345')
+        for result, score in [('WIN', '5-2'), ('WIN', '7-1'), ('LOSS', '3-5'), ('DRAW', 'n/a')]:
+            MatchHistory.objects.create(user=self.user, game_type='PONG', opponent='AI', result=result, score=score)
+
+    def test_score_columns_are_derived_from_score(self):
+        match = MatchHistory.objects.get(user=self.user, score='7-1')
+        self.assertEqual((match.user_score, match.opponent_score, match.margin), (7, 1, 6))
+        unparsed = MatchHistory.objects.get(user=self.user, result='DRAW')
+        self.assertIsNone(unparsed.margin)
+
+    def test_aggregate_queries(self):
+        matches = MatchHistory.objects.filter(user=self.user)
+        self.assertEqual(matches.best_win().score, '7-1')
+        self.assertAlmostEqual(matches.average_margin(), (3 + 6 - 2) / 3)
+        self.assertEqual(len(matches.score_histogram()), 3)
+
+
+class MatchHistoryPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pager', email='pager@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(25):
+            MatchHistory.objects.create(
+                user=self.user, game_type='PONG' if i % 2 else 'TICTACTOE', opponent='AI',
+                result='WIN' if i % 3 else 'LOSS', score=f'{i}-0'
+            )
+
+    def fetch_all(self, **params):
+        seen, cursor = [], None
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            response = self.client.get('/api/auth/match-history/', query)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(m['id'] for m in response.data['match_history'])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                return seen
+
+    def test_pages_cover_history_without_duplicates(self):
+        ids = self.fetch_all(limit=7)
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+
+    def test_ties_on_date_played(self):
+        MatchHistory.objects.filter(user=self.user).update(date_played=timezone.now())
+        ids = self.fetch_all(limit=4)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(set(ids)), 25)
+
+        cursor = encode_cursor(timezone.now(), ids[3])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/auth/match-history/', {'cursor': cursor})
+        sql = next(q['sql'] for q in queries.captured_queries if 'userapp_matchhistory' in q['sql'])
+        self.assertIn('"date_played" <=', sql)  # A range bound, not only an OR
+
+    def test_filters(self):
+        ids = self.fetch_all(limit=4, game_type='pong', result='WIN')
+        expected = MatchHistory.objects.filter(user=self.user, game_type='PONG', result='WIN').count()
+        self.assertEqual(len(ids), expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/auth/match-history/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportUserDataTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', email='exporter@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(5):
+            MatchHistory.objects.create(user=self.user, game_type='PONG', opponent='AI',
+                                        result='WIN' if i % 2 else 'LOSS', score=f'{i}-2')
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_json_export_is_a_complete_document(self):
+        data = json.loads(self.read(self.client.get('/api/auth/export-data/')))
+        self.assertEqual(data['user_information']['username'], 'exporter')
+        self.assertEqual(data['statistics']['games_played'], 5)
+        self.assertEqual(data['statistics']['wins'], 2)
+        self.assertEqual(len(data['match_history']), 5)
+        self.assertIn('export_date', data)
+
+    def test_ndjson_and_csv_exports(self):
+        lines = self.read(self.client.get('/api/auth/export-data/', {'format': 'ndjson'})).splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['opponent'], 'AI')
+
+        rows = list(csv.reader(io.StringIO(self.read(self.client.get('/api/auth/export-data/', {'format': 'csv'})))))
+        self.assertEqual(rows[0][0], 'id')
+        self.assertEqual(len(rows), 6)
+
+    def test_format_is_negotiated(self):
+        response = self.client.get('/api/auth/export-data/', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(self.read(response).splitlines()[0].split(',')[0], 'id')
+        # Unknown formats never reach the view
+        self.assertEqual(self.client.get('/api/auth/export-data/', {'format': 'xml'}).status_code, 404)
+
+
+class ExportJobTestCase(TransactionTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.export_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, EXPORT_ROOT=self.export_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user(username='archiver', email='archiver@example.com', password='pass12345')
+        self.user.profile_picture.save('avatar.png', ContentFile(b'\x89PNG fake image'), save=True)
+        MatchHistory.objects.create(user=self.user, game_type='PONG', opponent='AI', result='WIN', score='5-3')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_job_lifecycle(self):
+        response = self.client.post('/api/auth/export-data/jobs/')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['job_id']
+
+        # A second request while the first is queued reuses the same job
+        self.assertEqual(self.client.post('/api/auth/export-data/jobs/').data['job_id'], job_id)
+        self.assertEqual(self.client.get(f'/api/auth/export-data/jobs/{job_id}/download/').status_code, 409)
+
+        call_command('run_export_jobs', '--once', '--workers', '2', stdout=StringIO(), stderr=StringIO())
+
+        status = self.client.get(f'/api/auth/export-data/jobs/{job_id}/')
+        self.assertEqual(status.data['status'], ExportJob.DONE)
+
+        response = self.client.get(status.data['download_url'])
+        self.assertEqual(response.status_code, 200)
+        archive = io.BytesIO(b''.join(response.streaming_content))
+        with tarfile.open(fileobj=archive, mode='r:gz') as tar:
+            names = tar.getnames()
+            self.assertIn('user_data.json', names)
+            self.assertIn('match_history.csv', names)
+            self.assertTrue(any(name.startswith('avatar/') for name in names))
+            data = json.load(tar.extractfile('user_data.json'))
+        self.assertEqual(data['statistics']['games_played'], 1)
+
+    def test_abandoned_running_job_is_reclaimed(self):
+        stale = ExportJob.objects.create(
+            user=self.user, status=ExportJob.RUNNING, started_at=timezone.now() - timedelta(hours=2)
+        )
+        other = User.objects.create_user(username='busy', email='busy@example.com')
+        busy = ExportJob.objects.create(user=other, status=ExportJob.RUNNING, started_at=timezone.now())
+
+        call_command('run_export_jobs', '--once', stdout=StringIO(), stderr=StringIO())
+        stale.refresh_from_db()
+        busy.refresh_from_db()
+        self.assertEqual((stale.status, stale.attempts), (ExportJob.DONE, 1))
+        self.assertEqual(busy.status, ExportJob.RUNNING)
+
+    def test_reclaimed_attempt_is_discarded(self):
+        job = ExportJob.objects.create(user=self.user, status=ExportJob.RUNNING, attempts=1)
+        first = ExportJob.objects.select_related('user').get(pk=job.pk)
+        # Reclaimed while the first worker is still building
+        ExportJob.objects.filter(pk=job.pk).update(attempts=2)
+        second = ExportJob.objects.select_related('user').get(pk=job.pk)
+
+        self.assertFalse(run_export_job(first))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.RUNNING)
+        self.assertEqual(os.listdir(self.export_root), [])
+
+        self.assertTrue(run_export_job(second))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.DONE)
+        self.assertEqual(os.listdir(self.export_root), [f'{job.id}.tar.gz'])
+
+    def test_jobs_are_private(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='pass12345')
+        job = ExportJob.objects.create(user=other)
+        self.assertEqual(self.client.get(f'/api/auth/export-data/jobs/{job.id}/').status_code, 404)
+
+
+class UserDirectoryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='me', email='me@example.com', password='pass12345')
+        self.others = [
+            User.objects.create_user(username=f'user{i:02d}', email=f'user{i}@example.com')
+            for i in range(12)
+        ]
+        User.objects.filter(pk=self.others[3].pk).update(display_name='Zed')
+        self.user.friends.add(self.others[0], self.others[5])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pagination_and_friend_flags(self):
+        seen, friends, cursor = [], set(), None
+        while True:
+            response = self.client.get('/api/auth/users/', {'limit': 5, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            for user in response.data['users']:
+                seen.append(user['username'])
+                if user['is_friend']:
+                    friends.add(user['id'])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, sorted(u.username for u in self.others))
+        self.assertEqual(friends, {self.others[0].id, self.others[5].id})
+
+    def test_prefix_search(self):
+        response = self.client.get('/api/auth/users/', {'q': 'user1'})
+        self.assertEqual([u['username'] for u in response.data['users']], ['user10', 'user11'])
+        response = self.client.get('/api/auth/users/', {'q': 'ze'})
+        self.assertEqual([u['display_name'] for u in response.data['users']], ['Zed'])
+
+
+class FriendsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='social', email='social@example.com')
+        self.others = [User.objects.create_user(username=f'pal{i}', email=f'pal{i}@example.com') for i in range(4)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_single_add_and_remove(self):
+        friend = self.others[0]
+        self.assertTrue(self.user.add_friend(friend))
+        self.assertFalse(self.user.add_friend(friend))
+        self.assertFalse(self.user.add_friend(self.user))
+        self.assertTrue(self.user.remove_friend(friend))
+        self.assertFalse(self.user.remove_friend(friend))
+
+    def test_bulk_endpoint(self):
+        self.user.friends.add(self.others[0], self.others[1])
+        response = self.client.post('/api/auth/friends/bulk/', {
+            'add': [self.others[1].id, self.others[2].id, self.others[3].id, self.user.id, 999999],
+            'remove': [self.others[0].id],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['added'], [self.others[2].id, self.others[3].id])
+        self.assertEqual(response.data['removed'], [self.others[0].id])
+        self.assertEqual(
+            set(self.user.friends.values_list('id', flat=True)),
+            {self.others[1].id, self.others[2].id, self.others[3].id}
+        )
+
+    def test_bulk_endpoint_rejects_bad_ids(self):
+        response = self.client.post('/api/auth/friends/bulk/', {'add': ['abc']}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class FriendSuggestionsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me, self.a, self.b, self.c, self.d = [
+            User.objects.create_user(username=name, email=f'{name}@example.com')
+            for name in ('me', 'alice', 'bob', 'carol', 'dave')
+        ]
+        self.me.friends.add(self.a, self.b)
+        self.a.friends.add(self.c, self.d, self.me)
+        self.b.friends.add(self.c)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_ranked_by_mutual_friends(self):
+        response = self.client.get('/api/auth/friends/suggestions/')
+        self.assertEqual(response.status_code, 200)
+        ranked = [(s['username'], s['mutual_friends']) for s in response.data['suggestions']]
+        self.assertEqual(ranked, [('carol', 2), ('dave', 1)])
+
+    def test_cache_is_invalidated_by_friend_changes(self):
+        self.client.get('/api/auth/friends/suggestions/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.me.add_friend(self.c)
+            # Not before the commit, or a concurrent read could cache the old list again
+            self.assertIsNotNone(cache.get(friend_suggestions_cache_key(self.me.pk)))
+        response = self.client.get('/api/auth/friends/suggestions/')
+        self.assertEqual([s['username'] for s in response.data['suggestions']], ['dave'])
+
+    def test_benchmark_command_runs(self):
+        out = StringIO()
+        call_command('benchmark_friend_suggestions', users=50, friends=5, samples=5, stdout=out)
+        self.assertIn('Cached', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='bench_').exists())
+
+
+class PresenceTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='online', email='online@example.com')
+        self.friend = User.objects.create_user(username='gamer', email='gamer@example.com')
+        self.idle = User.objects.create_user(username='idle', email='idle@example.com')
+        self.user.friends.add(self.friend, self.idle)
+
+    def bearer(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def test_heartbeat_does_not_query_the_database(self):
+        client = self.bearer(self.friend)
+        with self.assertNumQueries(0):
+            response = client.post('/api/auth/presence/heartbeat/', {'status': 'in_game'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_friends_list_includes_presence(self):
+        self.bearer(self.friend).post('/api/auth/presence/heartbeat/', {'status': 'in_game'}, format='json')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        friends = {f['username']: f['status'] for f in client.get('/api/auth/friends/').data['friends']}
+        self.assertEqual(friends, {'gamer': 'in_game', 'idle': 'offline'})
+
+    def test_lookup_only_answers_for_friends(self):
+        stranger = User.objects.create_user(username='stranger', email='stranger@example.com')
+        self.bearer(stranger).post('/api/auth/presence/heartbeat/', {'status': 'online'}, format='json')
+        self.bearer(self.friend).post('/api/auth/presence/heartbeat/', {'status': 'in_game'}, format='json')
+
+        ids = ','.join(str(user.id) for user in (self.friend, self.idle, stranger))
+        presence = self.bearer(self.user).get('/api/auth/presence/', {'ids': ids}).data['presence']
+        self.assertEqual(set(presence), {str(self.friend.id), str(self.idle.id)})
+        self.assertEqual(presence[str(self.friend.id)]['status'], 'in_game')
+        # Friendship is one-way here: the stranger never added anyone, and only sees themselves
+        presence = self.bearer(stranger).get('/api/auth/presence/', {'ids': ids}).data['presence']
+        self.assertEqual(set(presence), {str(stranger.id)})
+
+    def test_rejects_unknown_status(self):
+        response = self.bearer(self.user).post('/api/auth/presence/heartbeat/', {'status': 'away'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ACTIVITY_BACKGROUND_FLUSH=False)
+class ActivityWriteBehindTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        old = timezone.now() - timedelta(days=365)
+        self.user = User.objects.create_user(username='active', email='active@example.com')
+        self.other = User.objects.create_user(username='other', email='other@example.com')
+        User.objects.update(last_activity=old)
+
+    def test_activity_is_buffered_then_flushed_in_bulk(self):
+        now = timezone.now()
+        with self.assertNumQueries(0):
+            self.assertTrue(record_activity(self.user.pk, now))
+            self.assertFalse(record_activity(self.user.pk, now))  # Same window
+            self.assertTrue(record_activity(self.other.pk, now))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(flush_activity(), 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_activity, now)
+        self.assertEqual(flush_activity(), 0)
+
+    def test_flush_never_moves_activity_backwards(self):
+        now = timezone.now()
+        User.objects.filter(pk=self.user.pk).update(last_activity=now)
+        record_activity(self.user.pk, now - timedelta(hours=1))
+        flush_activity()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_activity, now)
+
+    def test_each_process_appends_to_its_own_slot(self):
+        now = timezone.now()
+        with mock.patch.object(cache, 'incr', side_effect=AssertionError('not atomic on every backend')):
+            record_activity(self.user.pk, now)
+            first = activity._slot
+            with mock.patch.object(activity, '_slot', None):
+                # Another process, writing at the same time
+                record_activity(self.other.pk, now)
+                second = activity._slot
+        self.assertNotEqual(first['slot'], second['slot'])
+        self.assertEqual(cache.get(activity._entry_key(second['slot'], 1)), (self.other.pk, now.timestamp()))
+
+        self.assertEqual(flush_activity(), 2)
+        self.assertEqual(User.objects.filter(last_activity=now).count(), 2)
+
+        # A slot given up by an idle process is taken over with its numbering
+        cache.delete_many([activity._owner_key(second['slot']), activity._seen_key(self.other.pk)])
+        with mock.patch.object(activity, '_slot', None):
+            record_activity(self.other.pk, now + timedelta(hours=1))
+            self.assertEqual((activity._slot['slot'], activity._slot['head']), (second['slot'], 2))
+        self.assertEqual(flush_activity(), 1)
+
+    @override_settings(ACTIVITY_BACKGROUND_FLUSH=True)
+    def test_exit_flush_only_in_serving_processes(self):
+        with mock.patch.object(activity, '_flusher_pid', None), \
+                mock.patch.object(activity, '_flush_loop'), \
+                mock.patch.object(activity.atexit, 'register') as register:
+            activity._ensure_flusher()
+            register.assert_not_called()
+            with mock.patch.object(activity, '_flush_at_exit', False):
+                activity.flush_at_exit()
+                activity._flusher_pid = None
+                activity._ensure_flusher()
+            register.assert_called_once_with(activity._flush_quietly)
+
+    def test_cleanup_sees_buffered_activity(self):
+        record_activity(self.user.pk)
+        call_command('delete_inactive_users', stdout=StringIO())
+        self.assertTrue(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(User.objects.filter(pk=self.other.pk).exists())
+
+
+def _stub_jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (300, 300), 'orange').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class StubIntraHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for api.intra.42.fr and its image CDN"""
+    mode = 'ok'
+    image = _stub_jpeg()
+    image_etag = '"v1"'
+    image_requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status_code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.mode == 'down':
+            return self._send(503, {'error': 'maintenance'})
+        self._send(200, {'access_token': 'stub-token'})
+
+    def do_GET(self):
+        if self.path.startswith('/images/'):
+            return self._send_image()
+        if self.mode == 'slow':
+            time.sleep(0.5)
+        if self.headers.get('Authorization') != 'Bearer stub-token':
+            return self._send(401, {'error': 'unauthorized'})
+        host, port = self.server.server_address
+        self._send(200, {
+            'id': 4242, 'login': 'stubber', 'email': 'stubber@student.42.fr',
+            'image': {'link': f'http://{host}:{port}/images/stubber.jpg', 'versions': {}},
+        })
+
+    def _send_image(self):
+        StubIntraHandler.image_requests.append(self.headers.get('If-None-Match'))
+        if self.mode == 'cdn_down':
+            return self._send(500, {'error': 'cdn down'})
+        if self.headers.get('If-None-Match') == self.image_etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('ETag', self.image_etag)
+        self.send_header('Content-Length', str(len(self.image)))
+        self.end_headers()
+        self.wfile.write(self.image)
+
+
+class StubIntraServerMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubIntraHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubIntraHandler.mode = 'ok'
+        self.addCleanup(fortytwo.reset_client)
+
+
+class FortyTwoClientTestCase(StubIntraServerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Picture imports are covered by IntraAvatarImportTestCase
+        patcher = mock.patch('userapp.views.schedule_intra_avatar')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_client(self, **kwargs):
+        kwargs.setdefault('timeout', (1, 1))
+        return fortytwo.FortyTwoClient(base_url=self.base_url, retries=0, **kwargs)
+
+    def test_get_token_view_uses_client(self):
+        with override_settings(FORTYTWO_API_BASE_URL=self.base_url):
+            fortytwo.reset_client()
+            response = self.client.post(
+                '/api/auth/get-token/', {'code': 'abc', 'state': issue_oauth_state()}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.filter(email='stubber@student.42.fr', is_42_user=True).exists())
+
+    def test_read_timeout(self):
+        StubIntraHandler.mode = 'slow'
+        client = self.make_client(timeout=(1, 0.1))
+        with self.assertRaises(fortytwo.FortyTwoUnavailable):
+            client.get_me('stub-token')
+
+    def test_circuit_breaker_opens_and_recovers(self):
+        breaker = fortytwo.CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+        client = self.make_client(breaker=breaker)
+        StubIntraHandler.mode = 'down'
+        for _ in range(2):
+            with self.assertRaises(fortytwo.FortyTwoAPIError):
+                client.exchange_code('abc', 'https://localhost/home')
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(fortytwo.FortyTwoUnavailable):
+            client.exchange_code('abc', 'https://localhost/home')
+
+        StubIntraHandler.mode = 'ok'
+        time.sleep(0.25)
+        self.assertEqual(client.exchange_code('abc', 'https://localhost/home')['access_token'], 'stub-token')
+        self.assertFalse(breaker.is_open)
+
+
+@override_settings(CACHES=DATABASE_CACHES)
+class AsyncOAuthStateTestCase(StubIntraServerMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command('createcachetable', verbosity=0)
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('userapp.views.schedule_intra_avatar')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_async_get_token_view(self):
+        with override_settings(FORTYTWO_API_BASE_URL=self.base_url):
+            fortytwo.reset_client()
+            for body in ({'code': 'abc'}, {'code': 'abc', 'state': 'forged'}):
+                response = await self.async_client.post(
+                    '/api/auth/async/get-token/', body, content_type='application/json'
+                )
+                self.assertEqual(response.status_code, 400)
+            # A sync cache call from async code would raise SynchronousOnlyOperation on this backend
+            state = await sync_to_async(issue_oauth_state)()
+            response = await self.async_client.post(
+                '/api/auth/async/get-token/', {'code': 'abc', 'state': state}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access_token', json.loads(response.content))
+        self.assertTrue(await User.objects.filter(email='stubber@student.42.fr', is_42_user=True).aexists())
+
+    async def test_async_oauth_callback_requires_state(self):
+        with override_settings(FORTYTWO_API_BASE_URL=self.base_url):
+            fortytwo.reset_client()
+            response = await self.async_client.get('/api/auth/async/oauth_callback/', {'code': 'abc'})
+            self.assertEqual(response['Location'], 'https://localhost:443/login')
+            state = await sync_to_async(issue_oauth_state)()
+            response = await self.async_client.get('/api/auth/async/oauth_callback/', {'code': 'abc', 'state': state})
+        self.assertEqual(response['Location'], 'https://localhost:443/home')
+        self.assertIn('jwt_token', response.cookies)
+
+
+@override_settings(INTRA_AVATAR_BACKGROUND=False)
+class IntraAvatarImportTestCase(StubIntraServerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name, FORTYTWO_API_BASE_URL=self.base_url)
+        override.enable()
+        self.addCleanup(override.disable)
+        fortytwo.reset_client()
+        cache.clear()
+        StubIntraHandler.image_requests = []
+
+    def login(self):
+        response = self.client.post(
+            '/api/auth/get-token/', {'code': 'abc', 'state': issue_oauth_state()}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return User.objects.get(email='stubber@student.42.fr')
+
+    def test_login_imports_and_revalidates_picture(self):
+        user = self.login()
+        self.assertEqual(user.profile_picture.name, avatar_name(user.avatar_hash, 'jpg'))
+        self.assertEqual((user.intra_image_etag, user.intra_image_hash), ('"v1"', user.avatar_hash))
+        self.assertTrue(default_storage.exists(thumbnail_name(user.avatar_hash, 64, 'webp')))
+
+        self.login()  # Checked recently: no request at all
+        self.assertEqual(StubIntraHandler.image_requests, [None])
+
+        cache.clear()
+        self.assertEqual(self.login().avatar_hash, user.avatar_hash)
+        self.assertEqual(StubIntraHandler.image_requests, [None, '"v1"'])  # Answered 304
+
+    def test_failed_download_is_retried_on_next_login(self):
+        StubIntraHandler.mode = 'cdn_down'
+        self.assertFalse(self.login().profile_picture)
+        StubIntraHandler.mode = 'ok'
+        user = self.login()
+        self.assertEqual(user.intra_image_etag, '"v1"')
+        self.assertEqual(StubIntraHandler.image_requests, [None, None])
+
+    def test_own_upload_is_kept(self):
+        user = self.login()
+        client = APIClient()
+        client.force_authenticate(user)
+        upload = SimpleUploadedFile('me.png', self.png(), content_type='image/png')
+        client.put('/api/auth/profile/avatar/', {'avatar': upload}, format='multipart')
+        user.refresh_from_db()
+        own = user.profile_picture.name
+
+        self.assertFalse(import_intra_avatar(user.id, f'{self.base_url}/images/stubber.jpg'))
+        user.refresh_from_db()
+        self.assertEqual(user.profile_picture.name, own)
+        self.assertEqual(len(StubIntraHandler.image_requests), 1)
+
+    def test_legacy_upload_is_kept(self):
+        # Uploaded before fingerprinting: avatar_hash and intra_image_hash both ''
+        user = User.objects.create_user(username='legacy', email='legacy@example.com')
+        user.profile_picture.name = default_storage.save('profile_pictures/legacy.png', ContentFile(self.png()))
+        user.save()
+
+        self.assertFalse(import_intra_avatar(user.id, f'{self.base_url}/images/stubber.jpg'))
+        user.refresh_from_db()
+        self.assertEqual(user.profile_picture.name, 'profile_pictures/legacy.png')
+        self.assertEqual(StubIntraHandler.image_requests, [])
+
+    @override_settings(INTRA_AVATAR_BACKGROUND=True)
+    def test_download_never_blocks_login(self):
+        with mock.patch('userapp.intra_avatars.get_executor') as get_executor:
+            user = self.login()
+        get_executor.return_value.submit.assert_called_once()
+        self.assertEqual(get_executor.return_value.submit.call_args.args[1:], (user.id, f'{self.base_url}/images/stubber.jpg'))
+        self.assertFalse(user.profile_picture)
+        self.assertEqual(StubIntraHandler.image_requests, [])
+
+    def png(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (50, 50), 'teal').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+
+class CountingEmailBackend(LocmemEmailBackend):
+    """locmem backend that counts how many connections were opened"""
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return super().open()
+
+
+class FailingEmailBackend(LocmemEmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionError('smtp down')
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for Django's backend; keeps every message it is sent"""
+    connections = 0
+    messages = []
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        SMTPSinkHandler.connections += 1
+        self.reply('220 sink ESMTP')
+        for line in iter(self.rfile.readline, b''):
+            command = line.strip().upper()
+            if command == b'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in iter(self.rfile.readline, b''):
+                    if data_line == b'.\r\n':
+                        break
+                    data.append(data_line)
+                SMTPSinkHandler.messages.append(b''.join(data))
+                self.reply('250 Queued')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                # EHLO, MAIL FROM, RCPT TO, RSET, NOOP
+                self.reply('250 OK')
+
+
+class EmailOutboxTestCase(TestCase):
+    def setUp(self):
+        CountingEmailBackend.opened = 0
+
+    def test_login_with_2fa_only_enqueues(self):
+        user = User.objects.create_user(
+            username='otp', email='otp@example.com', password='pass12345', two_factor_enabled=True
+        )
+        response = self.client.post(
+            '/api/auth/login/', {'email': 'otp@example.com', 'password': 'pass12345'},
+            content_type='application/json'
+        )
+        self.assertTrue(response.json()['requires_2fa'])
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboxEmail.objects.get()
+        self.assertEqual(queued.recipients, ['otp@example.com'])
+        self.assertEqual(queued.status, OutboxEmail.PENDING)
+        # The code is encrypted at rest
+        otp = auth_cache.get(f'otp_{user.id}')
+        self.assertNotIn(otp, queued.body)
+        self.assertIn(otp, email_body(queued))
+
+    def test_worker_delivers_over_smtp(self):
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPSinkHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        SMTPSinkHandler.connections, SMTPSinkHandler.messages = 0, []
+
+        queue_email('Your Login OTP', 'Your OTP for login is: 123456', ['a@example.com'], sensitive=True)
+        queue_email('Notice', 'Plain body', ['b@example.com', 'c@example.com'])
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=server.server_address[1], EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+        ):
+            out = StringIO()
+            call_command('send_queued_email', once=True, stdout=out)
+        self.assertIn('Sent 2 queued emails', out.getvalue())
+        self.assertEqual(SMTPSinkHandler.connections, 1)
+        self.assertEqual(len(SMTPSinkHandler.messages), 2)
+        self.assertIn(b'Your OTP for login is: 123456', SMTPSinkHandler.messages[0])
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 2)
+
+    def test_old_sent_emails_are_pruned(self):
+        for i in range(3):
+            queue_email(f'Subject {i}', 'Body', ['user@example.com'])
+        OutboxEmail.objects.filter(subject__in=['Subject 0', 'Subject 1']).update(
+            status=OutboxEmail.SENT, sent_at=timezone.now() - timedelta(days=2)
+        )
+        OutboxEmail.objects.filter(subject='Subject 1').update(sent_at=timezone.now())
+        self.assertEqual(prune_outbox(), 1)
+        self.assertEqual(
+            sorted(OutboxEmail.objects.values_list('subject', flat=True)), ['Subject 1', 'Subject 2']
+        )
+
+    @override_settings(EMAIL_BACKEND='userapp.tests.CountingEmailBackend')
+    def test_worker_sends_batches_over_one_connection(self):
+        for i in range(5):
+            queue_email(f'Subject {i}', 'Body', [f'user{i}@example.com'])
+        self.assertEqual(deliver_outbox(batch_size=2), 5)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 5)
+
+    @override_settings(EMAIL_BACKEND='userapp.tests.FailingEmailBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failed_sends_back_off_then_give_up(self):
+        email = queue_email('Subject', 'Body', ['user@example.com'])
+        self.assertEqual(deliver_outbox(), 0)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(email.send_after, timezone.now())
+
+        # Not due yet, so nothing is claimed
+        self.assertEqual(deliver_outbox(), 0)
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+
+        OutboxEmail.objects.filter(pk=email.pk).update(send_after=timezone.now())
+        deliver_outbox()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.FAILED, 2))
+
+
+class JWTValidationCacheTestCase(TestCase):
+    def setUp(self):
+        validated_token_cache.clear()
+        self.addCleanup(validated_token_cache.clear)
+        self.user = User.objects.create_user(username='cached', email='cached@example.com')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.user).access_token}')
+
+    def test_token_is_verified_once(self):
+        with mock.patch.object(
+            JWTAuthentication, 'get_validated_token', autospec=True,
+            side_effect=JWTAuthentication.get_validated_token
+        ) as validate:
+            for _ in range(3):
+                self.assertEqual(self.client.get('/api/auth/friends/').status_code, 200)
+        self.assertEqual(validate.call_count, 1)
+
+    def test_claims_views_skip_the_user_select(self):
+        job = ExportJob.objects.create(user=self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/auth/export-data/jobs/{job.id}/')
+        self.assertEqual(response.data['status'], ExportJob.PENDING)
+
+    def test_cache_expires_and_evicts(self):
+        token_cache = VerifiedTokenCache(max_size=2)
+        token_cache.set('expired', 'claims', time.time() - 1)
+        self.assertIsNone(token_cache.get('expired'))
+
+        token_cache.set('a', 1, time.time() + 60)
+        token_cache.set('b', 2, time.time() + 60)
+        token_cache.get('a')
+        token_cache.set('c', 3, time.time() + 60)
+        self.assertEqual((token_cache.get('a'), token_cache.get('b'), token_cache.get('c')), (1, None, 3))
+
+
+class ThrottledSessionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        session = SessionStore()
+        session['theme'] = 'dark'
+        session.save()
+        self.session_key = session.session_key
+
+    def test_unchanged_session_is_not_rewritten(self):
+        session = SessionStore(self.session_key)
+        self.assertEqual(session['theme'], 'dark')
+        with self.assertNumQueries(0):
+            session.save()
+
+    def test_changed_or_stale_session_is_written(self):
+        session = SessionStore(self.session_key)
+        session['theme'] = 'light'
+        session.save()
+        stored = Session.objects.get(session_key=self.session_key)
+        self.assertEqual(stored.get_decoded()['theme'], 'light')
+
+        session = SessionStore(self.session_key)
+        session._get_session()[SAVED_AT_KEY] -= 6 * 60
+        with CaptureQueriesContext(connection) as queries:
+            session.save()
+        self.assertTrue(any(query['sql'].startswith('UPDATE') for query in queries))
+
+    def test_clear_expired_sessions_in_batches(self):
+        expired = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create([
+            Session(session_key=f'expired{i}', session_data='', expire_date=expired) for i in range(5)
+        ])
+        call_command('clear_expired_sessions', batch_size=2, sleep=0, stdout=StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [self.session_key])
+
+
+class AuthRateLimitTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def login(self, email, ip='10.0.0.1'):
+        return self.client.post(
+            '/api/auth/login/', {'email': email, 'password': 'wrong'},
+            content_type='application/json', REMOTE_ADDR=ip
+        )
+
+    @override_settings(AUTH_RATE_LIMITS={'login': {'ip': (100, 60), 'account': (3, 60)}})
+    def test_account_limit_rejects_before_hashing(self):
+        for i in range(3):
+            self.assertEqual(self.login('victim@example.com', ip=f'10.0.0.{i}').status_code, 400)
+        with mock.patch('userapp.views.authenticate') as authenticate:
+            response = self.login('victim@example.com', ip='10.0.0.99')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        authenticate.assert_not_called()
+        # Other accounts are unaffected
+        self.assertEqual(self.login('someone@example.com').status_code, 400)
+
+    @override_settings(AUTH_RATE_LIMITS={'login': {'ip': (2, 60)}})
+    def test_ip_limit(self):
+        self.login('a@example.com')
+        self.login('b@example.com')
+        self.assertEqual(self.login('c@example.com').status_code, 429)
+        self.assertEqual(self.login('c@example.com', ip='10.0.0.2').status_code, 400)
+
+    @override_settings(AUTH_RATE_LIMITS={'login': {'ip': (2, 60)}}, AUTH_RATE_LIMIT_TRUST_X_FORWARDED_FOR=True)
+    def test_spoofed_forwarded_for_is_ignored(self):
+        # The proxy appends the address it saw; the client controls everything before it
+        for i in range(2):
+            self.client.post('/api/auth/login/', {'email': 'a@example.com', 'password': 'wrong'},
+                             content_type='application/json', HTTP_X_FORWARDED_FOR=f'1.2.3.{i}, 203.0.113.7')
+        response = self.client.post('/api/auth/login/', {'email': 'a@example.com', 'password': 'wrong'},
+                                    content_type='application/json', HTTP_X_FORWARDED_FOR='1.2.3.9, 203.0.113.7')
+        self.assertEqual(response.status_code, 429)
+
+        with override_settings(AUTH_RATE_LIMIT_TRUSTED_PROXIES=2):
+            request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.2.3.4, 203.0.113.8, 10.0.0.2')
+            self.assertEqual(client_ip(request), '203.0.113.8')
+            # Fewer entries than proxies: the header was not built by them
+            request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.2.3.4', REMOTE_ADDR='10.0.0.3')
+            self.assertEqual(client_ip(request), '10.0.0.3')
+
+    def test_previous_window_is_weighted(self):
+        # A full window 0 keeps counting, decaying, into window 1
+        for _ in range(10):
+            self.assertEqual(check_rate('test', 'ip', 'x', 10, 60, now=50), 0)
+        self.assertEqual(check_rate('test', 'ip', 'x', 10, 60, now=60), 1)
+        self.assertEqual(check_rate('test', 'ip', 'x', 10, 60, now=61), 0)
+        # 10 * (1 - 2/60) + 1 >= 10 until 10% of the previous window has slid out
+        self.assertEqual(check_rate('test', 'ip', 'x', 10, 60, now=62), 5)
+        self.assertEqual(check_rate('test', 'ip', 'x', 10, 60, now=67), 0)
+
+
+class AsyncAuthViewsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Pool processes snapshot settings when they start
+        shutdown_pool()
+        self.addCleanup(shutdown_pool)
+
+    def test_middleware_chain_stays_async(self):
+        # Under DEBUG, Django logs every middleware it has to adapt into a thread for an async request
+        with override_settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            BaseHandler().load_middleware(is_async=True)
+
+    async def test_activity_is_recorded_from_async_views(self):
+        user = await User.objects.acreate(username='asyncer', email='asyncer@example.com')
+        await sync_to_async(self.async_client.force_login)(user)
+        with mock.patch('userapp.middleware.record_activity') as record:
+            await self.async_client.get('/api/auth/async/login/')
+        record.assert_called_once_with(user.pk)
+
+    async def test_async_login_verifies_in_pool_and_upgrades_hash(self):
+        user = await User.objects.acreate(username='hasher', email='hasher@example.com', password='!')
+        user.set_password('pass12345')
+        await user.asave()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+        wrong = await self.async_client.post(
+            '/api/auth/async/login/', {'email': 'hasher@example.com', 'password': 'nope'},
+            content_type='application/json'
+        )
+        self.assertEqual(wrong.status_code, 400)
+
+        with override_settings(PASSWORD_HASHERS=[
+            'django.contrib.auth.hashers.Argon2PasswordHasher',
+            'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        ]):
+            shutdown_pool()
+            response = await self.async_client.post(
+                '/api/auth/async/login/', {'email': 'hasher@example.com', 'password': 'pass12345'},
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('access_token', json.loads(response.content))
+            await user.arefresh_from_db()
+            self.assertTrue(user.password.startswith('argon2$'))
+            self.assertTrue(user.check_password('pass12345'))
+
+    def test_pool_does_not_fork(self):
+        # Forking a threaded process can leave the child blocked on a lock it inherited
+        with mock.patch('userapp.hashing.ProcessPoolExecutor') as executor:
+            get_pool()
+        self.assertEqual(executor.call_args.kwargs['mp_context'].get_start_method(), 'spawn')
+
+    async def test_async_register(self):
+        response = await self.async_client.post('/api/auth/async/register/', {
+            'username': 'newbie', 'email': 'newbie@example.com',
+            'password1': 'pass12345', 'password2': 'pass12345',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        user = await User.objects.aget(email='newbie@example.com')
+        self.assertTrue(user.check_password('pass12345'))
+
+
+class SharedAuthStateTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        auth_cache.clear()
+
+    def test_otp_is_single_use(self):
+        otp = issue_otp(7)
+        self.assertEqual(len(otp), 6)
+        self.assertFalse(consume_otp(7, '-1'))
+        self.assertTrue(consume_otp(7, otp))
+        self.assertFalse(consume_otp(7, otp))
+
+    def test_verify_otp_view_uses_shared_code(self):
+        user = User.objects.create_user(username='twofa', email='twofa@example.com', password='pass12345')
+        otp = issue_otp(user.id)
+        response = self.client.post(
+            '/api/auth/verify-otp/', {'email': 'twofa@example.com', 'otp': otp}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(auth_cache.get(f'otp_{user.id}'))
+
+    def test_codes_survive_a_full_default_cache(self):
+        otp = issue_otp(1)
+        state = issue_oauth_state()
+        for user_id in range(400):
+            record_heartbeat(user_id)
+        self.assertTrue(consume_otp(1, otp))
+        self.assertTrue(consume_oauth_state(state))
+
+    def test_oauth_state_round_trip(self):
+        link = self.client.post('/api/auth/redirect_uri/').json()['oauth_link']
+        state = link.split('state=')[1]
+        self.assertTrue(consume_oauth_state(state))
+        self.assertFalse(consume_oauth_state(state))
+        self.assertFalse(consume_oauth_state(issue_oauth_state() + 'x'))
+
+        response = self.client.post(
+            '/api/auth/get-token/', {'code': 'abc', 'state': 'forged'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class AvatarThumbnailTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(username='pic', email='pic@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, size=(800, 600)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(buffer, 'PNG')
+        data_url = 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+        response = self.client.put('/api/auth/profile/', {'profile_picture': data_url}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return len(buffer.getvalue())
+
+    def fetch(self, user_id, query, accept):
+        response = self.client.get(f'/api/auth/avatar/{user_id}/{query}', HTTP_ACCEPT=accept)
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body, Image.open(io.BytesIO(body))
+
+    def test_sized_avatar_negotiates_format(self):
+        original_bytes = self.upload()
+        response, body, image = self.fetch(self.user.id, '?size=40', 'image/webp,*/*')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(image.size, (64, 64))
+        self.assertLess(len(body) * 10, original_bytes)
+
+        response, _, image = self.fetch(self.user.id, '?size=1000', '*/*')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual((image.format, image.size), ('JPEG', (256, 256)))
+
+    def test_default_avatar_thumbnail(self):
+        response, _, image = self.fetch(self.user.id, '?size=32', 'image/webp')
+        self.assertEqual((response['Content-Type'], image.size), ('image/webp', (32, 32)))
+
+    def test_original_still_served_without_size(self):
+        self.upload()
+        response, _, image = self.fetch(self.user.id, '', '*/*')
+        self.assertEqual(image.size, (800, 600))
+
+    def test_data_url_type_is_not_trusted(self):
+        script = base64.b64encode(b'<script>alert(localStorage.token)</script>').decode()
+        response = self.client.put('/api/auth/profile/', {'profile_picture': f'data:image/html;base64,{script}'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.profile_picture)
+        self.assertFalse(default_storage.exists('profile_pictures'))
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (50, 50)).save(buffer, 'PNG')
+        data_url = 'data:image/html;base64,' + base64.b64encode(buffer.getvalue()).decode()
+        self.assertEqual(self.client.put('/api/auth/profile/', {'profile_picture': data_url}, format='json').status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.profile_picture.name.endswith('.png'))
+
+        # Whatever ends up in MEDIA_ROOT, /media/ serves images only
+        default_storage.save('profile_pictures/sha256/07/stray.html', ContentFile(b'<script></script>'))
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/media/profile_pictures/sha256/07/stray.html').status_code, 404)
+            response = self.client.get(f'/media/{self.user.profile_picture.name}')
+            self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/png'))
+        with override_settings(SENDFILE_BACKEND='nginx'):
+            self.assertEqual(self.client.get('/media/profile_pictures/sha256/07/stray.html').status_code, 404)
+
+    def test_negotiate_format(self):
+        self.assertEqual(negotiate_format('image/webp;q=0, image/*'), 'jpeg')
+        self.assertEqual(negotiate_format('image/webp;q=0.5,image/jpeg'), 'webp')
+        self.assertEqual(negotiate_format(None), 'jpeg')
+        expected = 'avif' if 'avif' in AVATAR_FORMATS else 'webp'
+        self.assertEqual(negotiate_format('image/avif,image/webp,*/*'), expected)
+
+
+class AvatarConditionalCachingTestCase(AvatarThumbnailTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_revalidation_is_answered_without_db_or_file(self):
+        self.upload()
+        response, _, _ = self.fetch(self.user.id, '?size=64', 'image/webp')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith(f'"{self.user_version()}-'))
+
+        url = f'/api/auth/avatar/{self.user.id}/?size=64'
+        with mock.patch('userapp.views.default_storage.open', side_effect=AssertionError('file read')):
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_ACCEPT='image/webp', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertIn('Accept', response['Vary'])
+
+            last_modified = response['Last-Modified']
+            response = self.client.get(url, HTTP_ACCEPT='image/webp', HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304)
+
+        # Another format is another representation
+        response = self.client.get(url, HTTP_ACCEPT='image/jpeg', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_upload_changes_version(self):
+        self.upload()
+        first = self.user_version()
+        response, _, _ = self.fetch(self.user.id, '', '*/*')
+        self.assertEqual(response['ETag'], f'"{first}"')
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+        self.upload(size=(300, 300))
+        second = self.user_version()
+        self.assertNotEqual(first, second)
+        response = self.client.get(f'/api/auth/avatar/{self.user.id}/', HTTP_IF_NONE_MATCH=f'"{first}"')
+        self.assertEqual(response.status_code, 200)
+
+        response, _, _ = self.fetch(self.user.id, f'?size=64&v={second}', '*/*')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_preexisting_upload_is_fingerprinted_lazily(self):
+        self.upload()
+        User.objects.filter(pk=self.user.pk).update(avatar_hash='', avatar_updated_at=None)
+        cache.clear()
+        response, _, _ = self.fetch(self.user.id, '', '*/*')
+        self.user.refresh_from_db()
+        self.assertEqual(len(self.user.avatar_hash), 64)
+        self.assertEqual(response['ETag'], f'"{self.user.avatar_hash[:16]}"')
+
+    def test_default_avatar_served_from_memory(self):
+        response, _, image = self.fetch(self.user.id, '?size=32', 'image/jpeg')
+        self.assertFalse(response.streaming)
+        self.assertEqual((image.format, image.size), ('JPEG', (32, 32)))
+        with mock.patch('builtins.open', side_effect=AssertionError('file read')):
+            response, _, image = self.fetch(self.user.id, '', '*/*')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertFalse(default_storage.exists('profile_pictures/thumbs'))
+
+    @override_settings(SENDFILE_BACKEND='nginx')
+    def test_offload_to_nginx(self):
+        self.upload()
+        response = self.client.get(f'/api/auth/avatar/{self.user.id}/?size=64', HTTP_ACCEPT='image/webp')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.user.refresh_from_db()
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/' + thumbnail_name(self.user.avatar_hash, 64, 'webp')
+        )
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertTrue(response['ETag'])
+
+        # The bundled default avatar lives outside MEDIA_ROOT and is still sent from memory
+        other = User.objects.create_user(username='nopic', email='nopic@example.com')
+        response = self.client.get(f'/api/auth/avatar/{other.id}/')
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertTrue(response.content)
+
+    @override_settings(SENDFILE_BACKEND='xsendfile')
+    def test_offload_media_with_xsendfile(self):
+        self.upload()
+        self.user.refresh_from_db()
+        response = self.client.get(f'/media/{self.user.profile_picture.name}')
+        self.assertEqual(response['X-Sendfile'], self.user.profile_picture.path)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(self.client.get('/media/profile_pictures/missing.png').status_code, 404)
+
+    def user_version(self):
+        return self.client.get('/api/auth/profile/').json()['avatar_version']
+
+
+class MultipartAvatarUploadTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(username='multi', email='multi@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def put(self, content, name='avatar.png', field='avatar'):
+        upload = SimpleUploadedFile(name, content, content_type='image/png')
+        return self.client.put('/api/auth/profile/avatar/', {field: upload}, format='multipart')
+
+    def png(self, size=(300, 200), noise=False):
+        image = Image.effect_noise(size, 64).convert('RGB') if noise else Image.new('RGB', size, (0, 90, 200))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_upload_streams_to_storage(self):
+        response = self.put(self.png(), name='whatever.gif')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        # Extension comes from the sniffed signature, not the client's file name
+        self.assertEqual(self.user.profile_picture.name, avatar_name(self.user.avatar_hash, 'png'))
+        self.assertEqual(response.json()['avatar_version'], self.user.avatar_hash[:16])
+        self.assertTrue(default_storage.exists(thumbnail_name(self.user.avatar_hash, 64, 'webp')))
+
+    def test_rejects_non_images_from_the_first_chunk(self):
+        response = self.put(b'<?php echo "hi"; ?>' * 10)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'Unsupported image format')
+        self.assertEqual(self.put(self.png(), field='picture').status_code, 400)
+        # Right signature, broken body
+        self.assertEqual(self.put(self.png()[:40]).json()['message'], 'Invalid image')
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.profile_picture)
+
+    def test_pixel_cap(self):
+        # A few KB on the wire, 100 MB of pixels once decoded
+        buffer = io.BytesIO()
+        Image.new('L', (10000, 10000)).save(buffer, 'PNG')
+        self.assertLess(len(buffer.getvalue()), 200 * 1024)
+        response = self.put(buffer.getvalue())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('larger than', response.json()['message'])
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.profile_picture)
+        self.assertFalse(default_storage.exists('profile_pictures'))
+
+        # JPEGs are decoded at reduced scale, still covering the largest rendition
+        buffer = io.BytesIO()
+        Image.new('RGB', (3000, 2000), (0, 90, 200)).save(buffer, 'JPEG')
+        self.assertEqual(self.put(buffer.getvalue()).status_code, 200)
+        self.user.refresh_from_db()
+        with default_storage.open(thumbnail_name(self.user.avatar_hash, 256, 'jpeg')) as thumb:
+            self.assertEqual(Image.open(thumb).size, (256, 256))
+
+    def test_size_cap(self):
+        content = self.png(size=(200, 200), noise=True)
+        with override_settings(AVATAR_MAX_UPLOAD_SIZE=len(content) - 1):
+            # Within the multipart allowance, so the handler has to cut it off mid-stream
+            response = self.put(content)
+        self.assertEqual(response.status_code, 413)
+        with override_settings(AVATAR_MAX_UPLOAD_SIZE=1000):
+            # Refused on Content-Length alone
+            response = self.put(content)
+        self.assertEqual(response.status_code, 413)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.profile_picture)
+
+        handler = AvatarUploadHandler()
+        handler.new_file('avatar', 'a.png', 'image/png', None)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b'BM' + b'\0' * 20, 0)
+        self.assertEqual(handler.error, 'Unsupported image format')
+
+
+class ContentAddressedAvatarTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com')
+
+    def upload(self, user, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (100, 100), color).save(buffer, 'PNG')
+        client = APIClient()
+        client.force_authenticate(user)
+        upload = SimpleUploadedFile('a.png', buffer.getvalue(), content_type='image/png')
+        response = client.put('/api/auth/profile/avatar/', {'avatar': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        return user.profile_picture.name
+
+    def age_files(self, hours=2):
+        old = time.time() - hours * 3600
+        for directory, _, files in os.walk(self.media_root):
+            for name in files:
+                os.utime(os.path.join(directory, name), (old, old))
+
+    def stored_files(self):
+        return {
+            os.path.relpath(os.path.join(directory, name), self.media_root)
+            for directory, _, files in os.walk(self.media_root) for name in files
+        }
+
+    def gc(self, **options):
+        out = StringIO()
+        call_command('delete_orphaned_media', sleep=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_identical_uploads_are_stored_once(self):
+        red = self.upload(self.alice, 'red')
+        self.assertEqual(self.upload(self.bob, 'red'), red)
+        self.assertEqual(sum(name.startswith('profile_pictures/sha256/') for name in self.stored_files()), 1)
+
+        # Replacing her avatar leaves the file Bob still uses
+        self.assertNotEqual(self.upload(self.alice, 'blue'), red)
+        self.assertTrue(default_storage.exists(red))
+
+    def test_deleted_users_avatar_is_erased(self):
+        shared = self.upload(self.bob, 'red')
+        own = self.upload(self.alice, 'green')
+        user_id, digest = self.alice.id, self.alice.avatar_hash
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        fetch = lambda: client.get(f'/api/auth/avatar/{user_id}/?size=64', HTTP_ACCEPT='image/webp')
+        self.assertEqual(fetch().status_code, 200)  # Metadata now cached
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.delete('/api/auth/delete-account/').status_code, 200)
+        self.assertEqual(fetch().status_code, 404)
+        self.assertFalse(default_storage.exists(own))
+        self.assertFalse(default_storage.exists(thumbnail_name(digest, 64, 'webp')))
+
+        # A file someone else still uses stays
+        carol = User.objects.create_user(username='carol', email='carol@example.com')
+        self.assertEqual(self.upload(carol, 'red'), shared)
+        with self.captureOnCommitCallbacks(execute=True):
+            carol.delete()
+        self.assertTrue(default_storage.exists(shared))
+        self.assertTrue(default_storage.exists(thumbnail_name(self.bob.avatar_hash, 64, 'webp')))
+
+    def test_orphans_are_collected(self):
+        red = self.upload(self.alice, 'red')
+        red_hash = self.alice.avatar_hash
+        blue = self.upload(self.alice, 'blue')
+        default_storage.save('profile_pictures/user_9.png', ContentFile(b'stray'))
+        default_storage.save('profile_pictures/thumbs/user_9/32.jpeg', ContentFile(b'old layout'))
+        self.age_files()
+        green = self.upload(self.bob, 'green')
+        self.bob.delete()  # Orphan, but too recent to touch
+
+        output = self.gc(batch_size=4)
+        # Red and its thumbnails, plus the two stray files
+        expected = 1 + len(AVATAR_FORMATS) * len(avatar_sizes()) + 2
+        self.assertIn(f'Deleted {expected} orphaned files', output)
+        remaining = self.stored_files()
+        self.assertNotIn(red, remaining)
+        self.assertNotIn('profile_pictures/user_9.png', remaining)
+        self.assertIn(blue, remaining)
+        self.assertIn(green, remaining)
+        self.assertIn(thumbnail_name(self.alice.avatar_hash, 32, 'jpeg'), remaining)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'profile_pictures/thumbs', red_hash[:2], red_hash)))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'profile_pictures/thumbs/user_9')))
+
+    def test_interrupted_pass_resumes(self):
+        self.upload(self.alice, 'red')
+        self.upload(self.alice, 'blue')
+        self.age_files()
+        sweep = DeleteOrphanedMedia._sweep
+        calls = []
+
+        def interrupted(command, *args):
+            calls.append(args[0])
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return sweep(command, *args)
+
+        with mock.patch.object(DeleteOrphanedMedia, '_sweep', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.gc(batch_size=3)
+        self.assertEqual(cache.get(ORPHAN_CURSOR_KEY), calls[0][-1])
+
+        output = self.gc(batch_size=3)
+        self.assertIn(f"Resuming after {calls[0][-1]}", output)
+        self.assertIsNone(cache.get(ORPHAN_CURSOR_KEY))
+        self.assertEqual(sum(name.startswith('profile_pictures/sha256/') for name in self.stored_files()), 1)
+
+
+class ProfileCardsTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+
+        self.viewer = User.objects.create_user(username='viewer', email='viewer@example.com')
+        self.pic = User.objects.create_user(username='pic', email='pic@example.com', display_name='Picture')
+        buffer = io.BytesIO()
+        Image.new('RGB', (120, 120), 'purple').save(buffer, 'PNG')
+        store_avatar(self.pic, ContentFile(buffer.getvalue()))
+        self.nopic = User.objects.create_user(username='nopic', email='nopic@example.com')
+        self.legacy = User.objects.create_user(username='legacy', email='legacy@example.com')
+        User.objects.filter(pk=self.legacy.pk).update(profile_picture='profile_pictures/user_4.png')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_cards_from_one_query(self):
+        record_heartbeat(self.nopic.id)
+        ids = [self.nopic.id, 999, self.pic.id, self.legacy.id, self.nopic.id]
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/auth/profile-cards/', {'ids': ','.join(map(str, ids)), 'size': 50})
+        self.assertEqual(response.status_code, 200)
+        cards = response.json()['cards']
+        self.assertEqual([card['id'] for card in cards], [self.nopic.id, self.pic.id, self.legacy.id])
+        self.assertEqual([card['online'] for card in cards], [True, False, False])
+        self.assertEqual(cards[1]['display_name'], 'Picture')
+
+        self.assertEqual(cards[1]['avatar'], f'/api/auth/avatar/{self.pic.id}/?size=64&v={self.pic.avatar_hash[:16]}')
+        self.assertIn('&v=', cards[0]['avatar'])  # The default avatar is versioned too
+        self.assertNotIn('&v=', cards[2]['avatar'])  # Not fingerprinted yet: must revalidate
+
+        response = self.client.get(cards[1]['avatar'], HTTP_ACCEPT='image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        response = self.client.get(cards[0]['avatar'], HTTP_ACCEPT='image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_rejects_bad_requests(self):
+        response = self.client.get('/api/auth/profile-cards/', {'ids': '1,two'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/auth/profile-cards/', {'ids': ','.join(map(str, range(1, 102)))})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,79 @@
+# userapp/uploads.py
+"""Streaming avatar uploads.
+
+AvatarUploadHandler replaces Django's default handlers for the multipart
+avatar endpoint. Chunks go straight to a temporary file (which
+FileSystemStorage then moves into MEDIA_ROOT without a copy), so a request
+never holds more than one chunk of the image in memory. The first bytes are
+checked against known image signatures, and the upload is stopped as soon as
+it crosses AVATAR_MAX_UPLOAD_SIZE, without reading the rest of the body.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+AVATAR_FIELD = 'avatar'
+SNIFF_BYTES = 12
+MULTIPART_OVERHEAD = 16 * 1024  # Boundaries and part headers around the file
+
+
+def max_upload_size():
+    return getattr(settings, 'AVATAR_MAX_UPLOAD_SIZE', 5 * 1024 * 1024)
+
+
+def too_large_message():
+    return f"Image is larger than {max_upload_size() / (1024 * 1024):g} MB"
+
+
+def sniff_image(header):
+    """File extension for a PNG/JPEG/GIF/WebP signature, or None"""
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class AvatarUploadHandler(TemporaryFileUploadHandler):
+    """Accepts one image in the `avatar` field; `error` and `status` explain a stopped upload"""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.file = None
+        self.error = None
+        self.status = None
+        self.extension = None
+        self._header = b''
+        self._received = 0
+
+    def _stop(self, message, status=400):
+        self.error, self.status = message, status
+        if self.file is not None:
+            self.file.close()
+        # Don't drain the remaining body; the client gets its answer right away
+        raise StopUpload(connection_reset=True)
+
+    def new_file(self, field_name, *args, **kwargs):
+        if field_name != AVATAR_FIELD:
+            self._stop(f"Unexpected file field '{field_name}'")
+        super().new_file(field_name, *args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self._received += len(raw_data)
+        if self._received > max_upload_size():
+            self._stop(too_large_message(), status=413)
+        if self.extension is None:
+            self._header += raw_data[:SNIFF_BYTES]
+            if len(self._header) >= SNIFF_BYTES:
+                self.extension = sniff_image(self._header)
+                if self.extension is None:
+                    self._stop('Unsupported image format')
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.extension is None:
+            self._stop('Unsupported image format')
+        return super().file_complete(file_size)
@@ -1,6 +1,7 @@
 # userapp/urls.py
 from django.urls import path
 from . import views
+from .ratelimit import rate_limited
 
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -16,13 +17,19 @@ urlpatterns = [
     path('redirect_uri/', views.redirect_uri, name='redirect_uri'),
     path('oauth_callback/', views.oauth_callback, name='oauth_callback'),
     path('get-token/', views.get_token, name='get_token'),
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    # Async variants of the OAuth views (use when served over ASGI)
+    path('async/oauth_callback/', views.async_oauth_callback, name='async_oauth_callback'),
+    path('async/get-token/', views.async_get_token, name='async_get_token'),
+    path('async/login/', views.async_login_view, name='async_login'),
+    path('async/register/', views.async_register_view, name='async_register'),
+    path('token/', rate_limited('login')(TokenObtainPairView.as_view()), name='token_obtain_pair'),
     path('verify-otp/', views.verify_otp, name='verify_otp'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
     path('register/', views.register_view, name='register'),
     path('check-auth/', views.check_auth, name='check-auth'),
     path('profile/', views.profile_view, name='profile'),
+    path('profile/avatar/', views.upload_avatar, name='upload-avatar'),
     path('settings/', views.user_settings_view, name='user-settings'),
 
     # New match history endpoints
@@ -43,10 +50,19 @@ urlpatterns = [
 # Add this to your urlpatterns list
 urlpatterns += [
     path('export-data/', views.export_user_data, name='export-user-data'),
+    path('export-data/jobs/', views.create_export_job, name='create-export-job'),
+    path('export-data/jobs/<uuid:job_id>/', views.export_job_status, name='export-job-status'),
+    path('export-data/jobs/<uuid:job_id>/download/', views.download_export_job, name='download-export-job'),
     # Friend management endpoints
     path('users/', views.get_all_users, name='get-all-users'),
     path('friends/', views.get_friends, name='get-friends'),
+    path('profile-cards/', views.get_profile_cards, name='profile-cards'),
     path('friends/add/<int:user_id>/', views.add_friend, name='add-friend'),
     path('friends/remove/<int:user_id>/', views.remove_friend, name='remove-friend'),
+    path('friends/bulk/', views.bulk_update_friends, name='bulk-update-friends'),
+    path('friends/suggestions/', views.friend_suggestions, name='friend-suggestions'),
+    # Presence (cache only)
+    path('presence/heartbeat/', views.presence_heartbeat, name='presence-heartbeat'),
+    path('presence/', views.presence_lookup, name='presence-lookup'),
 ]
 
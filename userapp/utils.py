@@ -1,8 +1,71 @@
+from collections import OrderedDict
 from functools import wraps
 from django.http import JsonResponse
 import jwt
+import base64
+import datetime
+import hashlib
+import threading
+import time
 from django.conf import settings
 
+class VerifiedTokenCache:
+    """Thread-safe LRU of already-verified tokens, each kept until its `exp`.
+
+    Keyed by the SHA-256 digest of the raw token so the cache never holds
+    bearer credentials. Only successfully verified tokens are stored; an
+    entry past its expiry is dropped and the caller re-verifies, which then
+    reports the expiry the usual way.
+    """
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(raw_token):
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode()
+        return hashlib.sha256(raw_token).digest()
+
+    def get(self, raw_token):
+        key = self._key(raw_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, raw_token, value, expires_at):
+        if self.max_size <= 0:
+            return
+        key = self._key(raw_token)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+jwt_claims_cache = VerifiedTokenCache(getattr(settings, 'JWT_CLAIMS_CACHE_SIZE', 4096))
+
+def decode_jwt(token):
+    """jwt.decode with the JWT_SETTINGS key, skipping the HMAC for recently verified tokens"""
+    claims = jwt_claims_cache.get(token)
+    if claims is None:
+        claims = jwt.decode(token, settings.JWT_SETTINGS["JWT_SECRET_KEY"], algorithms=[settings.JWT_SETTINGS["JWT_ALGORITHM"]])
+        if "exp" in claims:
+            jwt_claims_cache.set(token, claims, claims["exp"])
+    return claims
+
 def jwt_required(view_func):
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
@@ -12,7 +75,7 @@ def jwt_required(view_func):
 
         token = auth_header.split(" ")[1]
         try:
-            decoded_token = jwt.decode(token, settings.JWT_SETTINGS["JWT_SECRET_KEY"], algorithms=[settings.JWT_SETTINGS["JWT_ALGORITHM"]])
+            decoded_token = decode_jwt(token)
             request.user_id = decoded_token["user_id"]
             request.username = decoded_token["username"]
         except jwt.ExpiredSignatureError:
@@ -22,4 +85,15 @@ def jwt_required(view_func):
 
         return view_func(request, *args, **kwargs)
 
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+def encode_cursor(date_played, pk):
+    """Opaque keyset cursor for a (date_played, id) position"""
+    raw = f"{date_played.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    date_str, pk = raw.split('|')
+    return datetime.datetime.fromisoformat(date_str), int(pk)
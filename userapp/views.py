@@ -1,46 +1,76 @@
 # userapp/views.py
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseNotAllowed
+from asgiref.sync import sync_to_async
 from django.views.decorators.http import require_POST
 from django.contrib.auth import login, logout, authenticate, get_user_model
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
+from django.middleware.csrf import get_token as get_csrf_token
 
 from decouple import config
 
 from rest_framework.authtoken.models import Token  # Add this import
-from rest_framework_simplejwt.tokens import RefreshToken
 
-from django.core.mail import send_mail
 from django.conf import settings
-from .utils import jwt_required
+from .utils import jwt_required, encode_cursor, decode_cursor
+from . import fortytwo
+from .export import EXPORT_FORMATS, NDJSONRenderer, CSVRenderer
+from .suggestions import SUGGESTIONS_MAX, get_friend_suggestions
+from .presence import OFFLINE, ONLINE, record_heartbeat, clear_presence, get_presence_many
+from .outbox import queue_email
+from .auth_state import issue_otp, consume_otp, issue_oauth_state, consume_oauth_state
+from .ratelimit import rate_limited
+from .hashing import aauthenticate, amake_password
+from .intra_avatars import schedule_intra_avatar
+from .sendfile import send_file
+from .uploads import AVATAR_FIELD, MULTIPART_OVERHEAD, AvatarUploadHandler, max_upload_size, too_large_message
+from .avatars import (
+    AVATAR_FORMATS, VERSION_LENGTH, ImageRenderer, InvalidImage, avatar_meta, avatar_url, avatar_version,
+    default_avatar, forget_avatar_meta, get_thumbnail, negotiate_format, pick_size, store_avatar,
+)
 from django.contrib.sessions.backends.db import SessionStore
 from django.contrib.sessions.models import Session
-import requests
 from django.shortcuts import redirect
-import random
-from django.core.cache import cache
 import logging
 from rest_framework.decorators import api_view
 
 import json
 import jwt
 import datetime
-from .models import User, MatchHistory
+from .models import User, MatchHistory, UserStats, ExportJob, parse_score
 
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, parser_classes, renderer_classes
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.core.files.storage import default_storage
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 import base64
 from django.core.files.base import ContentFile
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from .authentication import ClaimsJWTAuthentication, tokens_for_user
 import uuid
 
 import os
-from django.http import HttpResponse, FileResponse
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Q
 
 logger = logging.getLogger(__name__)
 
+MATCH_HISTORY_PAGE_SIZE = 10
+MATCH_HISTORY_MAX_PAGE_SIZE = 100
+USER_DIRECTORY_PAGE_SIZE = 50
+USER_DIRECTORY_MAX_PAGE_SIZE = 100
+PROFILE_CARDS_MAX_IDS = 100
+FRIENDS_BULK_MAX_IDS = 500
+PRESENCE_LOOKUP_MAX_IDS = 500
+
+# Bearer tokens resolve to a ClaimsUser (no user SELECT); session/token clients still work
+CLAIMS_AUTHENTICATION_CLASSES = [ClaimsJWTAuthentication, TokenAuthentication, SessionAuthentication]
+
 
 
 @api_view(['GET', 'PUT'])
@@ -54,34 +84,9 @@ def profile_view(request):
             # Get user's match history (most recent 5 matches)
             match_history = MatchHistory.objects.filter(user=user).order_by('-date_played')[:5]
             
-            # Calculate statistics
-            total_matches = MatchHistory.objects.filter(user=user).count()
-            wins = MatchHistory.objects.filter(user=user, result='WIN').count()
-            win_rate = int((wins / total_matches) * 100) if total_matches > 0 else 0
-            
-            # Find best score from wins
-            best_score = "0-0"
-            if wins > 0:
-                best_score_matches = MatchHistory.objects.filter(user=user, result='WIN')
-                if best_score_matches.exists():
-                    # Find match with biggest score difference
-                    best_match = None
-                    biggest_diff = -1
-                    for match in best_score_matches:
-                        scores = match.score.split('-')
-                        if len(scores) == 2:
-                            try:
-                                user_score = int(scores[0])
-                                opp_score = int(scores[1])
-                                diff = user_score - opp_score
-                                if diff > biggest_diff:
-                                    biggest_diff = diff
-                                    best_match = match
-                            except ValueError:
-                                continue
-                    
-                    if best_match:
-                        best_score = best_match.score
+            # Statistics are maintained by save_match_view, one row per game type
+            stats_rows = {row.game_type: row for row in UserStats.objects.filter(user=user)}
+            totals = stats_rows.pop(UserStats.ALL_GAMES, None) or UserStats(user=user)
             
             # Format match history for response
             matches = []
@@ -99,11 +104,23 @@ def profile_view(request):
                 'email': user.email,
                 'display_name': user.display_name if hasattr(user, 'display_name') else user.username,
                 'avatar': user.profile_picture.url if user.profile_picture else None,
+                'avatar_version': avatar_version(user.id),
                 'date_joined': user.date_joined.strftime('%B %Y'),
                 'stats': {
-                    'games_played': total_matches,
-                    'win_rate': f"{win_rate}%",
-                    'best_score': best_score
+                    'games_played': totals.games_played,
+                    'win_rate': f"{totals.win_rate}%",
+                    'best_score': totals.best_score
+                },
+                'stats_by_game': {
+                    game_type: {
+                        'games_played': row.games_played,
+                        'wins': row.wins,
+                        'losses': row.losses,
+                        'draws': row.draws,
+                        'win_rate': f"{row.win_rate}%",
+                        'best_score': row.best_score,
+                    }
+                    for game_type, row in stats_rows.items()
                 },
                 'match_history': matches
             })
@@ -141,17 +158,13 @@ def profile_view(request):
             # Handle profile picture upload
             if 'profile_picture' in data:
                 try:
-                    # Delete old profile picture if it exists
-                    if user.profile_picture:
-                        default_storage.delete(user.profile_picture.path)
-                    
-                    # Handle base64 image data
+                    # The old file may be shared with another user; delete_orphaned_media removes it
+
+                    # Handle base64 image data (kept for older clients; see upload_avatar)
+                    # The data URL's type is ignored; store_avatar() sniffs the bytes
                     if data['profile_picture'].startswith('data:image'):
-                        format, imgstr = data['profile_picture'].split(';base64,')
-                        ext = format.split('/')[-1]
-                        filename = f'profile_pictures/user_{user.id}.{ext}'
-                        data = ContentFile(base64.b64decode(imgstr))
-                        user.profile_picture.save(filename, data, save=True)
+                        _, imgstr = data['profile_picture'].split(';base64,', 1)
+                        store_avatar(user, ContentFile(base64.b64decode(imgstr)))
                 except Exception as e:
                     print(f"Error handling profile picture: {str(e)}")
                     return Response({
@@ -166,7 +179,8 @@ def profile_view(request):
                 'username': user.username,
                 'email': user.email,
                 'display_name': user.display_name or user.username,
-                'avatar': user.profile_picture.url if user.profile_picture else None
+                'avatar': user.profile_picture.url if user.profile_picture else None,
+                'avatar_version': avatar_version(user.id)
             })
         except Exception as e:
             print(f"Error updating profile: {str(e)}")
@@ -184,17 +198,18 @@ def update_profile(request):
     
     # Handle profile picture upload
     if 'profile_picture' in data:
-        # If there's an existing picture, delete it
-        if user.profile_picture:
-            default_storage.delete(user.profile_picture.path)
-        
-        # Handle base64 encoded image
+        # Handle base64 encoded image (kept for older clients; see upload_avatar)
+        # The data URL's type is ignored; store_avatar() sniffs the bytes
         if data['profile_picture'].startswith('data:image'):
-            format, imgstr = data['profile_picture'].split(';base64,')
-            ext = format.split('/')[-1]
-            filename = f'profile_pictures/{user.id}.{ext}'
-            data = ContentFile(base64.b64decode(imgstr))
-            user.profile_picture.save(filename, data, save=False)
+            try:
+                _, imgstr = data['profile_picture'].split(';base64,', 1)
+                store_avatar(user, ContentFile(base64.b64decode(imgstr)))
+            except ValueError:
+                # Malformed data URL or base64, or InvalidImage
+                return Response({
+                    'status': 'error',
+                    'message': 'Invalid image'
+                }, status=400)
 
     user.save()
     return Response({
@@ -203,12 +218,59 @@ def update_profile(request):
             'username': user.username,
             'email': user.email,
             'avatar': user.profile_picture.url if user.profile_picture else None,
+            'avatar_version': avatar_version(user.id),
 			'display_name': user.username 
         }
     })
 
 
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser])
+def upload_avatar(request):
+    """Replace the user's avatar from a multipart/form-data upload (file field `avatar`).
+
+    The image is streamed to disk chunk by chunk instead of arriving as a
+    base64 data URL in JSON; profile/ still accepts those for older clients.
+    PUT, not POST, so CSRF checking never parses the body ahead of the view.
+    """
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > max_upload_size() + MULTIPART_OVERHEAD:
+        # Refuse before reading a byte of the body
+        return Response({'status': 'error', 'message': too_large_message()}, status=413)
+
+    handler = AvatarUploadHandler(request)
+    request.upload_handlers = [handler]
+    upload = request.FILES.get(AVATAR_FIELD)
+    if handler.error:
+        return Response({'status': 'error', 'message': handler.error}, status=handler.status)
+    if upload is None:
+        return Response({'status': 'error', 'message': 'No avatar file uploaded'}, status=400)
+
+    user = request.user
+    try:
+        # Moved, not copied, from the upload's temporary file unless already stored
+        store_avatar(user, upload)
+    except InvalidImage as e:
+        return Response({'status': 'error', 'message': str(e)}, status=400)
+    except Exception as e:
+        print(f"Error handling profile picture: {str(e)}")
+        return Response({'status': 'error', 'message': 'Failed to update profile picture'}, status=400)
+    finally:
+        upload.close()
+
+    return Response({
+        'status': 'success',
+        'avatar': user.profile_picture.url,
+        'avatar_version': avatar_version(user.id),
+    })
+
+
 @require_POST
+@rate_limited('login')
 def login_view(request):
     try:
         data = json.loads(request.body)
@@ -223,48 +285,74 @@ def login_view(request):
         if not user:
             return JsonResponse({"status": "error", "message": "Invalid email or password."}, status=400)
 
-        if user.two_factor_enabled:
-            # Handle 2FA before issuing tokens
-            otp = str(random.randint(100000, 999999))
-            cache_key = f"otp_{user.id}"
-            cache.set(cache_key, otp, timeout=300)
-
-            send_mail(
-                "Your Login OTP",
-                f"Your OTP for login is: {otp}\nValid for 5 minutes.",
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=False,
-            )
+        return _complete_login(request, user)
 
-            return JsonResponse({
-                "status": "success",
-                "requires_2fa": True,
-                "message": "Please check your email for OTP"
-            })
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
-        # Normal login (no 2FA)
-        login(request, user)
+def _complete_login(request, user):
+    """Send the 2FA code, or log the user in and issue tokens"""
+    if user.two_factor_enabled:
+        # Handle 2FA before issuing tokens
+        otp = issue_otp(user.id)
+
+        # Delivered by the send_queued_email worker
+        queue_email(
+            "Your Login OTP",
+            f"Your OTP for login is: {otp}\nValid for 5 minutes.",
+            [user.email],
+            sensitive=True,
+        )
 
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
         return JsonResponse({
             "status": "success",
-            "requires_2fa": False,
-            "access_token": str(refresh.access_token),
-            "refresh_token": str(refresh),
-            "user": {  # Make sure to include user ID
-                "id": user.id,
-                "email": user.email,
-                "username": user.username,
-                "profile_picture": user.profile_picture.url if user.profile_picture else None,
-            }
+            "requires_2fa": True,
+            "message": "Please check your email for OTP"
         })
 
+    # Normal login (no 2FA)
+    login(request, user)
+
+    # Generate JWT tokens
+    refresh = tokens_for_user(user)
+    return JsonResponse({
+        "status": "success",
+        "requires_2fa": False,
+        "access_token": str(refresh.access_token),
+        "refresh_token": str(refresh),
+        "user": {  # Make sure to include user ID
+            "id": user.id,
+            "email": user.email,
+            "username": user.username,
+            "profile_picture": user.profile_picture.url if user.profile_picture else None,
+        }
+    })
+
+@rate_limited('login')
+async def async_login_view(request):
+    """login_view for ASGI: password verification runs in the hashing process pool"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        data = json.loads(request.body)
+        email = data.get("email")
+        password = data.get("password")
+
+        if not email or not password:
+            return JsonResponse({"status": "error", "message": "Email and password are required."}, status=400)
+
+        user = await aauthenticate(email, password)
+
+        if not user:
+            return JsonResponse({"status": "error", "message": "Invalid email or password."}, status=400)
+
+        return await sync_to_async(_complete_login)(request, user)
+
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
 @require_POST
+@rate_limited('verify_otp')
 def verify_otp(request):
     try:
         data = json.loads(request.body)
@@ -289,11 +377,8 @@ def verify_otp(request):
                 "message": "User not found"
             }, status=404)
 
-        cache_key = f"otp_{user.id}"
-        cached_otp = cache.get(cache_key)
-        print(f"Cached OTP: {cached_otp}, Received OTP: {otp}")  # Debug log
-
-        if cached_otp and cached_otp == otp:
+        # Single use: the code is deleted by whichever worker checks it first
+        if consume_otp(user.id, otp):
             # Login the user
             login(request, user)
             
@@ -301,9 +386,6 @@ def verify_otp(request):
             Token.objects.filter(user=user).delete()
             token = Token.objects.create(user=user)
 
-            # Clear the OTP
-            cache.delete(cache_key)
-
             return JsonResponse({
                 "status": "success",
                 "token": token.key,
@@ -333,6 +415,7 @@ def verify_otp(request):
         }, status=500)
 
 @ensure_csrf_cookie
+@rate_limited('register')
 def register_view(request):
     if request.method == 'GET':
         return JsonResponse({'status': 'ok'})  # Just for CSRF cookie
@@ -352,24 +435,9 @@ def register_view(request):
             
             print(f"Registration attempt - Data received: {data}")
         
-            # Validate all required fields
-            missing_fields = []
-            if not email: missing_fields.append('email')
-            if not password1: missing_fields.append('password')
-            if not password2: missing_fields.append('password confirmation')
-            if not username: missing_fields.append('username')
-            
-            if missing_fields:
-                return JsonResponse({
-                    'status': 'error',
-                    'message': f'Missing required fields: {", ".join(missing_fields)}'
-                }, status=400)
-            
-            if password1 != password2:
-                return JsonResponse({
-                    'status': 'error',
-                    'message': 'Passwords do not match'
-                }, status=400)
+            error = _registration_error(email, password1, password2, username)
+            if error:
+                return error
                 
             try:
                 user = User.objects.create_user(
@@ -386,15 +454,7 @@ def register_view(request):
                 request.session.save() # this is for the refresh login problem
                 print("User logged in successfully")
                 
-                return JsonResponse({
-                    'status': 'success',
-                    'message': 'Registration successful',
-                    'user': {
-                        'username': user.username,
-                        'email': user.email,
-                        'two_factor_enabled': user.two_factor_enabled
-                    }
-                })
+                return _registration_response(user)
                 
             except Exception as user_error:
                 print(f"Error creating user: {str(user_error)}")
@@ -418,8 +478,95 @@ def register_view(request):
 
     return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
 
+def _registration_error(email, password1, password2, username):
+    """400 response for an incomplete or mismatched registration, else None"""
+    # Validate all required fields
+    missing_fields = []
+    if not email: missing_fields.append('email')
+    if not password1: missing_fields.append('password')
+    if not password2: missing_fields.append('password confirmation')
+    if not username: missing_fields.append('username')
+
+    if missing_fields:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Missing required fields: {", ".join(missing_fields)}'
+        }, status=400)
+
+    if password1 != password2:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Passwords do not match'
+        }, status=400)
+    return None
+
+def _registration_response(user):
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Registration successful',
+        'user': {
+            'username': user.username,
+            'email': user.email,
+            'two_factor_enabled': user.two_factor_enabled
+        }
+    })
+
+@rate_limited('register')
+async def async_register_view(request):
+    """register_view for ASGI: the new password is hashed in the hashing process pool"""
+    if request.method == 'GET':
+        response = JsonResponse({'status': 'ok'})  # Just for CSRF cookie
+        get_csrf_token(request)  # Sets the cookie like ensure_csrf_cookie (sync-only in Django 4.2)
+        return response
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        email = data.get('email')
+        password1 = data.get('password1')
+        password2 = data.get('password2')
+        username = data.get('username')
+
+        error = _registration_error(email, password1, password2, username)
+        if error:
+            return error
+
+        try:
+            user = User(
+                username=username,
+                email=User.objects.normalize_email(email),
+                two_factor_enabled=data.get('enable_2fa', False)
+            )
+            user.password = await amake_password(password1)
+            await user.asave()
+
+            await sync_to_async(login)(request, user)
+            await sync_to_async(request.session.save)()
+            return _registration_response(user)
+
+        except Exception as user_error:
+            logger.error(f"Error creating user: {str(user_error)}")
+            return JsonResponse({
+                'status': 'error',
+                'message': f'User creation failed: {str(user_error)}'
+            }, status=500)
+
+    except json.JSONDecodeError as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Invalid JSON format: {str(e)}'
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Registration failed: {str(e)}'
+        }, status=500)
+
 @require_POST
 def logout_view(request):
+    if request.user.is_authenticated:
+        clear_presence(request.user.id)
     logout(request)
     return JsonResponse({'status': 'success'})
 
@@ -458,6 +605,7 @@ def redirect_uri(request):
                 f"?client_id={client_id}"
                 f"&redirect_uri={redirect_uri}"
                 f"&response_type=code"
+                f"&state={issue_oauth_state()}"
             )
             
             print("Generated OAuth link:", oauth_link)
@@ -478,30 +626,20 @@ def oauth_callback(request):
     if not code:
         return JsonResponse({"error": "Authorization code not provided"}, status=400)
 
-    try:
-        token_url = "https://api.intra.42.fr/oauth/token"
-        payload = {
-            "grant_type": "authorization_code",
-            "code": code,
-            "redirect_uri": "https://localhost:443/home",
-            "client_id": settings.FORTYTWO_CLIENT_ID,
-            "client_secret": settings.FORTYTWO_CLIENT_SECRET,
-        }
-        
-        response = requests.post(token_url, data=payload)
-        if response.status_code != 200:
-            return redirect("https://localhost:443/login")
-
-        access_token = response.json().get("access_token")
-
-        user_info_url = "https://api.intra.42.fr/v2/me"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        user_info_response = requests.get(user_info_url, headers=headers)
+    # Every link from redirect_uri carries a state; without one this could be a forged login
+    if not consume_oauth_state(request.GET.get("state")):
+        return redirect("https://localhost:443/login")
 
-        if user_info_response.status_code != 200:
+    try:
+        client = fortytwo.get_client()
+        try:
+            token_json = client.exchange_code(code, "https://localhost:443/home")
+            access_token = token_json.get("access_token")
+            user_info = client.get_me(access_token)
+        except fortytwo.FortyTwoError as e:
+            logger.warning(f"42 OAuth callback failed: {str(e)}")
             return redirect("https://localhost:443/login")
 
-        user_info = user_info_response.json()
         username = user_info.get("login")
         email = user_info.get("email")
 
@@ -511,29 +649,9 @@ def oauth_callback(request):
         )
 
         login(request, user)
+        schedule_intra_avatar(user.id, user_info)
 
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
-
-        response = redirect("https://localhost:443/home")
-        response.set_cookie(
-            'jwt_token',
-            str(refresh.access_token),
-            max_age=86400,
-            httponly=True,
-            samesite='Lax',
-            secure=True
-        )
-        response.set_cookie(
-            'refresh_token',
-            str(refresh),
-            max_age=604800,
-            httponly=True,
-            samesite='Lax',
-            secure=True
-        )
-
-        return response
+        return _oauth_login_redirect(user)
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -550,41 +668,26 @@ def get_token(request):
         if not code:
             return JsonResponse({'error': 'Authorization code is required'}, status=400)
 
+        if not consume_oauth_state(body_data.get('state')):
+            return JsonResponse({'error': 'Invalid or expired OAuth state'}, status=400)
+
         # Debugging: Print settings values to verify they're loaded
         print(f"FORTYTWO_CLIENT_ID: {settings.FORTYTWO_CLIENT_ID}")
         print(f"FORTYTWO_REDIRECT_URI: {settings.FORTYTWO_REDIRECT_URI}")
 
-        # Exchange code for access token with 42 API
-        token_url = 'https://api.intra.42.fr/oauth/token'
-        token_data = {
-            'grant_type': 'authorization_code',
-            'client_id': settings.FORTYTWO_CLIENT_ID,
-            'client_secret': settings.FORTYTWO_CLIENT_SECRET,
-            'code': code,
-            'redirect_uri': settings.FORTYTWO_REDIRECT_URI
-        }
-
-        token_response = requests.post(token_url, data=token_data)
-
-        if token_response.status_code != 200:
-            error_message = f"Token request failed with status {token_response.status_code}: {token_response.text}"
-            print(error_message)
-            return JsonResponse({'error': error_message}, status=401)
-
-        token_json = token_response.json()
-        access_token = token_json.get('access_token')
-
-        # Get user info from 42 API
-        user_url = 'https://api.intra.42.fr/v2/me'
-        headers = {'Authorization': f'Bearer {access_token}'}
-        user_response = requests.get(user_url, headers=headers)
-
-        if user_response.status_code != 200:
-            error_message = f"User data request failed with status {user_response.status_code}: {user_response.text}"
-            print(error_message)
-            return JsonResponse({'error': error_message}, status=401)
+        # Exchange code for access token and fetch the user's profile from the 42 API
+        client = fortytwo.get_client()
+        try:
+            token_json = client.exchange_code(code, settings.FORTYTWO_REDIRECT_URI)
+            access_token = token_json.get('access_token')
+            user_data = client.get_me(access_token)
+        except fortytwo.FortyTwoUnavailable as e:
+            print(str(e))
+            return JsonResponse({'error': '42 authentication is temporarily unavailable'}, status=503)
+        except fortytwo.FortyTwoAPIError as e:
+            print(str(e))
+            return JsonResponse({'error': str(e)}, status=401)
 
-        user_data = user_response.json()
         fortytwo_id = user_data.get('id')
         email = user_data.get('email')
         username = user_data.get('login')
@@ -605,27 +708,139 @@ def get_token(request):
 
         # Log the user in
         login(request, user)
+        schedule_intra_avatar(user.id, user_data)
 
-        # Generate JWT tokens using Simple JWT
-        refresh = RefreshToken.for_user(user)
-
-        # Return tokens and user data
-        return JsonResponse({
-            "status": "success",
-            "access_token": str(refresh.access_token),  # Use this in frontend requests
-            "refresh_token": str(refresh),  # Store this to refresh access tokens
-            "user": {
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,
-                "profile_picture": user.profile_picture.url if user.profile_picture else None,
-            }
-        })
+        return _token_login_response(user)
 
     except Exception as e:
         print(f"Error in get_token: {str(e)}")
         return JsonResponse({'error': f'Authentication failed: {str(e)}'}, status=500)
 
+# Async variants of the two OAuth views, for deployments served over ASGI.
+# Both 42 API round trips await on the event loop instead of holding a thread.
+# Django 4.2 has no alogin(), and the cache API is sync, so the session write
+# and the state check go through sync_to_async.
+
+async def async_oauth_callback(request):
+    error = request.GET.get('error')
+    if error:
+        return redirect("https://localhost:443/login")
+
+    code = request.GET.get("code")
+    if not code:
+        return JsonResponse({"error": "Authorization code not provided"}, status=400)
+
+    # Every link from redirect_uri carries a state; without one this could be a forged login
+    if not await sync_to_async(consume_oauth_state)(request.GET.get("state")):
+        return redirect("https://localhost:443/login")
+
+    try:
+        client = fortytwo.get_async_client()
+        try:
+            token_json = await client.exchange_code(code, "https://localhost:443/home")
+            user_info = await client.get_me(token_json.get("access_token"))
+        except fortytwo.FortyTwoError as e:
+            logger.warning(f"42 OAuth callback failed: {str(e)}")
+            return redirect("https://localhost:443/login")
+
+        user, created = await User.objects.aget_or_create(
+            email=user_info.get("email"),
+            defaults={'username': user_info.get("login"), 'is_42_user': True, 'intra_id': user_info.get('id')}
+        )
+
+        await sync_to_async(login)(request, user)
+        await sync_to_async(schedule_intra_avatar)(user.id, user_info)
+
+        return _oauth_login_redirect(user)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+async def async_get_token(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        body_data = json.loads(request.body.decode('utf-8'))
+        code = body_data.get('code')
+
+        if not code:
+            return JsonResponse({'error': 'Authorization code is required'}, status=400)
+
+        if not await sync_to_async(consume_oauth_state)(body_data.get('state')):
+            return JsonResponse({'error': 'Invalid or expired OAuth state'}, status=400)
+
+        client = fortytwo.get_async_client()
+        try:
+            token_json = await client.exchange_code(code, settings.FORTYTWO_REDIRECT_URI)
+            user_data = await client.get_me(token_json.get('access_token'))
+        except fortytwo.FortyTwoUnavailable as e:
+            logger.warning(str(e))
+            return JsonResponse({'error': '42 authentication is temporarily unavailable'}, status=503)
+        except fortytwo.FortyTwoAPIError as e:
+            logger.warning(str(e))
+            return JsonResponse({'error': str(e)}, status=401)
+
+        user, created = await User.objects.aget_or_create(
+            email=user_data.get('email'),
+            defaults={'username': user_data.get('login'), 'is_42_user': True, 'intra_id': user_data.get('id')}
+        )
+
+        await sync_to_async(login)(request, user)
+        await sync_to_async(schedule_intra_avatar)(user.id, user_data)
+
+        return _token_login_response(user)
+
+    except Exception as e:
+        logger.error(f"Error in async_get_token: {str(e)}")
+        return JsonResponse({'error': f'Authentication failed: {str(e)}'}, status=500)
+
+# Django 4.2's csrf_exempt wraps views in a sync function, so mark these directly
+async_oauth_callback.csrf_exempt = True
+async_get_token.csrf_exempt = True
+
+def _oauth_login_redirect(user):
+    """Redirect home with the JWT pair in cookies (OAuth callback flow)"""
+    # Generate JWT tokens
+    refresh = tokens_for_user(user)
+
+    response = redirect("https://localhost:443/home")
+    response.set_cookie(
+        'jwt_token',
+        str(refresh.access_token),
+        max_age=86400,
+        httponly=True,
+        samesite='Lax',
+        secure=True
+    )
+    response.set_cookie(
+        'refresh_token',
+        str(refresh),
+        max_age=604800,
+        httponly=True,
+        samesite='Lax',
+        secure=True
+    )
+
+    return response
+
+def _token_login_response(user):
+    """JSON body with the JWT pair and user data (get-token flow)"""
+    # Generate JWT tokens using Simple JWT
+    refresh = tokens_for_user(user)
+
+    # Return tokens and user data
+    return JsonResponse({
+        "status": "success",
+        "access_token": str(refresh.access_token),  # Use this in frontend requests
+        "refresh_token": str(refresh),  # Store this to refresh access tokens
+        "user": {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "profile_picture": user.profile_picture.url if user.profile_picture else None,
+        }
+    })
+
 
 @api_view(['POST'])
 def verify_otp_view(request):
@@ -637,11 +852,9 @@ def verify_otp_view(request):
 
     try:
         user = User.objects.get(username=username)
-        cache_key = f"otp_{user.id}"
-        cached_otp = cache.get(cache_key)
 
-        if cached_otp == otp:
-            refresh = RefreshToken.for_user(user)
+        if consume_otp(user.id, otp):
+            refresh = tokens_for_user(user)
             return Response({
                 "message": "OTP verified successfully.",
                 "access_token": str(refresh.access_token),
@@ -701,12 +914,49 @@ def user_settings_view(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def match_history_view(request):
-    """Get user's match history"""
+    """Get user's match history, one page at a time.
+
+    Pages are addressed by an opaque ?cursor= over (date_played, id), newest
+    first, so every page is an index seek no matter how deep into the history
+    it is.
+    Optional ?game_type= and ?result= narrow the listing.
+    """
     user = request.user
-    matches = MatchHistory.objects.filter(user=user).order_by('-date_played')[:10]  # Limit to 10 most recent
+    try:
+        limit = min(int(request.GET.get('limit', MATCH_HISTORY_PAGE_SIZE)), MATCH_HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({'status': 'error', 'message': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1:
+        return Response({'status': 'error', 'message': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+    matches = MatchHistory.objects.filter(user=user)
+
+    game_type = request.GET.get('game_type')
+    if game_type:
+        matches = matches.filter(game_type=game_type.upper())
+    result = request.GET.get('result')
+    if result:
+        matches = matches.filter(result=result.upper())
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            date_played, last_id = decode_cursor(cursor)
+        except ValueError:
+            return Response({'status': 'error', 'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        # (date_played, id) < (cursor): the <= is a range bound on the index,
+        # so the OR only ever filters rows tied on the cursor's own timestamp
+        matches = matches.filter(
+            Q(date_played__lte=date_played),
+            Q(date_played__lt=date_played) | Q(id__lt=last_id),
+        )
+
+    page = list(matches.order_by('-date_played', '-id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
     
     match_data = []
-    for match in matches:
+    for match in page:
         match_data.append({
             'id': match.id,
             'game_type': match.game_type,
@@ -717,7 +967,8 @@ def match_history_view(request):
         })
     
     return Response({
-        'match_history': match_data
+        'match_history': match_data,
+        'next_cursor': encode_cursor(page[-1].date_played, page[-1].id) if has_more else None
     })
 
 @csrf_exempt
@@ -744,14 +995,21 @@ def save_match_view(request):
                     'message': f'Missing required field: {field}'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Save the match
-        match = MatchHistory.objects.create(
-            user=user,
-            game_type=data['game_type'],
-            opponent=data['opponent'],
-            result=data['result'],
-            score=data['score']
-        )
+        # Numeric columns stay null for scores that aren't "x-y"
+        user_score, opponent_score = parse_score(str(data['score'])) or (None, None)
+
+        # Save the match and fold it into the user's stats in one transaction
+        with transaction.atomic():
+            match = MatchHistory.objects.create(
+                user=user,
+                game_type=data['game_type'],
+                opponent=data['opponent'],
+                result=data['result'],
+                score=data['score'],
+                user_score=user_score,
+                opponent_score=opponent_score
+            )
+            UserStats.record_match(match)
 
         print(f"Match {match.id} saved successfully!")
         return Response({'status': 'success', 'match_id': match.id})
@@ -796,40 +1054,81 @@ def delete_account(request):
     except Exception as e:
         return Response({'status': 'error', 'message': str(e)}, status=400)
 
+def _avatar_body(user_id, meta, size, fmt):
+    """Response carrying the image itself; raises FileNotFoundError if the upload vanished"""
+    if meta['name'] is None:
+        data, content_type = default_avatar(size, fmt)
+        return HttpResponse(data, content_type=content_type)
+
+    if size is not None:
+        name = get_thumbnail(meta['hash'], meta['name'], size, fmt)
+        return send_file(name, AVATAR_FORMATS[fmt][1])
+
+    # Determine content type based on file extension
+    content_type = 'image/jpeg'  # Default
+    if meta['name'].lower().endswith('.png'):
+        content_type = 'image/png'
+    elif meta['name'].lower().endswith('.gif'):
+        content_type = 'image/gif'
+    return send_file(meta['name'], content_type)
+
+
 # Clean up get_avatar_image view function by removing unnecessary debug logs
 @api_view(['GET'])
+@renderer_classes([JSONRenderer, ImageRenderer])
 def get_avatar_image(request, user_id):
-    """Serve user avatar directly"""
+    """Serve user avatar directly.
+
+    With ?size=N the smallest thumbnail covering N pixels is served, as WebP
+    when the client accepts it and JPEG otherwise; without it, the original.
+    Responses carry an ETag derived from the image's SHA-256 and a
+    Last-Modified date, and revalidations are answered with 304 from cached
+    metadata alone. URLs whose ?v= matches the current avatar_version are
+    cached for a year as immutable.
+    """
     try:
+        size = fmt = None
+        if 'size' in request.GET:
+            try:
+                size = pick_size(int(request.GET['size']))
+            except ValueError:
+                return Response({"error": "size must be an integer"}, status=400)
+            fmt = negotiate_format(request.headers.get('Accept'))
+
         try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
+            meta = avatar_meta(user_id)
+        except FileNotFoundError:
+            return Response({"error": "Avatar not found"}, status=404)
+        if meta is None:
             return Response({"error": "User not found"}, status=404)
-        
-        if user.profile_picture:
-            # Get the actual file path
-            file_path = user.profile_picture.path
-            
-            # Check if file exists
-            if os.path.exists(file_path):
-                # Determine content type based on file extension
-                content_type = 'image/jpeg'  # Default
-                if file_path.lower().endswith('.png'):
-                    content_type = 'image/png'
-                elif file_path.lower().endswith('.gif'):
-                    content_type = 'image/gif'
-                
-                # Use Django's FileResponse for better performance
-                return FileResponse(open(file_path, 'rb'), content_type=content_type)
-        
-        # Return default avatar if no custom avatar or file not found
-        default_avatar_path = os.path.join(settings.BASE_DIR, 'static', 'frontend', 'assets', 'man.png')
-        
-        if os.path.exists(default_avatar_path):
-            return FileResponse(open(default_avatar_path, 'rb'), content_type='image/png')
+
+        version = meta['hash'][:VERSION_LENGTH]
+        etag = f'"{version}-{size}.{fmt}"' if size is not None else f'"{version}"'
+        response = get_conditional_response(request, etag=etag, last_modified=meta['modified'])
+        if response is None:
+            try:
+                response = _avatar_body(user_id, meta, size, fmt)
+            except FileNotFoundError:
+                # Upload deleted behind our back: fall back to the default avatar
+                forget_avatar_meta(user_id)
+                try:
+                    response = _avatar_body(user_id, avatar_meta(user_id), size, fmt)
+                except FileNotFoundError:
+                    return Response({"error": "Avatar not found"}, status=404)
+                response['Cache-Control'] = 'no-cache'
+                return response
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(meta['modified'])
+        if request.GET.get('v') == version:
+            # The URL names this exact image; a new upload changes the URL
+            response['Cache-Control'] = 'public, max-age=31536000, immutable'
         else:
-            return Response({"error": "Avatar not found"}, status=404)
-        
+            response['Cache-Control'] = 'public, no-cache'
+        if size is not None:
+            patch_vary_headers(response, ('Accept',))
+        return response
+
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -869,88 +1168,151 @@ def debug_avatar_path(request, user_id):
 # Add the user data export view
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, NDJSONRenderer, CSVRenderer])
 def export_user_data(request):
-    """Export all user data in a structured format"""
+    """Export all user data, streamed as it is read from the database.
+
+    ?format=json (default) returns the full export document, ?format=ndjson
+    and ?format=csv return the match history only, one match per line. The
+    renderers make DRF pick the format (from ?format= or Accept) before the
+    view runs, so any other ?format= is a 404.
+    """
     try:
-        user = request.user
-        
-        # Get user's match history
-        match_history = MatchHistory.objects.filter(user=user).order_by('-date_played')
-        
-        # Calculate statistics
-        total_matches = match_history.count()
-        wins = match_history.filter(result='WIN').count()
-        losses = match_history.filter(result='LOSS').count()
-        draws = match_history.filter(result='DRAW').count()
-        win_rate = int((wins / total_matches) * 100) if total_matches > 0 else 0
-        
-        # Format match history for response
-        matches = []
-        for match in match_history:
-            matches.append({
-                'id': match.id,
-                'game_type': match.game_type,
-                'opponent': match.opponent,
-                'score': match.score,
-                'result': match.result,
-                'date_played': match.date_played.isoformat(),
-            })
-        
-        # Build comprehensive user data
-        user_data = {
-            'user_information': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'display_name': user.display_name if hasattr(user, 'display_name') else user.username,
-                'date_joined': user.date_joined.isoformat(),
-                'last_login': user.last_login.isoformat() if user.last_login else None,
-                'is_42_user': user.is_42_user if hasattr(user, 'is_42_user') else False,
-            },
-            'profile': {
-                'avatar_url': user.profile_picture.url if user.profile_picture else None,
-            },
-            'statistics': {
-                'games_played': total_matches,
-                'wins': wins,
-                'losses': losses,
-                'draws': draws,
-                'win_rate': f"{win_rate}%",
-            },
-            'match_history': matches,
-            'export_date': datetime.datetime.now().isoformat(),
-        }
-        
-        return Response(user_data)
+        export_format = request.accepted_renderer.format
+        generator, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(generator(request.user), content_type=content_type)
+        if export_format != 'json':
+            filename = f"match_history_{request.user.username}.{export_format}"
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
         
     except Exception as e:
         return Response({
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _export_job_data(job):
+    data = {
+        'job_id': str(job.id),
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'status_url': f'/api/auth/export-data/jobs/{job.id}/',
+    }
+    if job.status == ExportJob.DONE:
+        data['download_url'] = f'/api/auth/export-data/jobs/{job.id}/download/'
+        data['size'] = job.archive_size
+        data['expires_at'] = job.expires_at.isoformat() if job.expires_at else None
+    elif job.status == ExportJob.FAILED:
+        data['error'] = job.error
+    return data
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_export_job(request):
+    """Queue a background export archive; the run_export_jobs worker builds it"""
+    try:
+        job = ExportJob.objects.filter(
+            user=request.user, status__in=[ExportJob.PENDING, ExportJob.RUNNING]
+        ).first()
+        if job is None:
+            job = ExportJob.objects.create(user=request.user)
+        return Response(_export_job_data(job), status=status.HTTP_202_ACCEPTED)
+    except Exception as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@authentication_classes(CLAIMS_AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+def export_job_status(request, job_id):
+    try:
+        job = ExportJob.objects.get(id=job_id, user_id=request.user.id)
+    except ExportJob.DoesNotExist:
+        return Response({'error': 'Export job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(_export_job_data(job))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def download_export_job(request, job_id):
+    """Serve a finished export archive from EXPORT_ROOT"""
+    try:
+        job = ExportJob.objects.get(id=job_id, user=request.user)
+    except ExportJob.DoesNotExist:
+        return Response({'error': 'Export job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if job.status != ExportJob.DONE:
+        return Response(_export_job_data(job), status=status.HTTP_409_CONFLICT)
+
+    archive_path = os.path.join(settings.EXPORT_ROOT, job.archive_name)
+    if not os.path.exists(archive_path):
+        return Response({'error': 'Export archive has expired'}, status=status.HTTP_410_GONE)
+
+    filename = f"user_data_{request.user.username}_{job.finished_at.date().isoformat()}.tar.gz"
+    return FileResponse(open(archive_path, 'rb'), as_attachment=True, filename=filename,
+                        content_type='application/gzip')
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_all_users(request):
-    """Get list of all users except the current user"""
+    """List users other than the current one, a page at a time.
+
+    ?q= matches a case-insensitive prefix of username or display_name.
+    Pages are ordered by username and continued with ?cursor=.
+    """
     try:
+        try:
+            limit = min(int(request.GET.get('limit', USER_DIRECTORY_PAGE_SIZE)), USER_DIRECTORY_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'status': 'error', 'message': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'status': 'error', 'message': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
         # Exclude current user and maybe some system users
         users = User.objects.exclude(id=request.user.id).exclude(is_superuser=True)
+
+        query = request.GET.get('q', '').strip()
+        if query:
+            users = users.filter(Q(username__istartswith=query) | Q(display_name__istartswith=query))
+
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                last_username = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            except ValueError:
+                return Response({'status': 'error', 'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            users = users.filter(username__gt=last_username)
+
+        page = list(
+            users.order_by('username')
+            .values('id', 'username', 'display_name', 'profile_picture')[:limit + 1]
+        )
+        has_more = len(page) > limit
+        page = page[:limit]
         
-        # Check which users are friends with the current user
-        user_friends_ids = request.user.friends.values_list('id', flat=True)
+        # Check which users on this page are friends with the current user, in one query
+        user_friends_ids = set(
+            request.user.friends.filter(id__in=[user['id'] for user in page]).values_list('id', flat=True)
+        )
         
         users_data = []
-        for user in users:
+        for user in page:
             users_data.append({
-                'id': user.id,
-                'username': user.username,
-                'display_name': user.display_name if hasattr(user, 'display_name') else user.username,
-                'avatar': user.profile_picture.url if user.profile_picture else None,
-                'is_friend': user.id in user_friends_ids
+                'id': user['id'],
+                'username': user['username'],
+                'display_name': user['display_name'] or user['username'],
+                'avatar': default_storage.url(user['profile_picture']) if user['profile_picture'] else None,
+                'is_friend': user['id'] in user_friends_ids
             })
+
+        next_cursor = None
+        if has_more:
+            next_cursor = base64.urlsafe_b64encode(page[-1]['username'].encode()).decode().rstrip('=')
         
         return Response({
-            'users': users_data
+            'users': users_data,
+            'next_cursor': next_cursor
         })
     except Exception as e:
         return Response({
@@ -958,19 +1320,68 @@ def get_all_users(request):
             'message': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@authentication_classes(CLAIMS_AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+def get_profile_cards(request):
+    """Compact cards for the users in ?ids=1,2,3, in that order.
+
+    One query for all of them. Each avatar URL points at a ?size= thumbnail
+    (default 64px) and carries the image version, so browsers and CDNs can
+    cache it indefinitely and fetch them in parallel.
+    """
+    try:
+        ids = [int(user_id) for user_id in request.GET.get('ids', '').split(',') if user_id.strip()]
+        size = pick_size(int(request.GET.get('size', 64)))
+    except ValueError:
+        return Response({'status': 'error', 'message': 'ids and size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > PROFILE_CARDS_MAX_IDS:
+        return Response({
+            'status': 'error',
+            'message': f'At most {PROFILE_CARDS_MAX_IDS} ids per request'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        rows = {
+            row['id']: row for row in User.objects.filter(id__in=ids)
+            .values('id', 'username', 'display_name', 'profile_picture', 'avatar_hash')
+        }
+        presence = get_presence_many(rows)
+        cards = []
+        for user_id in dict.fromkeys(ids):
+            row = rows.get(user_id)
+            if row is None:
+                continue
+            cards.append({
+                'id': user_id,
+                'username': row['username'],
+                'display_name': row['display_name'] or row['username'],
+                'avatar': avatar_url(user_id, size, row['profile_picture'], row['avatar_hash']),
+                'online': presence[user_id]['status'] != OFFLINE,
+            })
+        return Response({'status': 'success', 'cards': cards})
+    except Exception as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_friends(request):
-    """Get list of user's friends"""
+    """Get list of user's friends with their online status"""
     try:
-        friends = request.user.friends.all()
+        friends = list(request.user.friends.values('id', 'username', 'display_name'))
+        presence = get_presence_many(friend['id'] for friend in friends)
         friends_data = []
         
         for friend in friends:
             friends_data.append({
-                'id': friend.id,
-                'username': friend.username,
-                'display_name': friend.display_name if hasattr(friend, 'display_name') else friend.username,
+                'id': friend['id'],
+                'username': friend['username'],
+                'display_name': friend['display_name'] or friend['username'],
+                'status': presence[friend['id']]['status'],
+                'last_seen': presence[friend['id']]['last_seen'],
                 # 'avatar': friend.profile_picture.url if friend.profile_picture else None
             })
         
@@ -1043,4 +1454,117 @@ def remove_friend(request, user_id):
         return Response({
             'status': 'error',
             'message': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_update_friends(request):
+    """Add and remove many friends in one transaction.
+
+    Body: {"add": [user_id, ...], "remove": [user_id, ...]}
+    """
+    try:
+        add_ids = request.data.get('add', [])
+        remove_ids = request.data.get('remove', [])
+        if not isinstance(add_ids, list) or not isinstance(remove_ids, list):
+            return Response({
+                'status': 'error',
+                'message': 'add and remove must be lists of user ids'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(add_ids) + len(remove_ids) > FRIENDS_BULK_MAX_IDS:
+            return Response({
+                'status': 'error',
+                'message': f'At most {FRIENDS_BULK_MAX_IDS} user ids per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            add_ids = [int(user_id) for user_id in add_ids]
+            remove_ids = [int(user_id) for user_id in remove_ids]
+        except (TypeError, ValueError):
+            return Response({
+                'status': 'error',
+                'message': 'User ids must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        with transaction.atomic():
+            removed = user.remove_friends(remove_ids)
+            added = user.add_friends(add_ids)
+
+        return Response({
+            'status': 'success',
+            'added': added,
+            'removed': removed,
+            'ignored': sorted((set(add_ids) - set(added)) | (set(remove_ids) - set(removed)))
+        })
+    except Exception as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@authentication_classes(CLAIMS_AUTHENTICATION_CLASSES)
+@permission_classes([IsAuthenticated])
+def friend_suggestions(request):
+    """People you may know, ranked by number of mutual friends"""
+    try:
+        try:
+            limit = min(int(request.GET.get('limit', 10)), SUGGESTIONS_MAX)
+        except ValueError:
+            return Response({'status': 'error', 'message': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'suggestions': get_friend_suggestions(request.user.id, max(limit, 0))
+        })
+    except Exception as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def presence_heartbeat(request):
+    """Mark the caller online (or in_game) for the next PRESENCE_TTL seconds.
+
+    Authenticates from the JWT claims alone, so the request never reads the
+    user row and only writes to the cache.
+    """
+    presence_status = request.data.get('status', ONLINE)
+    try:
+        record_heartbeat(request.user.id, presence_status)
+    except ValueError as e:
+        return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'status': 'success',
+        'presence': presence_status,
+        'next_heartbeat': getattr(settings, 'PRESENCE_HEARTBEAT_INTERVAL', 20)
+    })
+
+@api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def presence_lookup(request):
+    """Batched presence lookup: ?ids=1,2,3
+
+    Only the caller's own friends (and the caller) are answered, as in the
+    friends list; other ids are left out of the response.
+    """
+    try:
+        user_ids = [int(user_id) for user_id in request.GET.get('ids', '').split(',') if user_id]
+    except ValueError:
+        return Response({'status': 'error', 'message': 'ids must be a comma-separated list of integers'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if len(user_ids) > PRESENCE_LOOKUP_MAX_IDS:
+        return Response({'status': 'error', 'message': f'At most {PRESENCE_LOOKUP_MAX_IDS} ids per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    # One lookup on the friends table's (from_user, to_user) index
+    visible = set(
+        User.friends.through.objects
+        .filter(from_user_id=request.user.id, to_user_id__in=user_ids)
+        .values_list('to_user_id', flat=True)
+    )
+    visible.add(request.user.id)
+    presence = get_presence_many([user_id for user_id in user_ids if user_id in visible])
+    return Response({
+        'presence': {str(user_id): entry for user_id, entry in presence.items()}
+    })